@@ -87,7 +87,7 @@ def main():
                       tau_dict=tau_params, save_tensors=True, write_to_file=False)
 
     # Average the diagonal componenets of sigma
-    sigma = np.sum([sig for sig in np.diag(arrays['sigma'][:,:,0])])/3
+    sigma = np.sum([sig for sig in np.diag(arrays['sigma'][0,:,:,0])])/3
     rho.append(1e2/sigma)
 
   # Write the sigmas
@@ -25,7 +25,7 @@ class DataController:
 
   error_handler = report_exception = None
 
-  def __init__ ( self, workpath, outputdir, inputfile, model, savedir, npool, smearing, acbn0, verbose, restart, dft ):
+  def __init__ ( self, workpath, outputdir, inputfile, model, savedir, npool, smearing, acbn0, verbose, restart, dft, parse_cache=False, hamiltonian=None ):
     '''
     Initialize the DataController
     Arguments:
@@ -39,6 +39,9 @@ class DataController:
         smearing (str): Smearing type (None, m-p, gauss)
         verbose (bool): False supresses debugging output
         restart (bool): True if the run is being restarted from a .json data dump.
+        dft (str): 'QE' or 'VASP'
+        parse_cache (bool): If True the parsed DFT output is stored in, and reloaded from, a binary cache in the save directory
+        hamiltonian (str): Path of a Hamiltonian store written by pao_hamiltonian, used instead of the DFT output
     Returns:
         None
     '''
@@ -54,6 +57,9 @@ class DataController:
     if model is not None:
       if (inputfile is not None or savedir is not None) and self.rank == 0:
         print('\nWARNING: Model specified in addition to inputfile or savedir. Model will be used.')
+    elif hamiltonian is not None:
+      if (inputfile is not None or savedir is not None) and self.rank == 0:
+        print('\nWARNING: Hamiltonian store specified in addition to inputfile or savedir. The store will be used.')
     elif not restart and inputfile is None and savedir is None:
       if self.rank == 0:
         print('\nERROR: Must specify \'.save\' directory path, either in PAOFLOW constructor or in an inputfile.')
@@ -73,9 +79,10 @@ class DataController:
       attr['verbose'] = verbose
       attr['workpath'] = workpath
       attr['acbn0'] = acbn0
+      attr['parse_cache'] = parse_cache
       attr['inputfile'],attr['outputdir'] = inputfile,outputdir
       attr['opath'] = join(workpath, outputdir)
-      if model is None:
+      if model is None and hamiltonian is None:
         attr['fpath'] = join(workpath, (savedir if inputfile==None else inputfile))
 
       if inputfile == None:
@@ -94,6 +101,9 @@ class DataController:
       if model is not None:
         from .defs.models import build_TB_model
         build_TB_model(self, model)
+      elif hamiltonian is not None:
+        from .defs.pao_store import read_pao_store
+        read_pao_store(self, join(workpath,hamiltonian))
       else:
         try:
           if inputfile != None:
@@ -169,6 +179,32 @@ class DataController:
     # Hubbard Parameters
     self.data_arrays['HubbardU'] = np.zeros(1, dtype=float)
 
+    # Number of k-points diagonalized per batched eigh call
+    self.data_attributes['eigh_chunk'] = 256
+    # Skip eigenvectors in pao_eigh
+    self.data_attributes['eigvals_only'] = False
+    # Partial diagonalization in pao_eigh: number of lowest bands, or the top of the energy window
+    self.data_attributes['eigh_nbnd'] = None
+    self.data_attributes['eigh_emax'] = None
+    # Eigenvalues and momenta on the irreducible wedge only
+    self.data_attributes['ibz'] = False
+
+    # Out of core storage for 'Hksp', 'dHksp' and 'pksp'
+    self.data_attributes['out_of_core'] = False
+    # Number of k-points read per chunk from the k-distributed arrays
+    self.data_attributes['k_chunk'] = 256
+    # Number of energies per chunk in the Boltzmann transport kernel
+    self.data_attributes['e_chunk'] = 64
+    # Size in bytes of each (transition,energy) block of the Hall and dielectric kernels
+    self.data_attributes['e_chunk_bytes'] = 1<<26
+
+    # Real space blocks of HRs not larger than hr_thresh are dropped for arbitrary k evaluation
+    self.data_attributes['hr_thresh'] = 1.e-10
+    # Distribute each real space block over its Wigner-Seitz images
+    self.data_attributes['hr_wigner_seitz'] = False
+    # Size in bytes of the cache of phase factors reused by bands, topology and Berry phase on the same k-points
+    self.data_attributes['phase_cache_bytes'] = 1<<28
+
     # Tensor components
     # Dielectric function
     self.data_arrays['d_tensor'] = np.array([[0,0],[0,1],[0,2],[1,0],[1,1],[1,2],[2,0],[2,1],[2,2]])
@@ -187,25 +223,30 @@ class DataController:
     read_inputfile_xml(self.data_attributes['workpath'], self.data_attributes['inputfile'], self)
 
   def read_qe_output ( self ):
-    from os.path import exists
+    from os.path import exists,join
+    from .defs.parse_cache import cached_parse
     fpath = self.data_attributes['fpath']
 
     if exists(fpath+'/data-file-schema.xml'):
       from .defs.read_QE_xml import parse_qe_data_file_schema
-      parse_qe_data_file_schema(self, fpath+'/data-file-schema.xml')
+      cached_parse(self, join(fpath,'paoflow_data.cache'), [fpath+'/data-file-schema.xml'],
+                   lambda : parse_qe_data_file_schema(self, fpath+'/data-file-schema.xml'))
     elif exists(fpath+'/data-file.xml'):
       from .defs.read_QE_xml import parse_qe_data_file
-      parse_qe_data_file(self, fpath, 'data-file.xml')
+      cached_parse(self, join(fpath,'paoflow_data.cache'), [fpath+'/data-file.xml'],
+                   lambda : parse_qe_data_file(self, fpath, 'data-file.xml'))
     else:
       raise Exception('data-file.xml or data-file-schema.xml were not found.\n')
 
   def read_vasp_output ( self, symprec ):
-    from os.path import exists
+    from os.path import exists,join
+    from .defs.parse_cache import cached_parse
     fpath = self.data_attributes['fpath']
 
     if exists(fpath+'/vasprun.xml'):
       from .defs.read_VASP import parse_vasprun_data
-      parse_vasprun_data(self, fpath+'/vasprun.xml', symprec)
+      cached_parse(self, join(fpath,'paoflow_data.cache'), [fpath+'/vasprun.xml'],
+                   lambda : parse_vasprun_data(self, fpath+'/vasprun.xml', symprec), extra=(symprec,))
     else:
       raise Exception('vasprun.xml was not found.\n')
 
@@ -436,10 +477,11 @@ class DataController:
         import numpy as np
         from os.path import join
         from .defs.zero_pad import zero_pad
+        from .defs.fft_backend import ifftn
 
         arry,attr = self.data_dicts()
 
-        HRS=np.fft.ifftn(arry["Hks"],axes=(2,3,4))
+        HRS=ifftn(arry["Hks"],axes=(2,3,4))
 
         nawf,_,nk1,nk2,nk3,nspin=HRS.shape
         # how to pad HR to make sure it's odd for z2pack
@@ -520,6 +562,113 @@ class DataController:
 
 
 
+  def allocate_array ( self, key, shape, dtype=complex ):
+    '''
+    Allocate a zero initialized array in 'data_arrays' with 'key'
+    When the 'out_of_core' attribute is set the array is a np.memmap in this rank's scratch directory
+
+    Arguments:
+        key (str): The key for the new array
+        shape (tuple): Shape of the array on this rank
+        dtype (dtype): The data type of the array
+
+    Returns:
+        The allocated array
+    '''
+    import numpy as np
+
+    self.delete_array(key)
+
+    attr = self.data_attributes
+    if attr['out_of_core']:
+      from os.path import join
+      fname = join(attr['ooc_path'], '%s_%d.dat'%(key,self.rank))
+      self.data_arrays[key] = np.memmap(fname, dtype=dtype, mode='w+', shape=shape)
+    else:
+      self.data_arrays[key] = np.zeros(shape, dtype=dtype)
+
+    return self.data_arrays[key]
+
+
+  def delete_array ( self, key ):
+    '''
+    Remove 'key' from 'data_arrays', deleting its scratch file if it was stored out of core
+
+    Arguments:
+        key (str): The key for the array to delete
+
+    Returns:
+        None
+    '''
+    import numpy as np
+    from os import remove
+    from os.path import exists
+
+    if key in self.data_arrays:
+      arr = self.data_arrays.pop(key)
+      if isinstance(arr, np.memmap) and arr.filename is not None:
+        fname = arr.filename
+        arr = None
+        if exists(fname):
+          remove(fname)
+
+
+  def make_ooc_path ( self, scratchdir ):
+    '''
+    Create this rank's scratch directory for out of core arrays under 'scratchdir', stored in 'ooc_path'
+    The directory is removed by remove_ooc_path, or when the DataController is collected or the interpreter exits
+
+    Arguments:
+        scratchdir (str): Directory in which to create the scratch directory
+
+    Returns:
+        The path of the scratch directory
+    '''
+    from os import makedirs
+    from shutil import rmtree
+    from weakref import finalize
+    from tempfile import mkdtemp
+
+    self.remove_ooc_path()
+    makedirs(scratchdir, exist_ok=True)
+    path = mkdtemp(prefix='paoflow_%d_'%self.rank, dir=scratchdir)
+    self.data_attributes['ooc_path'] = path
+    self.ooc_cleanup = finalize(self, rmtree, path, ignore_errors=True)
+
+    return path
+
+
+  def remove_ooc_path ( self ):
+    '''
+    Remove this rank's scratch directory for out of core arrays, if it was created
+
+    Arguments:
+        None
+
+    Returns:
+        None
+    '''
+    cleanup = getattr(self, 'ooc_cleanup', None)
+    if cleanup is not None:
+      cleanup()
+      self.ooc_cleanup = None
+
+
+  def k_chunks ( self, nk ):
+    '''
+    Generate slices covering 'nk' k-points, 'k_chunk' at a time
+
+    Arguments:
+        nk (int): Number of k-points on this rank
+
+    Returns:
+        Generator of slice objects
+    '''
+    chunk = max(1, int(self.data_attributes['k_chunk']))
+    for ik in range(0, nk, chunk):
+      yield slice(ik, min(ik+chunk,nk))
+
+
   def broadcast_single_array ( self, key, dtype=complex, root=0 ):
     '''
     Broadcast array from 'data_arrays' with 'key' from 'root' to all other ranks
@@ -50,7 +50,7 @@ class PAOFLOW:
 
 
 
-  def __init__ ( self, workpath='./', outputdir='output', inputfile=None, savedir=None, model=None, npool=1, smearing='gauss', acbn0=False, verbose=False, restart=False, dft='QE'):
+  def __init__ ( self, workpath='./', outputdir='output', inputfile=None, savedir=None, model=None, npool=1, smearing='gauss', acbn0=False, verbose=False, restart=False, dft='QE', out_of_core=False, scratchdir=None, fft_backend='scipy', fft_threads=None, parse_cache=False, hamiltonian=None ):
     '''
     Initialize the PAOFLOW class, either with a save directory with required QE output or with an xml inputfile
     Arguments:
@@ -65,6 +65,12 @@ class PAOFLOW:
         verbose (bool): False supresses debugging output
         restart (bool): True if the run is being restarted from a .json data dump.
         dft (str): 'QE' or 'VASP'
+        out_of_core (bool): If True 'Hksp', 'dHksp' and 'pksp' are stored in per-rank memory-mapped files instead of RAM
+        scratchdir (str): Directory for the out of core files, preferably on node-local disk (default is the system temporary directory)
+        fft_backend (str): Library performing the FFTs, 'scipy', 'numpy', 'pyfftw' or 'cuda'
+        fft_threads (int): Threads used by each FFT (default is an even share of the node's cores for each rank, also in restarted runs)
+        parse_cache (bool): If True data parsed from the DFT output (data file, atomic_proj.xml and pseudopotentials) is cached in a binary file in the save directory and memory-mapped on later runs with unchanged inputs
+        hamiltonian (str): Path, relative to workpath, of a Hamiltonian store written by pao_hamiltonian. The run starts from the stored HRs, skipping the DFT output, projections and pao_hamiltonian
     Returns:
         None
     '''
@@ -72,6 +78,7 @@ class PAOFLOW:
     from mpi4py import MPI
     from .defs.header import header
     from .DataController import DataController
+    from .defs.fft_backend import default_threads,set_fft_backend
 
     #-------------------------------
     # Initialize Parallel Execution
@@ -89,25 +96,39 @@ class PAOFLOW:
       self.start_time = self.reset_time = time()
 
     # Initialize Data Controller
-    self.data_controller = DataController(workpath, outputdir, inputfile, model, savedir, npool, smearing, acbn0, verbose, restart, dft)
+    self.data_controller = DataController(workpath, outputdir, inputfile, model, savedir, npool, smearing, acbn0, verbose, restart, dft, parse_cache, hamiltonian)
 
     self.report_exception = self.data_controller.report_exception
 
+    # Data Attributes
+    attr = self.data_controller.data_attributes
+
     if not restart:
-      # Data Attributes
-      attr = self.data_controller.data_attributes
-
-      # Check for CUDA FFT Libraries
-      ## CUDA not yet supported in PAOFLOW_CLASS
-      attr['use_cuda'] = False
-      attr['scipyfft'] = True
-      if attr['use_cuda']:
-        attr['scipyfft'] = False
+      # FFT library and threads used by each rank
+      attr['fft_backend'] = fft_backend.lower()
+      attr['fft_threads'] = default_threads(self.comm) if fft_threads is None else fft_threads
+      attr['use_cuda'] = attr['fft_backend'] == 'cuda'
       if self.rank == 0 and attr['verbose']:
-        if attr['use_cuda']:
-          print('CUDA will perform FFTs on %d GPUs'%1)
-        else:
-          print('SciPy will perform FFTs')
+        print('%s will perform FFTs with %d threads'%(attr['fft_backend'],attr['fft_threads']))
+
+      # Per-rank scratch directory for out of core arrays
+      attr['out_of_core'] = out_of_core
+      if out_of_core:
+        from tempfile import gettempdir
+        if scratchdir is None:
+          scratchdir = gettempdir()
+        self.data_controller.make_ooc_path(scratchdir)
+        if self.rank == 0 and attr['verbose']:
+          print('Out of core arrays stored in %s'%scratchdir)
+
+    # Restarted runs select the FFT library in restart_load, with these threads if they were given
+    self.fft_threads = fft_threads
+    if not restart:
+      try:
+        set_fft_backend(attr['fft_backend'], attr['fft_threads'])
+      except Exception as e:
+        self.report_exception('Initialization')
+        raise e
 
     # Report execution information
     if self.rank == 0:
@@ -153,20 +174,21 @@ class PAOFLOW:
   def restart_dump ( self, fname_prefix='paoflow_dump' ):
     '''
       Saves the necessary information to restart a PAOFLOW run from any step in calculation.
+      The checkpoint can be loaded by a run with any number of processors.
 
       Arguments:
-          fname_prefix (str): Prefix of the filenames which will be written. Files are written to the directory housing the python script which instantiates PAOFLOW, unless otherwise specified in this argument.
+          fname_prefix (str): Name of the checkpoint directory which will be written. It is created in the directory housing the python script which instantiates PAOFLOW, unless otherwise specified in this argument.
 
       Returns:
           None
     '''
-    from pickle import dump,HIGHEST_PROTOCOL
-
-    fname = fname_prefix + '_%d'%self.rank + '.json'
+    from .defs.checkpoint import write_checkpoint
 
-    arry,attr = self.data_controller.data_dicts()
-    with open(fname, 'wb') as f:
-      dump([arry,attr], f, HIGHEST_PROTOCOL)
+    try:
+      write_checkpoint(self.data_controller, fname_prefix)
+    except Exception as e:
+      self.report_exception('restart_dump')
+      raise e
 
     self.report_module_time('Restart DUMP')
 
@@ -175,31 +197,43 @@ class PAOFLOW:
   def restart_load ( self, fname_prefix='paoflow_dump' ):
     '''
       Loads the previously dumped save files and populates the DataController with said data.
+      k-point distributed arrays are redistributed over the processors of the current run.
 
       Arguments:
-          fname_prefix (str): Prefix of the filenames which will be written. Files are written to the directory housing the python script which instantiates PAOFLOW, unless otherwise specified in this argument.
+          fname_prefix (str): Name of the checkpoint directory written by restart_dump. Legacy per-processor dumps named fname_prefix_<rank>.json are also accepted.
 
       Returns:
           None
     '''
-    from os.path import exists
+    from os.path import exists,isdir
     from pickle import load
+    from .defs.fft_backend import default_threads,set_fft_backend
+
+    if isdir(fname_prefix):
+      from .defs.checkpoint import read_checkpoint
+      read_checkpoint(self.data_controller, fname_prefix)
 
-    fname = fname_prefix + '_%d'%self.rank + '.json'
-    if not exists(fname):
-      print('Restart file named %s does not exist.'%fname)
-      raise OSError('File: %s not found.'%fname)
+    else:
+      fname = fname_prefix + '_%d'%self.rank + '.json'
+      if not exists(fname):
+        print('Restart file named %s does not exist.'%fname)
+        raise OSError('File: %s not found.'%fname)
 
-    arry,attr = None,None
-    with open(fname, 'rb') as f:
-      arry,attr = load(f)
+      arry,attr = None,None
+      with open(fname, 'rb') as f:
+        arry,attr = load(f)
 
-    if self.size != attr['mpisize']:
-      print('Restarted runs must use the same number of cores as the original run.')
-      raise ValueError('Number of processors does not match that of the previous run.')
+      if self.size != attr['mpisize']:
+        print('Restarted runs must use the same number of cores as the original run.')
+        raise ValueError('Number of processors does not match that of the previous run.')
 
-    self.data_controller.data_arrays = arry
-    self.data_controller.data_attributes = attr
+      self.data_controller.data_arrays = arry
+      self.data_controller.data_attributes = attr
+
+    # The threads of the dumping run were shared among its own ranks
+    attr = self.data_controller.data_attributes
+    attr['fft_threads'] = default_threads(self.comm) if self.fft_threads is None else self.fft_threads
+    set_fft_backend(attr.get('fft_backend','scipy'), attr['fft_threads'])
 
     self.report_module_time('Restart LOAD')
 
@@ -244,7 +278,14 @@ class PAOFLOW:
       tt = time() - self.start_time
       print('Total CPU time =%s%8.3f sec'%(25*' ',tt))
 
-    verbose = self.data_controller.data_attributes['verbose']
+    attr = self.data_controller.data_attributes
+    verbose = attr['verbose']
+
+    # Remove the scratch files of out of core arrays
+    if 'ooc_path' in attr:
+      for k in ['Hksp','dHksp','pksp']:
+        self.data_controller.delete_array(k)
+      self.data_controller.remove_ooc_path()
 
     if verbose:
 
@@ -318,25 +359,30 @@ class PAOFLOW:
     '''
     from .defs.read_upf import UPF
     from os.path import exists,join
+    from .defs.parse_cache import cached_parse
 
     arry,attr = self.data_controller.data_dicts()
     fpath = attr['fpath']
-    if exists(join(fpath,'atomic_proj.xml')):
+    if not exists(join(fpath,'atomic_proj.xml')):
+      raise Exception('atomic_proj.xml was not found.\n')
+    upfs = [join(fpath,pseudo) for _,pseudo in arry['species']]
+    for fname in upfs:
+      if not exists(fname):
+        raise Exception('Pseudopotential not found: %s'%fname)
+
+    def parse ():
       from .defs.read_QE_xml import parse_qe_atomic_proj
       parse_qe_atomic_proj(self.data_controller, join(fpath,'atomic_proj.xml'))
-    else:
-      raise Exception('atomic_proj.xml was not found.\n')
 
-    arry['jchia'] = {}
-    arry['shells'] = {}
-    for at,pseudo in arry['species']:
-      fname = join(attr['fpath'], pseudo)
-      if exists(fname):
+      arry['jchia'] = {}
+      arry['shells'] = {}
+      for (at,_),fname in zip(arry['species'],upfs):
         upf = UPF(fname)
         arry['shells'][at] = upf.shells
         arry['jchia'][at] = upf.jchia
-      else:
-        raise Exception('Pseudopotential not found: %s'%fname)
+
+    cached_parse(self.data_controller, join(fpath,'paoflow_proj.cache'),
+                 [join(fpath,'atomic_proj.xml')]+upfs, parse, extra=(attr['acbn0'],), comm=self.comm)
 
 
 
@@ -369,13 +415,14 @@ class PAOFLOW:
     
 
 
-  def pao_hamiltonian ( self, shift_type=1, insulator=False, write_binary=False, expand_wedge=True, symmetrize=False, thresh=1.e-6, max_iter=16 ):
+  def pao_hamiltonian ( self, shift_type=1, insulator=False, write_binary=False, expand_wedge=True, symmetrize=False, thresh=1.e-6, max_iter=16, store=None ):
     '''
     Construct the Tight Binding Hamiltonian
     Populates DataController with 'HRs', 'Hks' and 'kq_wght'
 
     Arguments:
         shift_type (int): Shift type [ 0-(PRB 2016), 1-(PRB 2013), 2-No Shift ] 
+        store (str): If not None, name of a file in the output directory where HRs (and SRs), the lattice and the shell metadata are saved. Later runs can start from it with PAOFLOW(hamiltonian=...)
 
     Returns:
         None
@@ -430,6 +477,13 @@ class PAOFLOW:
         raise e
     self.report_module_time('k -> R')
 
+    if store is not None:
+      from os.path import join
+      from .defs.pao_store import write_pao_store
+      if self.rank == 0:
+        write_pao_store(self.data_controller, join(attr['opath'],store))
+      self.report_module_time('Hamiltonian Store')
+
 
 
   def minimal(self,R=False):
@@ -522,6 +576,7 @@ class PAOFLOW:
 
     '''
     from .defs.do_bands import do_bands
+    from .defs.sparse_HRs import clear_phase_cache
     from .defs.communication import gather_full
 
     arrays,attr = self.data_controller.data_dicts()
@@ -556,6 +611,7 @@ class PAOFLOW:
       self.report_exception('bands')
       if attr['abort_on_exception']:
         raise e
+    clear_phase_cache()
 
     self.report_module_time('Bands')
 
@@ -767,6 +823,7 @@ mo    '''
         None
     '''
     from .defs.do_topology import do_topology
+    from .defs.sparse_HRs import clear_phase_cache
     # Compute Z2 invariant, velocity, momentum and Berry curvature and spin Berry
     # curvature operators along the path in the IBZ from do_topology_calc
 
@@ -795,6 +852,7 @@ mo    '''
       self.report_exception('topology')
       if attr['abort_on_exception']:
         raise e
+    clear_phase_cache()
 
     self.report_module_time('Band Topology')
 
@@ -805,7 +863,7 @@ mo    '''
 
 
 
-  def interpolated_hamiltonian ( self, nfft1=0, nfft2=0, nfft3=0, reshift_Ef=False ):
+  def interpolated_hamiltonian ( self, nfft1=0, nfft2=0, nfft3=0, reshift_Ef=False, triangular=False, tetrahedron=False ):
     '''
     Calculate the interpolated Hamiltonian with the method of zero padding
     Populates DataController with 'Hksp'
@@ -814,6 +872,9 @@ mo    '''
         nfft1 (int): Desired size of the interpolated Hamiltonian's first dimension
         nfft2 (int): Desired size of the interpolated Hamiltonian's second dimension
         nfft3 (int): Desired size of the interpolated Hamiltonian's third dimension
+        reshift_Ef (bool): If True the interpolated Hamiltonian is shifted to its own Fermi energy
+        triangular (bool): If True only the nawf*(nawf+1)/2 upper triangular orbital pairs are interpolated and redistributed, and the Hermitian 'Hksp' is rebuilt afterwards
+        tetrahedron (bool): If True the Fermi energy for reshift_Ef is found with the linear tetrahedron method
 
     Returns:
         None
@@ -839,6 +900,7 @@ mo    '''
       if nfft3 == 0: nfft3 = 2*nko3
 
       attr['nfft1'],attr['nfft2'],attr['nfft3'] = nfft1,nfft2,nfft3
+      attr['interp_triangular'] = triangular
 
       # Adjust 'npool' if arrays exceed MPI maximum
       int_max = 2147483647
@@ -856,14 +918,26 @@ mo    '''
       arrays['Hksp'] = gather_scatter(arrays['Hksp'], 1, attr['npool'])
 
       snktot = arrays['Hksp'].shape[1]
+      if triangular:
+        # Rebuild the lower triangle from hermiticity, H(k)_ji = conj(H(k)_ij)
+        iu = np.triu_indices(nawf)
+        Htri = arrays.pop('Hksp')
+        Hksp = np.empty((nawf,nawf,snktot,nspin), dtype=complex)
+        Hksp[iu[1],iu[0]] = np.conj(Htri)
+        Hksp[iu[0],iu[1]] = Htri
+        Htri = None
+      else:
+        Hksp = arrays.pop('Hksp').reshape((nawf,nawf,snktot,nspin))
       if reshift_Ef:
-        Hksp = arrays['Hksp'].reshape((nawf,nawf,snktot,nspin))
-        Ef = E_Fermi(Hksp, self.data_controller, parallel=True)
+        Ef = E_Fermi(Hksp, self.data_controller, parallel=True, tetrahedron=tetrahedron)
         dinds = np.diag_indices(nawf)
         Hksp[dinds[0], dinds[1]] -= Ef
-        arrays['Hksp'] = np.moveaxis(Hksp, 2, 0)
-      else:
-        arrays['Hksp'] = np.reshape(np.moveaxis(arrays['Hksp'],0,1), (snktot,nawf,nawf,nspin))
+
+      # Store Hksp, k-chunk by k-chunk, with the k index first
+      self.data_controller.allocate_array('Hksp', (snktot,nawf,nawf,nspin))
+      for ks in self.data_controller.k_chunks(snktot):
+        arrays['Hksp'][ks] = np.moveaxis(Hksp[:,:,ks], 2, 0)
+      Hksp = None
 
       get_K_grid_fft(self.data_controller)
 
@@ -884,13 +958,18 @@ mo    '''
 
 
 
-  def pao_eigh ( self, bval=0 ):
+  def pao_eigh ( self, bval=0, eigvals_only=False, chunk=None, ibz=False, nbnd=None, emax=None ):
     '''
     Calculate the Eigen values and vectors of k-space Hamiltonian 'Hksp'
     Populates DataController with 'E_k' and 'v_k'
 
     Arguments:
         bval (int): Top valence band number (nelec/2) to correctly shift Eigenvalues
+        eigvals_only (bool): If True only 'E_k' is computed. Use when no later module requires 'v_k'
+        chunk (int): Number of k-points diagonalized together in each batched call (default 256)
+        ibz (bool): If True only the irreducible k-points are diagonalized, and 'E_k', 'v_k' and the momenta hold the irreducible wedge. The DoS, transport and dielectric tensors are weighted by the star multiplicities and symmetrized with the point group
+        nbnd (int): If set, only the lowest 'nbnd' eigenpairs are computed with subset eigensolvers, and 'E_k' and 'v_k' hold only these bands
+        emax (float): If set (and nbnd is not), only the bands with energies up to 'emax' are computed. The number of bands kept is the largest number below 'emax' at any k-point
 
     Returns:
         None
@@ -901,6 +980,9 @@ mo    '''
     arrays,attr = self.data_controller.data_dicts()
 
     if 'bval' not in attr: attr['bval'] = bval
+    if chunk is not None: attr['eigh_chunk'] = chunk
+    attr['eigvals_only'] = eigvals_only
+    attr['eigh_nbnd'],attr['eigh_emax'] = nbnd,emax
 
     # HRs and Hks are replaced with Hksp
     if 'HRs' in arrays:
@@ -914,10 +996,25 @@ mo    '''
           arrays['Hks'] = np.moveaxis(np.reshape(arrays['Hks'],(nawf,nawf,nktot,nspin),order='C'), 2, 0)
         else:
           arrays['Hks'] = None
-        arrays['Hksp'] = scatter_full(arrays['Hks'], attr['npool'])
+        Hksp = scatter_full(arrays['Hks'], attr['npool'])
         del arrays['Hks']
-
-      do_pao_eigh(self.data_controller)
+        self.data_controller.allocate_array('Hksp', Hksp.shape)
+        for ks in self.data_controller.k_chunks(Hksp.shape[0]):
+          arrays['Hksp'][ks] = Hksp[ks]
+        Hksp = None
+
+      attr['ibz'] = ibz
+      if ibz:
+        from .defs.do_ibz import ibz_setup,ibz_reduce
+        ibz_setup(self.data_controller)
+        # The full grid 'Hksp' is kept for the gradient
+        Hksp = arrays.pop('Hksp')
+        arrays['Hksp'] = ibz_reduce(self.data_controller, Hksp)
+        do_pao_eigh(self.data_controller)
+        arrays['Hksp'] = Hksp
+        Hksp = None
+      else:
+        do_pao_eigh(self.data_controller)
 
       ### PARALLELIZATION
       ## DEV: Sample RunTime Here
@@ -959,35 +1056,56 @@ mo    '''
     arrays,attr = self.data_controller.data_dicts()
 
     try:
+      if band_curvature:
+        from .defs.do_ibz import require_full_grid
+        require_full_grid(self.data_controller, 'band_curvature')
+
       snktot,nawf,_,nspin = arrays['Hksp'].shape
 
-      for ik in range(snktot):
-        for ispin in range(nspin):
-          #make sure Hksp is hermitian (it should be)
-          arrays['Hksp'][ik,:,:,ispin] = (np.conj(arrays['Hksp'][ik,:,:,ispin].T) + arrays['Hksp'][ik,:,:,ispin])/2.
+      #make sure Hksp is hermitian (it should be)
+      for ks in self.data_controller.k_chunks(snktot):
+        Hk = arrays['Hksp'][ks]
+        arrays['Hksp'][ks] = (np.conj(np.swapaxes(Hk,1,2)) + Hk)/2.
+      Hk = None
 
-      arrays['Hksp'] = np.reshape(arrays['Hksp'], (snktot, nawf**2, nspin))
-      arrays['Hksp'] = np.moveaxis(gather_scatter(arrays['Hksp'],1,attr['npool']), 0, 1)
-      snawf,_,nspin = arrays['Hksp'].shape
-      arrays['Hksp'] = np.reshape(arrays['Hksp'], (snawf,attr['nk1'],attr['nk2'],attr['nk3'],nspin))
+      Hksp = np.reshape(arrays['Hksp'], (snktot, nawf**2, nspin))
+      Hksp = np.moveaxis(gather_scatter(Hksp,1,attr['npool']), 0, 1)
+      self.data_controller.delete_array('Hksp')
+      snawf,_,nspin = Hksp.shape
+      arrays['Hksp'] = np.reshape(Hksp, (snawf,attr['nk1'],attr['nk2'],attr['nk3'],nspin))
+      Hksp = None
 
       do_gradient(self.data_controller)
 
       if not band_curvature:
         # No more need for k-space Hamiltonian
-        del arrays['Hksp']
+        self.data_controller.delete_array('Hksp')
 
       ### PARALLELIZATION
       #gather dHksp on nawf*nawf and scatter on k points
-      arrays['dHksp'] = np.reshape(arrays['dHksp'], (snawf,attr['nkpnts'],3,nspin))
-      arrays['dHksp'] = np.moveaxis(gather_scatter(arrays['dHksp'],1,attr['npool']), 0, 2)
-      arrays['dHksp'] = np.reshape(arrays['dHksp'], (snktot,3,nawf,nawf,nspin), order="C")
+      dHksp = np.reshape(arrays.pop('dHksp'), (snawf,attr['nkpnts'],3,nspin))
+      dHksp = gather_scatter(dHksp,1,attr['npool'])
+      self.data_controller.allocate_array('dHksp', (snktot,3,nawf,nawf,nspin))
+      for ks in self.data_controller.k_chunks(snktot):
+        nks = ks.stop - ks.start
+        arrays['dHksp'][ks] = np.reshape(np.moveaxis(dHksp[:,ks],0,2), (nks,3,nawf,nawf,nspin))
+      dHksp = None
+
+      if attr['ibz']:
+        # Momenta are only needed on the irreducible wedge
+        from .defs.do_ibz import ibz_reduce
+        dHksp = ibz_reduce(self.data_controller, arrays['dHksp'])
+        self.data_controller.delete_array('dHksp')
+        self.data_controller.allocate_array('dHksp', dHksp.shape)
+        for ks in self.data_controller.k_chunks(dHksp.shape[0]):
+          arrays['dHksp'][ks] = dHksp[ks]
+        dHksp = None
 
       if band_curvature:
         from .defs.do_band_curvature import do_band_curvature
         do_band_curvature(self.data_controller)
         # No more need for k-space Hamiltonian
-        del arrays['Hksp']
+        self.data_controller.delete_array('Hksp')
       
     except Exception as e:
       self.report_exception('gradient_and_momenta')
@@ -1006,7 +1124,7 @@ mo    '''
   def adaptive_smearing ( self, smearing='gauss' ):
     '''
     Calculate the Adaptive Smearing parameters
-    Populates DataController with 'deltakp' and 'deltakp2'
+    Populates DataController with 'deltakp', widths of band pairs are computed where needed
 
     Arguments:
         smearing (str): Smearing type (m-p and gauss)
@@ -1031,10 +1149,11 @@ mo    '''
 
 
 
-  def dos ( self, do_dos=True, do_pdos=True, delta=0.01, emin=-10., emax=2., ne=1000 ):
+  def dos ( self, do_dos=True, do_pdos=True, delta=0.01, emin=-10., emax=2., ne=1000, tetrahedron=False, bloechl=False ):
     '''
     Calculate the Density of States and Projected Density of States
       If Adaptive Smearing has been performed, the Adaptive DoS will be calculated
+      With tetrahedron=True the linear tetrahedron method is used on the current k grid instead of smearing
 
     Arguments:
         do_dos (bool): Perform Density of States calculation
@@ -1043,6 +1162,8 @@ mo    '''
         emin (float): The minimum energy in the range to be computed
         emax (float): The maximum energy in the range to be computed
         ne (int): The number of points to place in the range [emin,emax]
+        tetrahedron (bool): If True use the linear tetrahedron method ('delta' and smearing are ignored)
+        bloechl (bool): If True apply the Blochl corrections to the tetrahedron weights (affects the PDoS only)
 
     Returns:
         None
@@ -1051,8 +1172,18 @@ mo    '''
 
     if 'smearing' not in attr: attr['smearing'] = None
 
+    # Orbital projections are not invariant under the point group
+    if do_pdos and attr['ibz']:
+      if self.rank == 0:
+        print('PDoS requires the full k grid and is skipped on the irreducible wedge')
+      do_pdos = False
+
     try:
-      if attr['smearing'] is None:
+      if tetrahedron:
+        if do_dos or do_pdos:
+          from .defs.do_tetrahedron import do_dos_tetrahedron
+          do_dos_tetrahedron(self.data_controller, emin, emax, ne, bloechl, do_pdos)
+      elif attr['smearing'] is None:
         if do_dos:
           from .defs.do_dos import do_dos
           do_dos(self.data_controller, emin, emax, ne, delta)
@@ -1077,7 +1208,7 @@ mo    '''
       if attr['abort_on_exception']:
         raise e
 
-    mname = 'DoS%s'%('' if attr['smearing'] is None else ' (Adaptive Smearing)')
+    mname = 'DoS%s'%(' (Tetrahedron)' if tetrahedron else '' if attr['smearing'] is None else ' (Adaptive Smearing)')
     self.report_module_time(mname)
 
 
@@ -1109,7 +1240,6 @@ mo    '''
     arrays['pksp'] = arrays['pksp'][:,:,:bnd,:bnd]
     if 'deltakp' in arrays:
       arrays['deltakp'] = arrays['deltakp'][:,:bnd]
-      arrays['deltakp2'] = arrays['deltakp2'][:,:bnd]
 
 
 
@@ -1179,7 +1309,7 @@ mo    '''
 
 
 
-  def spin_Hall ( self, twoD=False, do_ac=False, emin=-1., emax=1., fermi_up=1., fermi_dw=-1., s_tensor=None ):
+  def spin_Hall ( self, twoD=False, do_ac=False, emin=-1., emax=1., fermi_up=1., fermi_dw=-1., s_tensor=None, ne=500 ):
     '''
     Calculate the Spin Hall Conductivity
       Currently this module does not possess the "spin_orbit" capability of do_topology, because I(Frank) do not know what this modification entails.
@@ -1193,6 +1323,7 @@ mo    '''
         fermi_up (float): The upper limit of the occupied energy range
         fermi_dw (float): The lower limit of the occupied energy range
         s_tensor (list): List of tensor elements to calculate (e.g. To calculate xxx and zxy use [[0,0,0],[0,1,2]])
+        ne (int): The number of energy increments in [emin,emax]
 
     Returns:
         None
@@ -1201,7 +1332,7 @@ mo    '''
 
     arrays,attr = self.data_controller.data_dicts()
 
-    attr['eminH'],attr['emaxH'] = emin,emax
+    attr['eminH'],attr['emaxH'],attr['neH'] = emin,emax,ne
 
     if s_tensor is not None: arrays['s_tensor'] = np.array(s_tensor)
     if 'fermi_up' not in attr: attr['fermi_up'] = fermi_up
@@ -1253,7 +1384,7 @@ mo    '''
     self.report_module_time('Rashba_Edelstein')
 
 
-  def anomalous_Hall ( self, do_ac=False, emin=-1., emax=1., fermi_up=1., fermi_dw=-1., a_tensor=None ):
+  def anomalous_Hall ( self, do_ac=False, emin=-1., emax=1., fermi_up=1., fermi_dw=-1., a_tensor=None, ne=500 ):
     '''
     Calculate the Anomalous Hall Conductivity
 
@@ -1264,6 +1395,7 @@ mo    '''
         fermi_up (float): The upper limit of the occupied energy range
         fermi_dw (float): The lower limit of the occupied energy range
         a_tensor (list): List of tensor elements to calculate (e.g. To calculate xx and yz use [[0,0],[1,2]])
+        ne (int): The number of energy increments in [emin,emax]
 
     Returns:
         None
@@ -1274,6 +1406,7 @@ mo    '''
 
     attr['eminH'] = emin
     attr['emaxH'] = emax
+    attr['neH'] = ne
 
     if a_tensor is not None: arrays['a_tensor'] = np.array(a_tensor)
     if 'fermi_up' not in attr: attr['fermi_up'] = fermi_up
@@ -1323,7 +1456,7 @@ mo    '''
 
 
 
-  def doping ( self, tmin=300, tmax=300, nt=1, delta=0.01, emin=-1., emax=1., ne=1000, doping_conc=0., core_electrons=0., fname='doping_' ):
+  def doping ( self, tmin=300, tmax=300, nt=1, delta=0.01, emin=-1., emax=1., ne=1000, doping_conc=0., core_electrons=0., fname='doping_', tetrahedron=False ):
     '''
     Calculate the chemical potential that corresponds to specified doping for different temperatures
 
@@ -1337,13 +1470,15 @@ mo    '''
         doping_conc(float): The amount of doping in 1/cm^3. Positive value for p type and negative value for n type
         core_electrons(float): The number of core electrons in a system. Adding this to integrated dos allows for integration over a narrower energy window
         fname (str): Prefix for the filename containg Doping vs Temperature
+        tetrahedron (bool): If True the DoS is computed with the linear tetrahedron method
 
     Returns:
         None
     '''
     from .defs.do_doping import do_doping
     from .defs.do_dos import do_dos,do_dos_adaptive
-    
+    from .defs.do_tetrahedron import do_dos_tetrahedron
+
     arrays,attr = self.data_controller.data_dicts()
 
     if 'delta' not in attr: attr['delta'] = delta
@@ -1352,11 +1487,13 @@ mo    '''
 
     ene = np.linspace(emin, emax, ne)
     temps = np.linspace(tmin, tmax, nt)
-    if attr['smearing'] == None:
+    if tetrahedron:
+      do_dos_tetrahedron(self.data_controller, emin, emax, ne)
+    elif attr['smearing'] == None:
       do_dos(self.data_controller, emin, emax, ne, delta)
     else:
-      do_dos_adaptive(self.data_controller, emin, emax, ne, delta)
-    do_doping(self.data_controller, temps, ene, fname)
+      do_dos_adaptive(self.data_controller, emin, emax, ne)
+    do_doping(self.data_controller, temps, ene, fname, tetrahedron)
 
     self.report_module_time('Doping')
 
@@ -1379,7 +1516,7 @@ mo    '''
         tau_dict (dict): Dictionary housing parameters required for calculating Tau with built-in models
         do_hall (bool): Set True to calculate hall coefficient
         write_to_file (bool): Set True to write tensors to file
-        save_tensors (bool): Set True to save the tensors into the data controller
+        save_tensors (bool): Set True to save the tensors into the data controller ('sigma', 'S' and 'kappa' with shape (nt,3,3,ne), 'R_hall_trace' with shape (nt,ne))
 
     Returns:
         None
@@ -1395,9 +1532,13 @@ mo    '''
     try:
       # Compute Velocities for Spin 0 Only
       bnd = attr['bnd']
-      velkp = np.zeros((arrays['pksp'].shape[0],3,bnd,attr['nspin']))
-      for n in range(bnd):
-        velkp[:,:,n,:] = np.real(arrays['pksp'][:,:,n,n,:])
+      snktot = arrays['pksp'].shape[0]
+      velkp = np.zeros((snktot,3,bnd,attr['nspin']))
+      for ks in self.data_controller.k_chunks(snktot):
+        pks = arrays['pksp'][ks]
+        for n in range(bnd):
+          velkp[ks,:,n,:] = np.real(pks[:,:,n,n,:])
+      pks = None
 
       do_transport(self.data_controller, temps, ene, velkp, sc, sw, do_hall, write_to_file, save_tensors)
 
@@ -1538,6 +1679,7 @@ mo    '''
 
     '''
     from .defs.do_berry_phase import do_berry_phase
+    from .defs.sparse_HRs import clear_phase_cache
 
     arry,attr = self.data_controller.data_dicts()
 
@@ -1590,6 +1732,7 @@ mo    '''
       self.report_exception('berry_phase')
       if attr['abort_on_exception']:
         raise e
+    clear_phase_cache()
 
     self.report_module_time('Berry phase')
 
@@ -0,0 +1,209 @@
+#
+# PAOFLOW
+#
+# Copyright 2016-2024 - Marco BUONGIORNO NARDELLI (mbn@unt.edu)
+#
+# Reference:
+#
+# F.T. Cerasoli, A.R. Supka, A. Jayaraj, I. Siloi, M. Costa, J. Slawinska, S. Curtarolo, M. Fornari, D. Ceresoli, and M. Buongiorno Nardelli,
+# Advanced modeling of materials with PAOFLOW 2.0: New features and software design, Comp. Mat. Sci. 200, 110828 (2021).
+#
+# M. Buongiorno Nardelli, F. T. Cerasoli, M. Costa, S Curtarolo,R. De Gennaro, M. Fornari, L. Liyanage, A. Supka and H. Wang,
+# PAOFLOW: A utility to construct and operate on ab initio Hamiltonians from the Projections of electronic wavefunctions on
+# Atomic Orbital bases, including characterization of topological materials, Comp. Mat. Sci. vol. 143, 462 (2018).
+#
+# This file is distributed under the terms of the
+# GNU General Public License. See the file `License'
+# in the root directory of the present distribution,
+# or http://www.gnu.org/copyleft/gpl.txt .
+
+# Checkpoints independent of the number of MPI ranks.
+# A checkpoint is a directory holding
+#   checkpoint.pao - attributes and replicated arrays, in the parse_cache container
+#   <key>.npy      - one file per k-distributed array, with its global shape
+# Every rank writes its own rows of the k-distributed arrays, at the byte offsets of their
+# global positions in the scatter_full layout, and reads back the rows it owns in the new layout.
+
+import numpy as np
+from mpi4py import MPI
+
+comm = MPI.COMM_WORLD
+rank = comm.Get_rank()
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_KEY = ('PAOFLOW checkpoint', CHECKPOINT_VERSION)
+
+# Arrays distributed over k-points with scatter_full, and their k axis
+K_DISTRIBUTED = {'Hksp':0, 'dHksp':0, 'pksp':0, 'E_k':0, 'v_k':0, 'deltakp':0,
+                 'scattering_tau':0, 'd2Ed2k':1, 'berry_Hks':2}
+
+# Rank dependent arrays which are rebuilt after loading
+REBUILT = ('ibz_own', 'ibz_order', 'ibz_mult')
+
+
+def contiguous_runs ( ind ):
+  '''
+  Split increasing indices into runs of consecutive values
+
+  Arguments:
+      ind (ndarray): Increasing integer indices
+
+  Returns:
+      List of (position of the run in ind, first index, length) tuples
+  '''
+  brk = np.flatnonzero(np.diff(ind) != 1) + 1
+  starts = np.concatenate(([0],brk))
+  ends = np.concatenate((brk,[ind.size]))
+
+  return [(s,ind[s],e-s) for s,e in zip(starts,ends) if e > s]
+
+
+def pwrite_all ( fd, buf, offset ):
+  '''
+  Write a contiguous array to a file at a byte offset, without moving the file position
+
+  Arguments:
+      fd (int): File descriptor open for writing
+      buf (ndarray): C contiguous data to write
+      offset (int): Byte offset in the file
+
+  Returns:
+      None
+  '''
+  from os import pwrite
+
+  view = memoryview(buf).cast('B')
+  while view.nbytes > 0:
+    n = pwrite(fd, view, offset)
+    view,offset = view[n:],offset+n
+
+
+def write_checkpoint ( data_controller, dname ):
+  '''
+  Write the DataController to a checkpoint directory
+
+  Arguments:
+      data_controller (DataController): Data controller to save
+      dname (str): Path of the checkpoint directory
+
+  Returns:
+      None
+  '''
+  from os.path import join
+  from os import O_WRONLY,close,fsync,makedirs
+  from os import open as os_open
+  from .parse_cache import write_parse_cache
+  from .communication import scatter_full_indices
+
+  arry,attr = data_controller.data_dicts()
+  npool = attr['npool']
+
+  if rank == 0:
+    makedirs(dname, exist_ok=True)
+
+  dist = {k:ax for k,ax in K_DISTRIBUTED.items() if k in arry and isinstance(arry[k],np.ndarray)}
+
+  # Global shape of each k-distributed array, and the offset of its data in the .npy file
+  index = {}
+  offsets = {}
+  for k,ax in dist.items():
+    shape = list(arry[k].shape)
+    shape[ax] = comm.allreduce(shape[ax])
+    index[k] = (ax, tuple(shape), arry[k].dtype.str)
+    if rank == 0:
+      mm = np.lib.format.open_memmap(join(dname,k+'.npy'), mode='w+', dtype=arry[k].dtype, shape=tuple(shape))
+      offsets[k] = mm.offset
+      mm = None
+  offsets = comm.bcast(offsets, root=0)
+
+  # Each rank writes its runs of consecutive rows at their byte offsets, one k chunk at a time.
+  # Ranks never write to the same bytes, even when their rows share a page of the file.
+  for k,(ax,shape,_) in index.items():
+    ind = scatter_full_indices(shape[ax], npool)
+    lead = int(np.prod(shape[:ax]))
+    rest = int(np.prod(shape[ax+1:]))
+    rbytes = rest*arry[k].dtype.itemsize
+    arr = np.reshape(arry[k], (lead,ind.size,rest))
+    fd = os_open(join(dname,k+'.npy'), O_WRONLY)
+    for p0,k0,nrun in contiguous_runs(ind):
+      for ks in data_controller.k_chunks(nrun):
+        for l in range(lead):
+          buf = np.ascontiguousarray(arr[l,p0+ks.start:p0+ks.stop])
+          pwrite_all(fd, buf, offsets[k]+(l*shape[ax]+k0+ks.start)*rbytes)
+    fsync(fd)
+    close(fd)
+    arr = buf = None
+  comm.Barrier()
+
+  # Degenerate subspaces are per k-point lists, collected in the global order
+  degen = None
+  if 'degen' in arry:
+    nk = comm.allreduce(len(arry['degen'][0]))
+    parts = comm.gather((scatter_full_indices(nk,npool),arry['degen']), root=0)
+    if rank == 0:
+      degen = [[None]*nk for _ in range(len(arry['degen']))]
+      for ind,dg in parts:
+        for ispin,dgs in enumerate(dg):
+          for i,ik in enumerate(ind):
+            degen[ispin][ik] = dgs[i]
+
+  if rank == 0:
+    skip = set(dist) | set(REBUILT) | {'degen'}
+    arrays = {k:v for k,v in arry.items() if k not in skip}
+    arrays['checkpoint_index'] = index
+    arrays['checkpoint_degen'] = degen
+    write_parse_cache(join(dname,'checkpoint.pao'), CHECKPOINT_KEY, arrays, attr)
+  comm.Barrier()
+
+
+def read_checkpoint ( data_controller, dname ):
+  '''
+  Populate the DataController from a checkpoint directory written with any number of ranks.
+  The k-distributed arrays are redistributed in the scatter_full layout of the current run.
+
+  Arguments:
+      data_controller (DataController): Data controller to populate
+      dname (str): Path of the checkpoint directory
+
+  Returns:
+      None
+  '''
+  from os.path import join
+  from .parse_cache import load_parse_cache
+  from .communication import scatter_full_indices
+
+  stored = load_parse_cache(join(dname,'checkpoint.pao'), CHECKPOINT_KEY)
+  if stored is None:
+    raise ValueError('%s is not a PAOFLOW checkpoint of version %d.'%(dname,CHECKPOINT_VERSION))
+
+  arry,attr = stored
+  index = arry.pop('checkpoint_index')
+  degen = arry.pop('checkpoint_degen')
+
+  data_controller.data_arrays = arry
+  data_controller.data_attributes = attr
+  attr['mpisize'] = comm.Get_size()
+
+  # Out of core arrays go to a new scratch directory for this rank
+  if attr.get('out_of_core', False):
+    from os.path import dirname
+    data_controller.make_ooc_path(dirname(attr['ooc_path']))
+
+  npool = attr['npool']
+  for k,(ax,shape,dt) in index.items():
+    ind = scatter_full_indices(shape[ax], npool)
+    lshape = list(shape)
+    lshape[ax] = ind.size
+    src = np.moveaxis(np.load(join(dname,k+'.npy'), mmap_mode='r'), ax, 0)
+    dst = np.moveaxis(data_controller.allocate_array(k, tuple(lshape), dtype=np.dtype(dt)), ax, 0)
+    for ks in data_controller.k_chunks(ind.size):
+      dst[ks] = src[ind[ks]]
+    src = dst = None
+
+  if degen is not None:
+    ind = scatter_full_indices(len(degen[0]), npool)
+    arry['degen'] = [[dg[ik] for ik in ind] for dg in degen]
+
+  if attr.get('ibz', False):
+    from .do_ibz import ibz_setup
+    ibz_setup(data_controller)
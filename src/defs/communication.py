@@ -160,6 +160,26 @@ def scatter_full(arr,npool,sroot=0):
     return temp
 
 
+# Global indices of the rows this rank holds after scatter_full of 'nsize' rows
+def scatter_full_indices(nsize,npool):
+
+    ind = []
+
+    nchunks = nsize//size
+
+    if nchunks!=0:
+        for pool in range(npool):
+            chunk_s,chunk_e = load_balancing(npool,pool,nchunks)
+            ts,te = load_balancing(size,rank,(chunk_e-chunk_s)*size)
+            ind.append(np.arange(chunk_s*size+ts,chunk_s*size+te))
+
+    if nsize%size!=0:
+        ts,te = load_balancing(size,rank,nsize%size)
+        ind.append(np.arange(nchunks*size+ts,nchunks*size+te))
+
+    return np.concatenate(ind).astype(int) if len(ind)>0 else np.zeros(0,dtype=int)
+
+
 def gather_full(arr,npool,sroot=0):
 
     first_ind_per_proc = np.array([arr.shape[0]])
@@ -24,67 +24,70 @@ from mpi4py import MPI
 comm = MPI.COMM_WORLD
 rank = comm.Get_rank()
 
-def do_Boltz_tensors ( data_controller, smearing, temp, ene, velkp, ispin, channels, weights):
-  # Compute the L_alpha tensors for Boltzmann transport
+def do_Boltz_tensors ( data_controller, smearing, temps, ene, velkp, ispin, channels, weights):
+  # Compute the L_alpha tensors for Boltzmann transport at every temperature in 'temps'
+  # Returns L0, L1 and L2 as (nt,3,3,esize) arrays on rank 0. The leading dimension is 1
+  # when the result does not depend on temperature (adaptive smearing with constant tau)
 
   arrays,attributes = data_controller.data_dicts()
 
+  temps = np.atleast_1d(temps)
   esize = ene.size
-  arrays['scattering_tau'] = get_tau(data_controller, temp, channels, weights)
+
+  # Relaxation times are only recomputed per temperature for temperature dependent scattering channels
+  if channels:
+    tau = np.array([get_tau(data_controller, t, channels, weights) for t in temps])
+  else:
+    tau = get_tau(data_controller, temps[0], channels, weights)[None]
+  arrays['scattering_tau'] = tau[-1]
 
 #### Forced t_tensor to have all components
   t_tensor = np.array([[0,0],[1,1],[2,2],[0,1],[0,2],[1,2]], dtype=int)
 
-  # Quick call function for L_loop (None is smearing type)
-  fLloop = lambda spol : L_loop(data_controller, temp, smearing, ene, velkp, t_tensor, spol, ispin)
-
-  # Quick call function for Zeros on rank Zero
-  zoz = lambda r: (np.zeros((3,3,esize), dtype=float) if r==0 else None)
+  # Only the conductivity (L0) is needed with adaptive smearing
+  nalpha = 3 if smearing is None else 1
+  nt = max(tau.shape[0], (temps.size if smearing is None else 1))
 
-  L0 = zoz(rank)
-  L0aux = fLloop(0)
-  comm.Reduce(L0aux, L0, op=MPI.SUM)
-  L0aux = None
+  # L0, L1 and L2 for all temperatures in a single pass over bands and energies
+  L = np.zeros((nt,nalpha,3,3,esize), dtype=float) if rank==0 else None
+  Laux = L_loop(data_controller, temps, smearing, ene, velkp, t_tensor, nalpha, ispin, tau)
+  comm.Reduce(Laux, L, op=MPI.SUM)
+  Laux = None
 
   if rank == 0:
     # Assign lower triangular to upper triangular
-    sym = lambda L : (L[0,1], L[0,2], L[1,2])
-    L0[1,0],L0[2,0],L0[2,1] = sym(L0)
-
-  L1 = zoz(rank)
-  L1aux = fLloop(1)
-  comm.Reduce(L1aux, L1, op=MPI.SUM)
-  L1aux = None
-
-  L2 = zoz(rank)
-  L2aux = fLloop(2)
-  comm.Reduce(L2aux, L2, op=MPI.SUM)
-  L2aux = None
-
-  if rank == 0:
-    L1[1,0],L1[2,0],L1[2,1] = sym(L1)
-    L2[1,0],L2[2,0],L2[2,1] = sym(L2)
+    L[:,:,1,0],L[:,:,2,0],L[:,:,2,1] = L[:,:,0,1],L[:,:,0,2],L[:,:,1,2]
+    if attributes['ibz']:
+      from .do_ibz import symmetrize_tensor
+      L = symmetrize_tensor(data_controller, L, (2,3))
+    return tuple(np.moveaxis(L,1,0)) + (None,)*(3-nalpha)
 
-  return (L0, L1, L2) if rank==0 else (None, None, None)
+  return (None, None, None)
 
 
-def do_Boltz_tensors_hall ( data_controller, smearing, temp, ene, velkp, ispin, channels, weights):
+def do_Boltz_tensors_hall ( data_controller, smearing, temps, ene, velkp, ispin, channels, weights):
+  # Compute the L0 Hall tensor at every temperature in 'temps'
+  # Returns a (nt,3,3,3,esize) array on rank 0. The leading dimension is 1
+  # when the result does not depend on temperature (adaptive smearing with constant tau)
+  from .do_ibz import require_full_grid
 
   arrays,attributes = data_controller.data_dicts()
+  require_full_grid(data_controller, 'Hall transport')
 
+  temps = np.atleast_1d(temps)
   esize = ene.size
-  arrays['scattering_tau'] = get_tau(data_controller, temp, channels, weights)
-
-#### Forced t_tensor to have all components
-  t_tensor = np.array([[0,0],[1,1],[2,2],[0,1],[0,2],[1,2]], dtype=int)
 
-  # Quick call function for L_loop (None is smearing type)
+  # Relaxation times are only recomputed per temperature for temperature dependent scattering channels
+  if channels:
+    tau = np.array([get_tau(data_controller, t, channels, weights) for t in temps])
+  else:
+    tau = get_tau(data_controller, temps[0], channels, weights)[None]
+  arrays['scattering_tau'] = tau[-1]
 
-  # Quick call function for Zeros on rank Zero
-  zoz = lambda r: (np.zeros((3,3,3,esize), dtype=float) if r==0 else None)
+  nt = max(tau.shape[0], (temps.size if smearing is None else 1))
 
-  L0_hall = zoz(rank)
-  L0_hall_aux = L_loop_hall(data_controller, temp, smearing, ene, velkp, t_tensor, 0, ispin)
+  L0_hall = np.zeros((nt,3,3,3,esize), dtype=float) if rank==0 else None
+  L0_hall_aux = L_loop_hall(data_controller, temps, smearing, ene, velkp, ispin, tau)
   comm.Reduce(L0_hall_aux, L0_hall, op=MPI.SUM)
   L0_hall_aux = None
   
@@ -146,9 +149,12 @@ def get_tau ( data_controller, temp, channels, weights ):
 
 
 
-def L_loop ( data_controller, temp, smearing, ene, velkp, t_tensor, alpha, ispin ):
+def L_loop ( data_controller, temps, smearing, ene, velkp, t_tensor, nalpha, ispin, tau ):
   from .smearing import gaussian,metpax
+  from .do_ibz import k_multiplicity
   # We assume tau=1 in the constant relaxation time approximation
+  # Returns the local L_alpha for alpha = 0,...,nalpha-1 as a (nt,nalpha,3,3,esize) array
+  # 'tau' is (nt,snktot,bnd,nspin), or (1,snktot,bnd,nspin) if it does not depend on temperature
 
   arrays,attributes = data_controller.data_dicts()
 
@@ -158,28 +164,48 @@ def L_loop ( data_controller, temp, smearing, ene, velkp, t_tensor, alpha, ispin
 
   bnd = attributes['bnd']
   kq_wght = 1./attributes['nkpnts']
+  kmult = k_multiplicity(data_controller)
   if smearing is not None and smearing != 'gauss' and smearing != 'm-p':
     print('%s Smearing Not Implemented.'%smearing)
     comm.Abort()
 
-  L = np.zeros((3,3,esize), dtype=float)
+  # The Fermi window depends on temperature, the adaptive smearing window does not
+  temps = np.atleast_1d(temps)
+  tw = temps[:,None,None] if smearing is None else None
+  ntw = temps.size if smearing is None else 1
+  nt = max(ntw, tau.shape[0])
+
+  # Chunks hold at most e_chunk (temperature,energy) columns per k-point
+  echunk = max(1, attributes['e_chunk']//ntw)
+
+  L = np.zeros((nt,nalpha,3,3,esize), dtype=float)
+  ti,tj = t_tensor[:,0],t_tensor[:,1]
 
   for n in range(bnd):
-    Eaux = np.reshape(np.repeat(arrays['E_k'][:,n,ispin],esize), (snktot,esize))
-    delk = (np.reshape(np.repeat(arrays['deltakp'][:,n,ispin],esize), (snktot,esize)) if smearing!=None else None)
-    EtoAlpha = np.power(Eaux[:,:]-ene, alpha)
-    if smearing is None:
-      Eaux -= ene
-      smearA = 1/(4*temp*(np.cosh(Eaux/(2*temp))**2))
-    else:
-      if smearing == 'gauss':
-        smearA = gaussian(Eaux, ene, delk)
+    E_n = arrays['E_k'][:,n,ispin][:,None]
+    delk = (arrays['deltakp'][:,n,ispin][:,None] if smearing!=None else None)
+
+    # tau*v_i*v_j for every temperature and tensor component, (nt,1,ncomp,snktot)
+    vv = kq_wght*kmult*tau[:,None,None,:,n,ispin]*velkp[:,ti,n,ispin].T*velkp[:,tj,n,ispin].T
+
+    for i0 in range(0, esize, echunk):
+      es = slice(i0, min(i0+echunk,esize))
+      dE = E_n - ene[es]
+      if smearing is None:
+        smearA = 1/(4*tw*(np.cosh(dE/(2*tw))**2))
+      elif smearing == 'gauss':
+        smearA = gaussian(E_n, ene[es], delk)[None]
       elif smearing == 'm-p':
-        smearA = metpax(Eaux, ene, delk)
-    for l in range(t_tensor.shape[0]):
-      i = t_tensor[l][0]
-      j = t_tensor[l][1]
-      L[i,j,:] += np.sum(kq_wght*arrays['scattering_tau'][:,n,ispin]*velkp[:,i,n,ispin]*velkp[:,j,n,ispin]*(smearA*EtoAlpha).T, axis=1)
+        smearA = metpax(E_n, ene[es], delk)[None]
+
+      # Window times (E-ene)**alpha for all moments, (ntw,nalpha,snktot,echunk)
+      W = np.empty((ntw,nalpha)+dE.shape, dtype=float)
+      W[:,0] = smearA
+      for a in range(1, nalpha):
+        W[:,a] = W[:,a-1]*dE
+
+      # One batched GEMM per chunk for all temperatures, moments and components
+      L[:,:,ti,tj,es] += np.matmul(vv, W)
   '''
   # noise reduction using a running average (correlation function)
   # Only possible for sigma vs chemical potential
@@ -192,62 +218,63 @@ def L_loop ( data_controller, temp, smearing, ene, velkp, t_tensor, alpha, ispin
   '''
   return L
 
-def L_loop_hall ( data_controller, temp, smearing, ene, velkp, t_tensor, alpha, ispin ):
-  from scipy.constants import hbar
-  from sympy import Eijk
+def L_loop_hall ( data_controller, temps, smearing, ene, velkp, ispin, tau ):
   from .smearing import gaussian,metpax
-  from os.path import join
+  # Returns the local L0 Hall tensor as a (nt,3,3,3,esize) array
+  # 'tau' is (nt,snktot,bnd,nspin), or (1,snktot,bnd,nspin) if it does not depend on temperature
 
   arrays,attributes = data_controller.data_dicts()
 
   esize = ene.size
 
   snktot = arrays['E_k'].shape[0]
-  bohr2m = 5.29177e-11
-  ev2J = 1.60218e-19
   bnd = attributes['bnd']
-  nspin = attributes['nspin']
   kq_wght = 1./attributes['nkpnts']
   if smearing is not None and smearing != 'gauss' and smearing != 'm-p':
     print('%s Smearing Not Implemented.'%smearing)
     comm.Abort()
 
-  L_hall = np.zeros((3,3,3,esize), dtype=float)
-  sig_hall = np.zeros((3,3,3,snktot,bnd,nspin))
+  # The Fermi window depends on temperature, the adaptive smearing window does not
+  temps = np.atleast_1d(temps)
+  tw = temps[:,None,None] if smearing is None else None
+  ntw = temps.size if smearing is None else 1
+  nt = max(ntw, tau.shape[0])
 
-  M_inv = np.zeros((3,3,snktot,bnd,nspin))
-  eff_mass_inv = arrays['d2Ed2k']
-  for l in range(t_tensor.shape[0]):
-    i = t_tensor[l][0]
-    j = t_tensor[l][1]
-    if i==j:
-      M_inv[i,j]=eff_mass_inv[i]
-    elif i==0 and j==1:
-      M_inv[i,j]=eff_mass_inv[3]
-      M_inv[j,i]=eff_mass_inv[3]
-    elif i==0 and j==2:
-      M_inv[i,j]=eff_mass_inv[4]
-      M_inv[j,i]=eff_mass_inv[4]
-    elif i==1 and j==2:
-      M_inv[i,j]=eff_mass_inv[5]
-      M_inv[j,i]=eff_mass_inv[5]
+  # Chunks hold at most e_chunk (temperature,energy) columns per k-point
+  echunk = max(1, attributes['e_chunk']//ntw)
+
+  # Levi-Civita symbol
+  eijk = np.zeros((3,3,3), dtype=float)
+  eijk[0,1,2] = eijk[1,2,0] = eijk[2,0,1] = 1.
+  eijk[0,2,1] = eijk[2,1,0] = eijk[1,0,2] = -1.
+
+  # Inverse effective mass tensor from the six independent components of d2Ed2k
+  M_ind = np.array([[0,3,4],[3,1,5],[4,5,2]], dtype=int)
+
+  L_hall = np.zeros((nt,3,3,3,esize), dtype=float)
 
   for n in range(bnd):
-    Eaux = np.reshape(np.repeat(arrays['E_k'][:,n,ispin],esize), (snktot,esize))
-    delk = (np.reshape(np.repeat(arrays['deltakp'][:,n,ispin],esize), (snktot,esize)) if smearing!=None else None)
-    if smearing is None:
-      Eaux -= ene
-      smearA = 1/(4*temp*(np.cosh(Eaux/(2*temp))**2))
-    else:
-      if smearing == 'gauss':
-        smearA = gaussian(Eaux, ene, delk)
+    E_n = arrays['E_k'][:,n,ispin][:,None]
+    delk = (arrays['deltakp'][:,n,ispin][:,None] if smearing!=None else None)
+
+    # sum_qr e_pqr v_i v_r M^-1_jq for every (i,j,p), (27,snktot)
+    v = velkp[:,:,n,ispin].T
+    M_inv = arrays['d2Ed2k'][:,:,n,ispin][M_ind]
+    sig_hall = np.reshape(np.einsum('pqr,ik,rk,jqk->ijpk', eijk, v, v, M_inv), (27,snktot))
+
+    # tau**2 for every temperature, (nt,snktot,1)
+    tau2 = kq_wght*tau[:,:,n,ispin,None]**2
+
+    for i0 in range(0, esize, echunk):
+      es = slice(i0, min(i0+echunk,esize))
+      if smearing is None:
+        smearA = 1/(4*tw*(np.cosh((E_n-ene[es])/(2*tw))**2))
+      elif smearing == 'gauss':
+        smearA = gaussian(E_n, ene[es], delk)[None]
       elif smearing == 'm-p':
-        smearA = metpax(Eaux, ene, delk)
-    for i in range(3):
-      for j in range(3):
-        for p in range(3):
-          for q in range(3):
-            for r  in range(3):
-              sig_hall[i,j,p,:,n,ispin] += (int(Eijk(p,q,r))*velkp[:,i,n,ispin]*velkp[:,r,n,ispin]*M_inv[j,q,:,n,ispin])
-          L_hall[i,j,p,:] += np.sum(kq_wght*arrays['scattering_tau'][:,n,ispin]**2*sig_hall[i,j,p,:,n,ispin]*(smearA).T, axis=1)
+        smearA = metpax(E_n, ene[es], delk)[None]
+
+      # One batched GEMM per chunk for all temperatures and components
+      L_hall[...,es] += np.reshape(np.matmul(sig_hall, tau2*smearA), (nt,3,3,3,-1))
+
   return L_hall
@@ -20,12 +20,14 @@
 import numpy as np
 from mpi4py import MPI
 from .smearing import intmetpax
+from .do_eigh import eigh_stack
 
 comm = MPI.COMM_WORLD
 rank = comm.Get_rank()
 
-def E_Fermi ( Hksp, data_controller, parallel=False ):
+def E_Fermi ( Hksp, data_controller, parallel=False, tetrahedron=False ):
   # Calculate the Fermi energy using a braketing algorithm
+  # With tetrahedron=True, states are counted with the linear tetrahedron method instead of smearing
 
   arry,attr = data_controller.data_dicts()
 
@@ -37,8 +39,7 @@ def E_Fermi ( Hksp, data_controller, parallel=False ):
   Hksp = Hksp.reshape((nawf,nawf,snktot,nspin), order='C')
 
   for ispin in range(nspin):
-    for ik in range(snktot):
-      eig[:,ik,ispin] = np.linalg.eigvalsh(Hksp[:,:,ik,ispin])
+    eig[:,:,ispin] = eigh_stack(np.moveaxis(Hksp[...,ispin],2,0), attr['eigh_chunk'], eigvals_only=True).T
 
   if insulator:
     Efr = np.amax(eig[(nelec-1 if dftSO else nelec//2-1)])
@@ -49,6 +50,9 @@ def E_Fermi ( Hksp, data_controller, parallel=False ):
     else:
       return Efr
 
+  elif tetrahedron:
+    return E_Fermi_tetrahedron(eig[:nbnd], data_controller, parallel)
+
   else:
     Elw = 1.0e+8
     Eup = -1.0e+8
@@ -104,3 +108,40 @@ def E_Fermi ( Hksp, data_controller, parallel=False ):
         Eup = Ef
 
     return Ef
+
+
+def E_Fermi_tetrahedron ( eig, data_controller, parallel=False ):
+  # Bisection on the number of states from the linear tetrahedron method
+  from .do_tetrahedron import tetra_corners,all_eigenvalues,tetra_count
+
+  attr = data_controller.data_attributes
+
+  nelec = attr['nelec']
+  fac = 1 if attr['dftSO'] else 2
+
+  eig = np.ascontiguousarray(np.moveaxis(eig, 0, 1))
+  corners = tetra_corners(data_controller, distributed=parallel)
+  E_full = all_eigenvalues(data_controller, eig) if parallel else eig
+
+  def count ( E ):
+    N = np.array([fac*tetra_count(data_controller, corners, E_full, E)])
+    if parallel:
+      comm.Allreduce(MPI.IN_PLACE, N, op=MPI.SUM)
+    return N[0]
+
+  eps = 1.0e-10
+  Elw = np.amin(E_full) - eps
+  Eup = np.amax(E_full) + eps
+
+  maxiter = 100
+  for i in range(maxiter):
+    Ef = (Eup + Elw)/2
+    sumkmid = count(Ef)
+    if np.abs( sumkmid-nelec ) < eps:
+      break
+    elif sumkmid-nelec < -eps:
+      Elw = Ef
+    else:
+      Eup = Ef
+
+  return Ef
@@ -25,10 +25,11 @@ comm = MPI.COMM_WORLD
 rank = comm.Get_rank()
 
 def do_spin_Hall ( data_controller, twoD, do_ac ):
-  from .perturb_split import perturb_split
+  from .do_ibz import require_full_grid
   from .constants import ELECTRONVOLT_SI,ANGSTROM_AU,H_OVER_TPI,LL
 
   arry,attr = data_controller.data_dicts()
+  require_full_grid(data_controller, 'Spin Hall')
 
   s_tensor = arry['s_tensor']
 
@@ -44,34 +45,25 @@ def do_spin_Hall ( data_controller, twoD, do_ac ):
   if rank == 0 and attr['verbose']:
     print('Writing bxsf files for Spin Berry Curvature')
 
+  #-------------------------------------------------------------
+  # Spin Berry curvature of every component in one k-point sweep
+  #-------------------------------------------------------------
+  Om_znk,ene_ac,sig_ac = hall_sweep(data_controller, s_tensor, do_ac)
+
+  if twoD:
+    av0,av1 = arry['a_vectors'][0,:],arry['a_vectors'][1,:]
+    cgs_conv = 1./(np.linalg.norm(np.cross(av0,av1))*attr['alat']**2)
+  else:
+    cgs_conv = 1.0e8*ANGSTROM_AU*ELECTRONVOLT_SI**2/(H_OVER_TPI*attr['omega'])
+
   for n in range(s_tensor.shape[0]):
     ipol = s_tensor[n][0]
     jpol = s_tensor[n][1]
     spol = s_tensor[n][2]
-    #----------------------------------------------
-    # Compute the spin current operator j^l_n,m(k)
-    #----------------------------------------------
-    jdHksp = do_spin_current(data_controller, spol, ipol)
-
-    jksp_is = np.empty_like(jdHksp)
-    pksp_j = np.empty_like(jdHksp)
-
-    for ik in range(jdHksp.shape[0]):
-      for ispin in range(jdHksp.shape[3]):
-        jksp_is[ik,:,:,ispin],pksp_j[ik,:,:,ispin] = perturb_split(jdHksp[ik,:,:,ispin], arry['dHksp'][ik,jpol,:,:,ispin], arry['v_k'][ik,:,:,ispin], arry['degen'][ispin][ik])
-    jdHksp = None
 
-    #---------------------------------
-    # Compute spin Berry curvature... 
-    #---------------------------------
-    ene,shc,Om_k = do_Berry_curvature(data_controller, jksp_is, pksp_j)
+    ene,shc,Om_k = do_Berry_curvature(data_controller, Om_znk[n])
 
     if rank == 0:
-      if twoD:
-        av0,av1 = arry['a_vectors'][0,:],arry['a_vectors'][1,:]
-        cgs_conv = 1./(np.linalg.norm(np.cross(av0,av1))*attr['alat']**2)
-      else:
-        cgs_conv = 1.0e8*ANGSTROM_AU*ELECTRONVOLT_SI**2/(H_OVER_TPI*attr['omega'])
       shc *= cgs_conv
 
     cart_indices = (str(LL[spol]),str(LL[ipol]),str(LL[jpol]))
@@ -91,18 +83,7 @@ def do_spin_Hall ( data_controller, twoD, do_ac ):
     ene = shc = None
 
     if do_ac:
-
-      jdHksp = do_spin_current(data_controller, spol, ipol)
-
-      jksp_js = np.empty_like(jdHksp)
-      pksp_i = np.empty_like(jdHksp)
-
-      for ik in range(jdHksp.shape[0]):
-        for ispin in range(jdHksp.shape[3]):
-          jksp_js[ik,:,:,ispin],pksp_i[ik,:,:,ispin] = perturb_split(jdHksp[ik,:,:,ispin], arry['dHksp'][ik,jpol,:,:,ispin], arry['v_k'][ik,:,:,ispin], arry['degen'][ispin][ik])
-      jdHksp = None
-
-      ene,sigxy = do_ac_conductivity(data_controller, jksp_js, pksp_i, ipol, jpol)
+      ene,sigxy = do_ac_conductivity(data_controller, ene_ac, sig_ac[n])
       if rank == 0:
         sigxy *= cgs_conv
 
@@ -118,10 +99,11 @@ def do_spin_Hall ( data_controller, twoD, do_ac ):
 
 
 def do_anomalous_Hall ( data_controller, do_ac ):
-  from .perturb_split import perturb_split
+  from .do_ibz import require_full_grid
   from .constants import ELECTRONVOLT_SI,ANGSTROM_AU,H_OVER_TPI,LL
 
   arry,attr = data_controller.data_dicts()
+  require_full_grid(data_controller, 'Anomalous Hall')
 
   a_tensor = arry['a_tensor']
 
@@ -137,23 +119,18 @@ def do_anomalous_Hall ( data_controller, do_ac ):
   if rank == 0 and attr['verbose']:
     print('Writing bxsf files for Berry Curvature')
 
+  #--------------------------------------------------------
+  # Berry curvature of every component in one k-point sweep
+  #--------------------------------------------------------
+  Om_znk,ene_ac,sig_ac = hall_sweep(data_controller, a_tensor, do_ac)
+
+  cgs_conv = 1.0e8*ANGSTROM_AU*ELECTRONVOLT_SI**2/(H_OVER_TPI*attr['omega'])
+
   for n in range(a_tensor.shape[0]):
     ipol = a_tensor[n][0]
     jpol = a_tensor[n][1]
 
-    dks = arry['dHksp'].shape
-
-    pksp_i = np.zeros((dks[0],dks[2],dks[3],dks[4]),order="C",dtype=complex)
-    pksp_j = np.zeros_like(pksp_i)
-
-    for ik in range(dks[0]):
-      for ispin in range(dks[4]):
-        pksp_i[ik,:,:,ispin],pksp_j[ik,:,:,ispin] = perturb_split(arry['dHksp'][ik,ipol,:,:,ispin], arry['dHksp'][ik,jpol,:,:,ispin], arry['v_k'][ik,:,:,ispin], arry['degen'][ispin][ik])
-
-    ene,ahc,Om_k = do_Berry_curvature(data_controller, pksp_i, pksp_j)
-
-    if rank == 0:
-      cgs_conv = 1.0e8*ANGSTROM_AU*ELECTRONVOLT_SI**2/(H_OVER_TPI*attr['omega'])
+    ene,ahc,Om_k = do_Berry_curvature(data_controller, Om_znk[n])
 
     cart_indices = (str(LL[ipol]),str(LL[jpol]))
 
@@ -174,7 +151,7 @@ def do_anomalous_Hall ( data_controller, do_ac ):
     ene = ahc = None
 
     if do_ac:
-      ene,sigxy = do_ac_conductivity(data_controller, pksp_i, pksp_j, ipol, jpol)
+      ene,sigxy = do_ac_conductivity(data_controller, ene_ac, sig_ac[n])
       if rank == 0:
         sigxy *= cgs_conv
 
@@ -188,93 +165,200 @@ def do_anomalous_Hall ( data_controller, do_ac ):
       fsigR = 'MCDr_%s%s.dat'%cart_indices
       data_controller.write_file_row_col(fsigR, ene, sigxyr)
 
-def do_Berry_curvature ( data_controller, jksp, pksp ):
+
+def hall_sweep ( data_controller, tensor, do_ac ):
+  '''
+  Berry curvature of every state, and optionally the ac conductivity, for all requested
+  tensor components in a single sweep over the k-points. In each k chunk the velocity
+  (and spin current) operators are projected on the bands once and shared by all the
+  components, only the rotation of the degenerate subspaces depends on the component.
+
+  Arguments:
+      data_controller (DataController): Data controller with 'dHksp', 'v_k', 'E_k' and 'degen' ('Sj' for spin currents)
+      tensor (ndarray): Components [ipol,jpol] of the Berry curvature, or [ipol,jpol,spol] of the spin Berry curvature
+      do_ac (bool): If True the local ac conductivity of each component is also computed
+
+  Returns:
+      (Om_znk, ene, sigxy): Berry curvatures (ncomp,snktot,nbnd), and the energies and local ac conductivities (ncomp,esize), which are None without do_ac
+  '''
+  from .perturb_split import rotate_degenerate
+
+  arry,attr = data_controller.data_dicts()
+
+  tensor = np.asarray(tensor)
+  ncomp = tensor.shape[0]
+  spin = tensor.shape[1] == 3
+  snktot,nawf,nbnd,nspin = arry['v_k'].shape
+
+  # Cartesian directions of the velocities, and (spin,direction) pairs of the spin currents
+  dirs = sorted(set(tensor[:,:2].ravel()))
+  scur = (sorted(set(zip(tensor[:,2],tensor[:,0]))) if spin else [])
+
+  Om_znk = np.empty((ncomp,snktot,nbnd), dtype=float)
+
+  ene = sigxy = None
+  if do_ac:
+    ### Hardcode 'de'
+    ene = np.linspace(0., attr['shift'], 501)
+    sigxy = np.zeros((ncomp,ene.size), dtype=complex)
+
+  deltap = 0.05
+  for ks in data_controller.k_chunks(snktot):
+    v_k = arry['v_k'][ks,:,:,0]
+    vH = np.conj(np.swapaxes(v_k,1,2))
+
+    # v^dagger dH_l v, and v^dagger (S dH_l + dH_l S) v / 2 = ((S v)^dagger dH_l v + (dH_l v)^dagger S v) / 2
+    dHv = {l:arry['dHksp'][ks,l,:,:,0]@v_k for l in dirs}
+    pks = {l:vH@dHv[l] for l in dirs}
+    jks = {}
+    for s,l in scur:
+      Sv = arry['Sj'][s]@v_k
+      jks[(s,l)] = 0.5*(np.conj(np.swapaxes(Sv,1,2))@dHv[l] + np.conj(np.swapaxes(dHv[l],1,2))@Sv)
+    dHv = Sv = vH = v_k = None
+
+    E_k = arry['E_k'][ks,:,0]
+    E_nm = (E_k[:,None,:] - E_k[:,:,None])**2 + deltap**2
+    E_nm[np.where(E_nm<1.e-4)] = np.inf
+
+    F_nm = (np.empty((ncomp,)+E_nm.shape, dtype=float) if do_ac else None)
+    for n in range(ncomp):
+      ipol,jpol = tensor[n][0],tensor[n][1]
+      jksp = np.copy(jks[(tensor[n][2],ipol)] if spin else pks[ipol])
+      pksp = np.copy(pks[jpol])
+      rotate_degenerate(jksp, [pksp], arry['degen'][0][ks])
+
+      Om_znk[n,ks] = -2.0*np.sum(np.imag(jksp*np.swapaxes(pksp,1,2))/E_nm, axis=2)
+      if do_ac:
+        F_nm[n] = np.imag(pksp*np.swapaxes(jksp,1,2))
+    jksp = pksp = pks = jks = E_nm = None
+
+    if do_ac:
+      sigxy += smear_sigma_loop(data_controller, ene, ks, F_nm, 0)
+    F_nm = None
+
+  if do_ac:
+    sigxy = np.nan_to_num(sigxy)
+
+  return Om_znk, ene, sigxy
+
+
+# Occupations are 0 or 1 to machine precision beyond SMEAR_CUT smearing widths
+SMEAR_CUT = 8.
+
+def occupation ( E, ene, smearing, delta ):
+  from .smearing import intgaussian, intmetpax
+
+  # Occupation of states with energies E at the energy (or energies) ene
+  if smearing == 'gauss':
+    return intgaussian(E, ene, delta)
+  elif smearing == 'm-p':
+    return intmetpax(E, ene, delta)
+  else:
+    return 0.5 * (-np.sign(E-ene) + 1)
+
+def occupied_sum ( E, Om, ene, smearing, delta, echunk ):
+  '''
+  Sum of a quantity over the states occupied up to each energy
+
+  Arguments:
+      E (ndarray): Eigenvalues (nk,nbnd)
+      Om (ndarray): Quantity for each state (nk,nbnd)
+      ene (ndarray): Energies of the scan
+      smearing (str): 'gauss', 'm-p', or None for the step function
+      delta (ndarray): Smearing widths (nk,nbnd), for 'gauss' and 'm-p'
+      echunk (int): Number of energies evaluated together in the smeared scan
+
+  Returns:
+      Sum over the states of Om times their occupation, for every energy in ene
+  '''
+  # States sorted by energy, and the running sum of Om below each of them
+  order = np.argsort(E, axis=None)
+  E,Om = E.ravel()[order],Om.ravel()[order]
+  cum = np.concatenate(([0.],np.cumsum(Om)))
+
+  if smearing != 'gauss' and smearing != 'm-p':
+    # Step function, with occupation 1/2 at the energy itself
+    lo = np.searchsorted(E, ene, side='left')
+    hi = np.searchsorted(E, ene, side='right')
+    return cum[lo] + 0.5*(cum[hi]-cum[lo])
+
+  # Only the states within SMEAR_CUT widths of a chunk of energies need the smearing function
+  delta = delta.ravel()[order]
+  width = SMEAR_CUT*np.amax(delta) if delta.size else 0.
+  scan = np.empty(ene.size, dtype=float)
+  for i0 in range(0, ene.size, echunk):
+    es = ene[i0:i0+echunk]
+    lo = np.searchsorted(E, np.amin(es)-width, side='left')
+    hi = np.searchsorted(E, np.amax(es)+width, side='right')
+    scan[i0:i0+es.size] = cum[lo] + occupation(E[None,lo:hi], es[:,None], smearing, delta[None,lo:hi]) @ Om[lo:hi]
+
+  return scan
+
+def do_Berry_curvature ( data_controller, Om_znkaux ):
   #----------------------
   # Compute spin Berry curvature
   #----------------------
   from .communication import gather_full
-  from .smearing import intgaussian, intmetpax
 
   arrays,attributes = data_controller.data_dicts()
 
-  snktot,nawf,_,nspin = pksp.shape
   fermi_up,fermi_dw = attributes['fermi_up'],attributes['fermi_dw']
   nk1,nk2,nk3 = attributes['nk1'],attributes['nk2'],attributes['nk3']
-
-  # Compute only Omega_z(k)
-  Om_znkaux = np.zeros((snktot,nawf), dtype=float)
-
-  deltap = 0.05
-  for ik in range(snktot):
-    E_nm = (arrays['E_k'][ik,:,0] - arrays['E_k'][ik,:,0][:,None])**2 + deltap**2
-    E_nm[np.where(E_nm<1.e-4)] = np.inf
-    Om_znkaux[ik] = -2.0*np.sum(np.imag(jksp[ik,:,:,0]*pksp[ik,:,:,0].T)/E_nm, axis=1)
-  E_nm = None
+  smearing = attributes['smearing']
 
   attributes['emaxH'] = np.amin(np.array([attributes['shift'],attributes['emaxH']]))
-  ### Hardcoded 'de'
-  esize = 500
+  esize = attributes['neH']
   ene = np.linspace(attributes['eminH'], attributes['emaxH'], esize)
 
-  Om_zkaux = np.zeros((snktot,esize), dtype=float)
+  E_k = arrays['E_k'][:,:,0]
+  deltakp = (arrays['deltakp'][:,:,0] if smearing == 'gauss' or smearing == 'm-p' else None)
 
-  for i in range(esize):
-    if attributes['smearing'] == 'gauss':
-      Om_zkaux[:,i] = np.sum((Om_znkaux[:,:]*intgaussian(arrays['E_k'][:,:,0],ene[i],arrays['deltakp'][:,:,0])), axis=1)
-    elif attributes['smearing'] == 'm-p':
-      Om_zkaux[:,i] = np.sum(Om_znkaux[:,:]*intmetpax(arrays['E_k'][:,:,0],ene[i],arrays['deltakp'][:,:,0]), axis=1)
-    else:
-      Om_zkaux[:,i] = np.sum(Om_znkaux[:,:]*(0.5 * (-np.sign(arrays['E_k'][:,:,0]-ene[i]) + 1)), axis=1)
+  # Berry curvature of the occupied states as a function of the energy
+  shc_aux = occupied_sum(E_k, Om_znkaux, ene, smearing, deltakp, attributes['e_chunk'])
 
-  Om_zk = gather_full(Om_zkaux, attributes['npool'])
-  Om_zkaux = None
+  shc = (np.zeros(esize, dtype=float) if rank==0 else None)
+  comm.Reduce(shc_aux, shc, op=MPI.SUM)
+  shc_aux = None
 
-  shc = None
   if rank == 0:
-    shc = np.sum(Om_zk, axis=0)/float(attributes['nkpnts'])
+    shc /= float(attributes['nkpnts'])
 
   n0 = 0
   n = esize-1
+  for i in range(esize-1):
+    if ene[i] <= fermi_dw and ene[i+1] >= fermi_dw:
+      n0 = i
+    if ene[i] <= fermi_up and ene[i+1] >= fermi_up:
+      n = i
+
+  # Omega_z(k) of the states between the energies bracketing fermi_dw and fermi_up
+  Om_zkaux = np.sum(Om_znkaux*(occupation(E_k,ene[n],smearing,deltakp)-occupation(E_k,ene[n0],smearing,deltakp)), axis=1, keepdims=True)
+  Om_zk = gather_full(Om_zkaux, attributes['npool'])
+  Om_zkaux = None
+
   if rank == 0:
-    for i in range(esize-1):
-      if ene[i] <= fermi_dw and ene[i+1] >= fermi_dw:
-        n0 = i
-      if ene[i] <= fermi_up and ene[i+1] >= fermi_up:
-        n = i
-    Om_zk = np.reshape(Om_zk, (nk1,nk2,nk3,esize), order='C')
-    Om_zk = Om_zk[:,:,:,n]-Om_zk[:,:,:,n0]
+    Om_zk = np.reshape(Om_zk, (nk1,nk2,nk3), order='C')
 
   return(ene, shc, Om_zk)
 
-def do_ac_conductivity ( data_controller, jksp, pksp, ipol, jpol ):
-  from .communication import gather_full
-  from .smearing import intgaussian, intmetpax
+def do_ac_conductivity ( data_controller, ene, sigxy_aux ):
 
   arry,attr = data_controller.data_dicts()
 
-  # Compute the optical conductivity tensor sigma_xy(ene)
-
-  ispin = 0
+  # Sum the optical conductivity tensor sigma_xy(ene) over the ranks
 
-  emin = 0.0
-  emax = attr['shift']
-  ### Hardcode 'de'
-  esize = 501
-  ene = np.linspace(emin, emax, esize)
-
-  sigxy_aux = smear_sigma_loop(data_controller, ene, jksp, pksp, ispin, ipol, jpol)
+  esize = ene.size
 
-  sigxy = (np.zeros((esize),dtype=complex) if rank==0 else None)
   sigxyR = (np.zeros((esize),dtype=float) if rank==0 else None)
   sigxyI = (np.zeros((esize),dtype=float) if rank==0 else None)
-  
+
   sigxy_auxR = np.ascontiguousarray(np.real(sigxy_aux))
   sigxy_auxI = np.ascontiguousarray(np.imag(sigxy_aux))
-  
+
   comm.Reduce(sigxy_auxR, sigxyR, op=MPI.SUM)
   comm.Reduce(sigxy_auxI, sigxyI, op=MPI.SUM)
 
-  sigxy_aux = sigxy_auxR = sigxy_auxI = None
+  sigxy_auxR = sigxy_auxI = None
 
   if rank == 0:
     sigxy = (sigxyR+1j*sigxyI)/float(attr['nkpnts'])
@@ -282,62 +366,57 @@ def do_ac_conductivity ( data_controller, jksp, pksp, ipol, jpol ):
   else:
     return(None, None)
 
-def smear_sigma_loop ( data_controller, ene, pksp_i, pksp_j, ispin, ipol, jpol ):
+def smear_sigma_loop ( data_controller, ene, ks, F_nm, ispin ):
+  '''
+  Local ac conductivity of a chunk of k-points, for several tensor components at once
+
+  Arguments:
+      data_controller (DataController): Data controller with 'E_k' and 'deltakp' (or 'delta' without smearing)
+      ene (ndarray): Energies
+      ks (slice): k-points of the chunk
+      F_nm (ndarray): Im(p^j_nm p^i_mn) of each component, (ncomp,nks,nbnd,nbnd)
+      ispin (int): Spin component
+
+  Returns:
+      The contribution of the chunk to sigma(ene), (ncomp,esize)
+  '''
+  from scipy.special import expit
   from .smearing import intgaussian,intmetpax
+  from .do_adaptive_smearing import pair_smearing
 
   arry,attr = data_controller.data_dicts()
 
   esize = ene.size
-  sigxy = np.zeros((esize), dtype=complex)
-
-  snktot,nawf,_,nspin = pksp_j.shape
-  f_nm = np.zeros((snktot,nawf,nawf), dtype=float)
-  E_diff_nm = np.zeros((snktot,nawf,nawf), dtype=float)
+  ncomp,_,nawf,_ = F_nm.shape
+  smearing = attr['smearing']
 
   Ef = 0.0
   eps = 1.0e-16
-  delta = 0.05
 
-  if attr['smearing'] == None:
-    fn = 1.0/(np.exp(arry['E_k'][:,:,ispin]/attr['temp'])+1)
-  elif attr['smearing'] == 'gauss':
-    fn = intgaussian(arry['E_k'][:,:,ispin], Ef, arry['deltakp'][:,:,ispin])
+  E_k = arry['E_k'][ks,:,ispin]
+  if smearing == None:
+    fn = expit(-E_k/attr['temp'])
+  elif smearing == 'gauss':
+    fn = intgaussian(E_k, Ef, arry['deltakp'][ks,:,ispin])
   elif smearing == 'm-p':
-    fn = intmetpax(arry['E_k'][:,:,ispin], Ef, arry['deltakp'][:,:,ispin]) 
-
-  # Collapsing the sum over k points
-  for n in range(nawf):
-    for m in range(nawf):
-      if m != n:
-        E_diff_nm[:,n,m] = (arry['E_k'][:,n,ispin]-arry['E_k'][:,m,ispin])**2
-        f_nm[:,n,m] = (fn[:,n] - fn[:,m])*np.imag(pksp_j[:,n,m,ispin]*pksp_i[:,m,n,ispin])
+    fn = intmetpax(E_k, Ef, arry['deltakp'][ks,:,ispin])
 
+  # Occupation factors and transition energies are shared by all components
+  F_nm = np.reshape(F_nm*(fn[:,:,None]-fn[:,None,:]), (ncomp,-1))
+  E_diff_nm = np.reshape((E_k[:,:,None]-E_k[:,None,:])**2, (-1,1))
   fn = None
 
-  for e in range(esize):
-    if attr['smearing'] != None:
-      sigxy[e] = np.sum(f_nm[:,:,:]/(E_diff_nm[:,:,:]-(ene[e]+1.j*arry['deltakp2'][:,:nawf,:nawf,ispin])**2+eps))
-    else:
-      sigxy[e] = np.sum(f_nm[:,:,:]/(E_diff_nm[:,:,:]-(ene[e]+1.j*arry['delta'])**2+eps))
-
-  F_nm = None
-  E_diff_nm = None
-
-  return np.nan_to_num(sigxy)
-
-def do_spin_current ( data_controller, spol, ipol ):
-
-  arry,attr = data_controller.data_dicts()
-
-  Sj = arry['Sj'][spol]
-  bnd = attr['bnd']
-  snktot,_,nawf,nawf,nspin = arry['dHksp'].shape
-
-  jdHksp = np.empty((snktot,nawf,nawf,nspin), dtype=complex)
+  if smearing != None:
+    delta = np.reshape(pair_smearing(data_controller, ks, ispin)[:,:nawf,:nawf], (-1,1))
+  else:
+    delta = attr['delta']
 
-  for ispin in range(nspin):
-    for ik in range(snktot):
-      jdHksp[ik,:,:,ispin] = 0.5*(np.dot(Sj,arry['dHksp'][ik,ipol,:,:,ispin])+np.dot(arry['dHksp'][ik,ipol,:,:,ispin],Sj))
+  # Each complex (transition,energy) block holds at most 'e_chunk_bytes'
+  echunk = max(1, attr['e_chunk_bytes']//(16*E_diff_nm.shape[0]))
 
-  return jdHksp
+  sigxy = np.zeros((ncomp,esize), dtype=complex)
+  for i0 in range(0, esize, echunk):
+    es = slice(i0, min(i0+echunk,esize))
+    sigxy[:,es] = F_nm @ (1./(E_diff_nm-(ene[es]+1.j*delta)**2+eps))
 
+  return sigxy
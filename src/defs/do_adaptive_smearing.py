@@ -29,30 +29,50 @@ def do_adaptive_smearing ( data_controller, smearing ):
 
   a_vectors = arrays['a_vectors']
 
-  nawf = attributes['nawf']
+  nawf = arrays['pksp'].shape[2]
   nspin = attributes['nspin']
   nkpnts = attributes['nkpnts']
   npks = arrays['pksp'].shape[0]
 
-  diag = np.diag_indices(nawf)
-
   dk = (8.*np.pi**3/attributes['omega']/(nkpnts))**(1./3.)
 
   afac = (1. if smearing=='m-p' else .7)
 
-## DEV: Try to make contiguinuity conditional. Requires benchmark testing
-  pksaux = np.ascontiguousarray(arrays['pksp'][:,:,diag[0],diag[1]])
+  # Widths of the band pairs are computed on demand by pair_smearing
+  attributes['deltakp2_fac'] = afac*dk
 
-  deltakp = np.zeros((npks,nawf,nspin), dtype=float)
-  deltakp2 = np.zeros((npks,nawf,nawf,nspin), dtype=float)
-  for n in range(nawf):
-    deltakp[:,n] = norm(np.real(pksaux[:,:,n]), axis=1)
-    for m in range(nawf):
-      deltakp2[:,n,m,:] = norm(pksaux[:,:,n,:]-pksaux[:,:,m,:], axis=1)
+  deltakp = np.empty((npks,nawf,nspin), dtype=float)
+  for ks in data_controller.k_chunks(npks):
+    pdiag = np.diagonal(arrays['pksp'][ks], axis1=2, axis2=3)
+    deltakp[ks] = np.moveaxis(norm(np.real(pdiag), axis=1), 2, 1)
+  pdiag = None
 
-  pksaux = None
   deltakp *= afac*dk
-  deltakp2 *= afac*dk
+
+  # Band velocities vanishing exactly (e.g. at Gamma) would give 0/0 in the smearing functions
+  deltakp[deltakp==0.] = np.finfo(float).eps
 
   arrays['deltakp'] = deltakp
-  arrays['deltakp2'] = deltakp2
+
+
+def pair_smearing ( data_controller, ks, ispin ):
+  '''
+  Adaptive smearing widths of the band pairs, |v_n - v_m| times the factor of deltakp,
+  computed from the diagonal momenta for a chunk of k-points
+
+  Arguments:
+      data_controller (DataController): Data controller with 'pksp', after do_adaptive_smearing
+      ks (slice): k-points of the chunk
+      ispin (int): Spin component
+
+  Returns:
+      Widths (nks,nbnd,nbnd)
+  '''
+  from numpy.linalg import norm
+  import numpy as np
+
+  arrays,attributes = data_controller.data_dicts()
+
+  pdiag = np.diagonal(arrays['pksp'][ks,:,:,:,ispin], axis1=2, axis2=3)
+
+  return attributes['deltakp2_fac']*norm(pdiag[:,:,:,None]-pdiag[:,:,None,:], axis=1)
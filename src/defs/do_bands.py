@@ -23,6 +23,7 @@ from scipy import linalg as spl
 from numpy import linalg as npl
 
 def bands_calc ( data_controller ):
+  from .do_eigh import eigh_stack
   from .communication import scatter_full, gather_full
 
   arrays,attributes = data_controller.data_dicts()
@@ -34,39 +35,36 @@ def bands_calc ( data_controller ):
  
   Hks_aux = band_loop_H(data_controller, kq_aux)
   
+  chunk = attributes['eigh_chunk']
+  nksize = kq_aux.shape[1]
+
   if np.iscomplex(arrays['kq']).any():
-    E_kp_aux = np.zeros((kq_aux.shape[1],nawf,nspin), dtype=complex, order="C")
+    E_kp_aux = np.zeros((nksize,nawf,nspin), dtype=complex, order="C")
   else:
-    E_kp_aux = np.zeros((kq_aux.shape[1],nawf,nspin), dtype=float, order="C")
-  v_kp_aux = np.zeros((kq_aux.shape[1],nawf,nawf,nspin), dtype=complex, order="C")
+    E_kp_aux = np.zeros((nksize,nawf,nspin), dtype=float, order="C")
+  v_kp_aux = np.zeros((nksize,nawf,nawf,nspin), dtype=complex, order="C")
 
   for ispin in range(nspin):
-    for ik in range(kq_aux.shape[1]):
-      if np.iscomplex(arrays['kq']).any():
-        E_kp_aux[ik,:,ispin],v_kp_aux[ik,:,:,ispin] = spl.eig(Hks_aux[:,:,ik,ispin], b=(None), overwrite_a=True, overwrite_b=True, check_finite=True)
-      else:
-        E_kp_aux[ik,:,ispin],v_kp_aux[ik,:,:,ispin] = spl.eigh(Hks_aux[:,:,ik,ispin], b=(None), lower=False, overwrite_a=True, overwrite_b=True, turbo=True, check_finite=True)
+    Hk = np.moveaxis(Hks_aux[...,ispin], 2, 0)
+    if np.iscomplex(arrays['kq']).any():
+      for ik in range(0, nksize, chunk):
+        ek = min(ik+chunk, nksize)
+        E_kp_aux[ik:ek,:,ispin],v_kp_aux[ik:ek,:,:,ispin] = npl.eig(Hk[ik:ek])
+    else:
+      E_kp_aux[:,:,ispin],v_kp_aux[...,ispin] = eigh_stack(Hk, chunk)
 
   Hks_aux = Sks_aux = None
   return E_kp_aux, v_kp_aux
 
 
 def band_loop_H ( data_controller, kq_aux ):
+  from .sparse_HRs import sparse_HRs,sparse_Hk
 
   arrays,attributes = data_controller.data_dicts()
 
-  nksize = kq_aux.shape[1]
-  nawf,_,nk1,nk2,nk3,nspin = arrays['HRs'].shape
-
-  HRs = np.reshape(arrays['HRs'], (nawf,nawf,nk1*nk2*nk3,nspin), order='C')
-  kdot = np.tensordot(arrays['R'], 2.0j*np.pi*kq_aux, axes=([1],[0]))
-  np.exp(kdot, kdot)
-  Haux = np.zeros((nawf,nawf,nksize,nspin), dtype=complex, order="C")
-
-  for ispin in range(nspin):
-    Haux[...,ispin] = np.tensordot(HRs[...,ispin], kdot, axes=([2],[0]))
+  R,HRc = sparse_HRs(data_controller, arrays['HRs'])
 
-  return Haux
+  return sparse_Hk(R, HRc, kq_aux, attributes['phase_cache_bytes'])
 
 
 def do_bands ( data_controller ):
@@ -327,6 +327,7 @@ def do_phase (data_controller):
     return ret
 
 def bands_calc ( data_controller ):
+  from .do_eigh import eigh_stack
   from .communication import scatter_full, gather_full
 
   arry,attr = data_controller.data_dicts()
@@ -342,8 +343,7 @@ def bands_calc ( data_controller ):
   v_kp_aux = np.zeros((kq_aux.shape[1],nawf,nawf,nspin), dtype=complex, order="C")
 
   for ispin in range(nspin):
-    for ik in range(kq_aux.shape[1]):
-      E_kp_aux[ik,:,ispin],v_kp_aux[ik,:,:,ispin] = la.eigh(Hks_aux[:,:,ik,ispin], b=(None), lower=False, overwrite_a=True, overwrite_b=True, turbo=True, check_finite=True)
+    E_kp_aux[:,:,ispin],v_kp_aux[...,ispin] = eigh_stack(np.moveaxis(Hks_aux[...,ispin],2,0), attr['eigh_chunk'])
 
   arry['berry_Hks'] = Hks_aux
 
@@ -352,22 +352,13 @@ def bands_calc ( data_controller ):
 
 
 def band_loop_H ( data_controller, kq_aux ):
+  from .sparse_HRs import sparse_HRs,sparse_Hk
 
   arry,attr = data_controller.data_dicts()
 
-  nksize = kq_aux.shape[1]
-  nawf,_,nk1,nk2,nk3,nspin = arry['HRs'].shape
-
-  HRs = np.reshape(arry['HRs'], (nawf,nawf,nk1*nk2*nk3,nspin), order='C')
-  kdot = np.tensordot(arry['R'], 2.0j*np.pi*kq_aux, axes=([1],[0]))
-  np.exp(kdot, kdot)
-  Haux = np.zeros((nawf,nawf,nksize,nspin), dtype=complex, order="C")
-
-  for ispin in range(nspin):
-    Haux[:,:,:,ispin] = np.tensordot(HRs[:,:,:,ispin], kdot, axes=([2],[0]))
+  R,HRc = sparse_HRs(data_controller, arry['HRs'])
 
-  kdot  = None
-  return Haux
+  return sparse_Hk(R, HRc, kq_aux, attr['phase_cache_bytes'])
 
 def do_berry_bands ( data_controller ):
   from mpi4py import MPI
@@ -24,7 +24,7 @@ rank = comm.Get_rank()
 
 ### Reformat
 def build_Hks ( data_controller ):
-  from scipy import linalg as spl
+  from .communication import load_balancing, gather_array
 
   arrays,attributes = data_controller.data_dicts()
 
@@ -35,55 +35,61 @@ def build_Hks ( data_controller ):
   nkpnts = attributes['nkpnts']
   shift_type = attributes['shift_type']
 
+  if shift_type not in (0, 1, 2):
+    if rank == 0:
+      print('\'shift_type\' Not Recognized')
+    comm.Abort()
+
   U = arrays['U'] 
   my_eigsmat = arrays['my_eigsmat']
 
-  Hksaux = np.zeros((nawf,nawf,nkpnts,nspin), dtype=complex)
-  Hks = np.zeros((nawf,nawf,nkpnts,nspin), dtype=complex)
-
-  for ik in range(nkpnts):
-    for ispin in range(nspin):
-      my_eigs = my_eigsmat[:,ik,ispin]
-
-      #Building the Hamiltonian matrix
-      E = np.diag(my_eigs)
-      UU = np.transpose(U[:,:,ik,ispin]) #transpose of U. Now the columns of UU are the eigenvector of length nawf
-      norms = 1./np.sqrt(np.real(np.sum(np.conj(UU)*UU,axis=0)))
-      UU[:,:nawf] = UU[:,:nawf]*norms[:nawf]
-
-      # Choose only the eigenvalues that are below the energy shift
-      bnd_ik = 0
-      for n in range(bnd):
-        if my_eigs[n] <= eta:
-          bnd_ik += 1
-      if bnd_ik == 0:
-        if rank == 0:
-          print('No Eigenvalues in the selected energy range')
-        comm.Abort()
-      ac = UU[:,:bnd_ik]  # filtering: bnd is defined by the projectabilities
-      ee1 = E[:bnd_ik,:bnd_ik]
-      if shift_type == 0:
-        #option 1 (PRB 2013)
-        Hksaux[:,:,ik,ispin] = ac.dot(ee1).dot(np.conj(ac).T) + eta*(np.identity(nawf)-ac.dot(np.conj(ac).T))
-
-      elif shift_type == 1:
-        #option 2 (PRB 2016)
-        aux_p=spl.inv(np.dot(np.conj(ac).T,ac))
-        Hksaux[:,:,ik,ispin] = ac.dot(ee1).dot(np.conj(ac).T) + eta*(np.identity(nawf)-ac.dot(aux_p).dot(np.conj(ac).T))
-
-      elif shift_type == 2:
-        # no shift
-        Hksaux[:,:,ik,ispin] = ac.dot(ee1).dot(np.conj(ac).T)
-
-      else:
-        if rank == 0:
-          print('\'shift_type\' Not Recognized')
-        comm.Abort()
-
-      # Enforce Hermiticity (just in case...)
-      Hksaux[:,:,ik,ispin] = 0.5*(Hksaux[:,:,ik,ispin] + np.conj(Hksaux[:,:,ik,ispin].T))
-      Hks = Hksaux
-  return Hks
+  # Each rank builds the Hamiltonian on its own block of k-points
+  ini_ik,end_ik = load_balancing(comm.Get_size(), rank, nkpnts)
+
+  # Columns of ac are the projected eigenvectors of length nawf, (nk,nspin,nawf,bnd)
+  UU = np.transpose(U[:,:,ini_ik:end_ik], axes=(2,3,1,0))
+  norms = 1./np.sqrt(np.real(np.sum(np.conj(UU)*UU, axis=2)))
+  norms[...,nawf:] = 1.
+  ac = UU[...,:bnd]*norms[...,None,:bnd]
+  UU = norms = None
+
+  # Choose only the eigenvalues that are below the energy shift
+  # filtering: bnd is defined by the projectabilities
+  my_eigs = np.transpose(my_eigsmat[:bnd,ini_ik:end_ik], axes=(1,2,0))
+  mask = my_eigs <= eta
+  if comm.allreduce(np.any(np.sum(mask,axis=2)==0), op=MPI.LOR):
+    if rank == 0:
+      print('No Eigenvalues in the selected energy range')
+    comm.Abort()
+  ac *= mask[...,None,:]
+  acH = np.conj(np.swapaxes(ac, 2, 3))
+
+  Hksaux = (ac*np.where(mask,my_eigs,0.)[...,None,:]) @ acH
+
+  if shift_type == 0:
+    #option 1 (PRB 2013)
+    Hksaux += eta*(np.identity(nawf) - ac@acH)
+
+  elif shift_type == 1:
+    #option 2 (PRB 2016)
+    # Filtered bands have zero columns in ac, and unit diagonal in the overlap so it stays invertible
+    aux_p = acH@ac
+    dinds = np.diag_indices(bnd)
+    aux_p[...,dinds[0],dinds[1]] += ~mask
+    Hksaux += eta*(np.identity(nawf) - ac@np.linalg.solve(aux_p,acH))
+
+  # Enforce Hermiticity (just in case...)
+  Hksaux = 0.5*(Hksaux + np.conj(np.swapaxes(Hksaux, 2, 3)))
+  ac = acH = None
+
+  Hks = np.zeros((nkpnts,nspin,nawf,nawf), dtype=complex) if rank==0 else None
+  gather_array(Hks, np.ascontiguousarray(Hksaux))
+  Hksaux = None
+  if rank != 0:
+    Hks = np.empty((nkpnts,nspin,nawf,nawf), dtype=complex)
+  comm.Bcast(Hks)
+
+  return np.ascontiguousarray(np.transpose(Hks, axes=(2,3,0,1)))
 
 
 def do_build_pao_hamiltonian ( data_controller ):
@@ -138,7 +144,7 @@ def do_build_pao_hamiltonian ( data_controller ):
     
 
 def do_Hks_to_HRs ( data_controller ):
-  from scipy import fftpack as FFT
+  from .fft_backend import ifftn
 
   arry,attr = data_controller.data_dicts()
 
@@ -149,4 +155,4 @@ def do_Hks_to_HRs ( data_controller ):
   if rank == 0:
     # Original k grid to R grid
     arry['HRs'] = np.zeros_like(arry['Hks'])
-    arry['HRs'] = FFT.ifftn(arry['Hks'], axes=[2,3,4])
+    arry['HRs'] = ifftn(arry['Hks'], axes=[2,3,4])
@@ -33,10 +33,7 @@ comm=MPI.COMM_WORLD
 rank = comm.Get_rank()
 size = comm.Get_size()
 
-try:
-    from cuda_fft import *
-except: pass
-from scipy import fftpack as FFT
+from .fft_backend import fftn
 
 
 def do_d2Hd2k_ij(Hksp,Rfft,alat,npool,v_kp,bnd,degen):
@@ -87,9 +84,8 @@ def do_d2Hd2k_ij(Hksp,Rfft,alat,npool,v_kp,bnd,degen):
         RIJ = Rfft[ipol]*Rfft[jpol]
 
         for ispin in range(d2Hksp.shape[4]):
-            for n in range(d2Hksp.shape[0]):                
-                # because of the way this is coded...Hksp is actually HR*1.0j*alat
-                d2Hksp[n,:,:,:,ispin] = FFT.fftn(RIJ*Hksp[n,:,:,:,ispin]*1.0j*alat)
+            # because of the way this is coded...Hksp is actually HR*1.0j*alat
+            d2Hksp[...,ispin] = fftn(RIJ*Hksp[...,ispin]*1.0j*alat, axes=(1,2,3))
 
         #############################################################################################
         #############################################################################################
@@ -106,17 +102,14 @@ def do_d2Hd2k_ij(Hksp,Rfft,alat,npool,v_kp,bnd,degen):
 
         #find non-degenerate set of psi(k) for d2H/d2k_ij
         for ispin in range(tksp.shape[3]):
-            isp_tmp=[]
-            for ik in range(tksp.shape[2]):
+            tks,_,dvec = perturb_split_stack(np.moveaxis(d2Hksp[...,ispin],2,0), None,
+                                             v_kp[:,:,:,ispin], degen[ispin], return_v_k=True)
+            tksp[...,ispin] = np.moveaxis(tks,0,2)
 
-                # we save dvec so that it can be used when calculating the second term in d2E/d2k
-                tksp[:,:,ik,ispin],_,dvec = perturb_split(d2Hksp[:,:,ik,ispin],
-                                                          d2Hksp[:,:,ik,ispin],
-                                                          v_kp[ik,:,:,ispin],
-                                                          degen[ispin][ik],return_v_k=True)
-
-                isp_tmp.append(dvec)
+            # we save dvec so that it can be used when calculating the second term in d2E/d2k
+            isp_tmp = [(dvec[ik] if len(degen[ispin][ik]) else np.array([[]])) for ik in range(tksp.shape[2])]
             dir_tmp.append(isp_tmp)
+            tks = dvec = None
         dvec_list.append(dir_tmp)
 
         
@@ -61,7 +61,7 @@ def calc_N(data_controller,ene,dos, mu, temp, dosweight=2.):
   else:
     occ = FD(ene, mu, temp)
   dos_occ = dos*occ
-  return -dosweight * scipy.integrate.simps(dos_occ,ene)-core_electrons
+  return -dosweight * scipy.integrate.simpson(dos_occ, x=ene)-core_electrons
   
 def solve_for_mu(data_controller,ene,dos,N0,temp,refine=False,try_center=False,dosweight=2.):
 
@@ -125,12 +125,14 @@ def solve_for_mu(data_controller,ene,dos,N0,temp,refine=False,try_center=False,d
            mu = result.x
     return mu
 
-def do_doping( data_controller, temps, ene, fname ):
+def do_doping( data_controller, temps, ene, fname, tetrahedron=False ):
 
   arry,attr = data_controller.data_dicts()
   temp_conv,omega_conv = 11604.52500617,1.481847093e-25
 
-  if attr['smearing'] is None:
+  if tetrahedron:
+    dos = arry['dostet']
+  elif attr['smearing'] is None:
     dos = arry['dos']
   else:
     dos = arry['dosdk']
@@ -24,6 +24,7 @@ comm = MPI.COMM_WORLD
 rank = comm.Get_rank()
 
 def do_dos ( data_controller, emin, emax, ne, delta ):
+  from .do_ibz import k_multiplicity
 
   arry,attr = data_controller.data_dicts()
   bnd = attr['bnd']
@@ -32,6 +33,7 @@ def do_dos ( data_controller, emin, emax, ne, delta ):
   arry['dos'] = np.empty((ne,), dtype=float)
   # DOS calculation with gaussian smearing
   ene = np.linspace(emin, emax, ne)
+  kmult = k_multiplicity(data_controller)[:,None]
 
   if rank == 0 and attr['verbose']:
     print('Writing DoS Files')
@@ -43,7 +45,7 @@ def do_dos ( data_controller, emin, emax, ne, delta ):
     E_k = arry['E_k'][:,:bnd,ispin]
 
     for n in range(ne):
-      dosaux[n] = np.sum(np.exp(-((ene[n]-E_k)/delta)**2))
+      dosaux[n] = np.sum(kmult*np.exp(-((ene[n]-E_k)/delta)**2))
 
     dos = np.zeros((ne), dtype=float) if rank == 0 else None
 
@@ -60,6 +62,7 @@ def do_dos ( data_controller, emin, emax, ne, delta ):
 
 def do_dos_adaptive ( data_controller, emin, emax, ne ):
   from .smearing import gaussian, metpax
+  from .do_ibz import k_multiplicity
 
   comm = MPI.COMM_WORLD
   rank = comm.Get_rank()
@@ -72,6 +75,7 @@ def do_dos_adaptive ( data_controller, emin, emax, ne ):
 
   bnd = attr['bnd']
   netot = attr['nkpnts']*bnd
+  kmult = np.repeat(k_multiplicity(data_controller), bnd)
 
   if rank == 0 and attr['verbose']:
     print('Writing Adaptive DoS Files')
@@ -86,11 +90,11 @@ def do_dos_adaptive ( data_controller, emin, emax, ne ):
     for n in range(ne):
       if attr['smearing'] == 'gauss':
         # adaptive Gaussian smearing
-        dosaux[n] = np.sum(gaussian(ene[n],E_k,delta))
+        dosaux[n] = np.sum(kmult*gaussian(ene[n],E_k,delta))
 
       elif attr['smearing'] == 'm-p':
         # adaptive Methfessel and Paxton smearing
-        dosaux[n] = np.sum(metpax(ene[n],E_k,delta))
+        dosaux[n] = np.sum(kmult*metpax(ene[n],E_k,delta))
 
     dos = np.zeros((ne), dtype=float) if rank==0 else None
     comm.Reduce(dosaux, dos, op=MPI.SUM)
@@ -21,8 +21,8 @@
 def do_double_grid ( data_controller ):
   import numpy as np
   from mpi4py import MPI
-  from .zero_pad import zero_pad
-  from scipy import fftpack as FFT
+  from .fft_backend import fftn
+  from .zero_pad import zero_pad_stack
   from .communication import scatter_full
 
   rank = MPI.COMM_WORLD.Get_rank()
@@ -33,6 +33,10 @@ def do_double_grid ( data_controller ):
   if rank == 0:
     nawf,nk1,nk2,nk3 = attr['nawf'],attr['nk1'],attr['nk2'],attr['nk3']
     HRs = np.reshape(arrays['HRs'], (nawf**2,nk1,nk2,nk3,attr['nspin']))
+    if attr['interp_triangular']:
+      # H(R)_ij = conj(H(-R)_ji), so only the upper triangle of orbital pairs is transformed
+      iu = np.triu_indices(nawf)
+      HRs = HRs[iu[0]*nawf+iu[1]]
   HRs = scatter_full(HRs, attr['npool'])
 
   snawf,nk1,nk2,nk3,nspin = HRs.shape
@@ -46,9 +50,11 @@ def do_double_grid ( data_controller ):
   # Extended R to k (with zero padding)
   arrays['Hksp']  = np.empty((HRs.shape[0],nk1p,nk2p,nk3p,nspin), dtype=complex)
 
+  # One batched transform of the padded (snawf,nk1p,nk2p,nk3p) block per spin
   for ispin in range(nspin):
-    for n in range(HRs.shape[0]):
-      arrays['Hksp'][n,:,:,:,ispin] = FFT.fftn(zero_pad(HRs[n,:,:,:,ispin],nk1,nk2,nk3,nfft1,nfft2,nfft3))
+    HRp = zero_pad_stack(HRs[...,ispin], nfft1, nfft2, nfft3)
+    arrays['Hksp'][...,ispin] = fftn(HRp, axes=(1,2,3))
+  HRp = None
 
   attr['nk1'] = nk1p
   attr['nk2'] = nk2p
@@ -50,76 +50,140 @@ def get_degeneracies ( E_k, bnd ):
   return all_degen
 
 
-def do_pao_eigh ( data_controller ):
-  from .communication import gather_scatter
-  from numpy.linalg import eigh
+def eigh_stack ( Hk, chunk=256, eigvals_only=False ):
+  '''
+  Diagonalize a stack of Hermitian matrices, 'chunk' k-points per batched LAPACK call.
+  Only the upper triangle of each matrix is referenced.
+
+  Arguments:
+      Hk (ndarray): Stack of Hermitian matrices with shape (nk,nawf,nawf)
+      chunk (int): Number of k-points diagonalized together
+      eigvals_only (bool): If True the eigenvectors are not computed
+
+  Returns:
+      (E, v): Eigenvalues (nk,nawf) and eigenvectors (nk,nawf,nawf), or only E if eigvals_only
+  '''
+  nk,nawf,_ = Hk.shape
+  chunk = max(1, int(chunk))
+
+  E = np.empty((nk,nawf), dtype=float)
+  v = None if eigvals_only else np.empty((nk,nawf,nawf), dtype=complex)
+
+  for ik in range(0, nk, chunk):
+    ek = min(ik+chunk, nk)
+    if eigvals_only:
+      E[ik:ek] = npl.eigvalsh(Hk[ik:ek], UPLO='U')
+    else:
+      E[ik:ek],v[ik:ek] = npl.eigh(Hk[ik:ek], UPLO='U')
+
+  return E if eigvals_only else (E, v)
+
+
+def eigh_window ( data_controller, nbnd=None, emax=None, eigvals_only=False ):
+  '''
+  Lowest eigenpairs of 'Hksp', computed with the LAPACK subset eigensolvers.
+  Only the upper triangle of each matrix is referenced.
+
+  Arguments:
+      data_controller (DataController): Data controller holding 'Hksp'
+      nbnd (int): Number of eigenpairs computed at every k-point
+      emax (float): Used when nbnd is None. The number of bands kept is the largest number of eigenvalues
+                    below emax at any k-point (of any rank), counted in a first pass without eigenvectors
+      eigvals_only (bool): If True the eigenvectors are not computed
+
+  Returns:
+      (E, v): Eigenvalues (nk,nbnd,nspin) and eigenvectors (nk,nawf,nbnd,nspin), or only E if eigvals_only
+  '''
   from mpi4py import MPI
 
-  rank = MPI.COMM_WORLD.Get_rank()
-
   arrays,attributes = data_controller.data_dicts()
 
-  snktot,nawf,_,nspin = arrays['Hksp'].shape
+  Hksp = arrays['Hksp']
+  snktot,nawf,_,nspin = Hksp.shape
 
-  arrays['E_k'] = np.zeros((snktot,nawf,nspin), dtype=float)
-  arrays['v_k'] = np.zeros((snktot,nawf,nawf,nspin), dtype=complex)
+  def solve ( ik, ispin, values_only, **subset ):
+    return spl.eigh(Hksp[ik,:,:,ispin], lower=False, eigvals_only=values_only, check_finite=False, **subset)
+
+  # The eigenvectors are only computed once the number of bands is known
+  if nbnd is None:
+    nbnd = 1
+    for ispin in range(nspin):
+      for ik in range(snktot):
+        nbnd = max(nbnd, solve(ik, ispin, True, subset_by_value=(-np.inf,emax)).size)
+    nbnd = MPI.COMM_WORLD.allreduce(nbnd, op=MPI.MAX)
+  nbnd = min(nbnd, nawf)
+
+  E = np.empty((snktot,nbnd,nspin), dtype=float)
+  v = None if eigvals_only else np.empty((snktot,nawf,nbnd,nspin), dtype=complex)
 
   for ispin in range(nspin):
-    for n in range(snktot):
-      arrays['E_k'][n,:,ispin],arrays['v_k'][n,:,:,ispin] = eigh(arrays['Hksp'][n,:,:,ispin], UPLO='U')
+    for ik in range(snktot):
+      if eigvals_only:
+        E[ik,:,ispin] = solve(ik, ispin, True, subset_by_index=[0,nbnd-1])
+      else:
+        E[ik,:,ispin],v[ik,:,:,ispin] = solve(ik, ispin, False, subset_by_index=[0,nbnd-1])
+
+  return E if eigvals_only else (E, v)
+
+
+def do_pao_eigh ( data_controller ):
+
+  arrays,attributes = data_controller.data_dicts()
+
+  snktot,nawf,_,nspin = arrays['Hksp'].shape
+  chunk = attributes['eigh_chunk']
+  eigvals_only = attributes['eigvals_only']
+  nbnd,emax = attributes['eigh_nbnd'],attributes['eigh_emax']
+
+  if 'v_k' in arrays:
+    del arrays['v_k']
+
+  if nbnd is not None or emax is not None:
+    # Partial diagonalization, only the lowest bands are stored
+    if eigvals_only:
+      arrays['E_k'] = eigh_window(data_controller, nbnd, emax, True)
+    else:
+      arrays['E_k'],arrays['v_k'] = eigh_window(data_controller, nbnd, emax)
+    nbnd = arrays['E_k'].shape[1]
+    if nbnd < attributes['bnd']:
+      attributes['bnd'] = nbnd
+    if data_controller.rank == 0 and attributes['verbose']:
+      print('Eigenpairs computed for the lowest %d of %d bands'%(nbnd,nawf))
+
+  else:
+    arrays['E_k'] = np.zeros((snktot,nawf,nspin), dtype=float)
+    if not eigvals_only:
+      arrays['v_k'] = np.zeros((snktot,nawf,nawf,nspin), dtype=complex)
+
+    for ispin in range(nspin):
+      if eigvals_only:
+        arrays['E_k'][:,:,ispin] = eigh_stack(arrays['Hksp'][...,ispin], chunk, True)
+      else:
+        arrays['E_k'][:,:,ispin],arrays['v_k'][...,ispin] = eigh_stack(arrays['Hksp'][...,ispin], chunk)
 
   arrays['degen'] = get_degeneracies(arrays['E_k'], attributes['bnd'])
 
 
-def do_eigh_calc ( HRaux, SRaux, kq, R, read_S ):
+def do_eigh_calc ( HRaux, SRaux, kq, R, read_S, chunk=256, cache_bytes=0 ):
+  from .sparse_HRs import sparse_HSk
 
   # Compute bands on a selected mesh in the BZ
+  # HRaux and SRaux are the compact blocks of sparse_HRs, R the corresponding lattice vectors
 
   nkpi = kq.shape[0]
-  nawf = HRaux.shape[0]
+  nawf = HRaux.shape[1]
   nspin = HRaux.shape[-1]
 
-  Hks_int = band_loop_H(HRaux, kq, R)
-
-  if read_S:
-    Sks_int = band_loop_S(SRaux, kq, R)
+  Hks_int,Sks_int = sparse_HSk(R, HRaux, (SRaux if read_S else None), kq.T, cache_bytes)
 
   E_kp = np.empty((nkpi,nawf,nspin), dtype=float)
   v_kp = np.empty((nkpi,nawf,nawf,nspin), dtype=complex)
 
   for ispin in range(nspin):
-    for ik in range(nkpi):
-      if read_S:
+    if read_S:
+      for ik in range(nkpi):
         E_kp[ik,:,ispin],v_kp[ik,:,:,ispin] = spl.eigh(Hks_int[:,:,ik,ispin],Sks_int[:,:,ik])
-      else:
-        E_kp[ik,:,ispin],v_kp[ik,:,:,ispin] = npl.eigh(Hks_int[:,:,ik,ispin],UPLO='U')
+    else:
+      E_kp[:,:,ispin],v_kp[...,ispin] = eigh_stack(np.moveaxis(Hks_int[...,ispin],2,0), chunk)
 
   return (E_kp, v_kp)
-
-
-### R_wght assumed to be 1
-def band_loop_H ( HRaux, kq, R ):
-
-  nkpi = kq.shape[0]
-  nawf,_,nk1,nk2,nk3,nspin = HRaux.shape
-  auxh = np.empty((nawf,nawf,nkpi,nspin), dtype=complex)
-  HRaux = np.reshape(HRaux, (nawf,nawf,nk1*nk2*nk3,nspin), order='C')
-
-  for ik in range(nkpi):
-    for ispin in range(nspin):
-       auxh[:,:,ik,ispin] = np.sum(HRaux[:,:,:,ispin]*np.exp(2.j*np.pi*kq[ik,:].dot(R[:,:].T)), axis=2)
-
-  return auxh
-
-
-def band_loop_S ( SRaux, kq, R ):
-
-  nkpi = kq.shape[0]
-  nawf,_,nk1,nk2,nk3 = SRaux.shape
-  auxs = np.empty((nawf,nawf,nkpi), dtype=complex)
-  SRaux = np.reshape(SRaux, (nawf,nawf,nk1*nk2*nk3), order='C')
-
-  for ik in range(nkpi):
-    auxs[:,:,ik] = np.sum(SRaux[:,:,:]*np.exp(2.j*np.pi*kq[ik,:].dot(R[:,:].T)), axis=2)
-
-  return auxs
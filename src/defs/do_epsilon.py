@@ -37,28 +37,32 @@ def do_dielectric_tensor ( data_controller, ene ):
   d_tensor = arrays['d_tensor']
 
   for ispin in range(attributes['nspin']):
+
+    # Every component in one pass over the k-points
+    epsi,epsr,eels,jdos,ieps = do_epsilon(data_controller, ene, ispin, d_tensor)
+
     for n in range(d_tensor.shape[0]):
       ipol = d_tensor[n][0]
       jpol = d_tensor[n][1]
 
-      epsi,epsr,eels,jdos,ieps = do_epsilon(data_controller, ene, ispin, ipol, jpol)
-
       # Write files
       indices = (LL[ipol], LL[jpol], ispin)
-      for ep,es in [(epsi,'epsi'),(epsr,'epsr'),(eels,'eels'),(jdos,'jdos'),(ieps,'ieps')]:
+      for ep,es in [(epsi[n],'epsi'),(epsr[n],'epsr'),(eels[n],'eels'),(jdos,'jdos'),(ieps[n],'ieps')]:
         fn = '%s_%s%s_%d.dat'%((es,)+indices)
         data_controller.write_file_row_col(fn, ene, ep)
 
       if rank == 0:
-        renorm = np.sqrt((2./np.pi)*(ene[3]-ene[2])*np.sum(epsi*ene))
+        renorm = np.sqrt((2./np.pi)*(ene[3]-ene[2])*np.sum(epsi[n]*ene))
         print(ipol,jpol,' plasmon frequency = ',renorm,' eV')
         print(' integration over JDOS = ', (ene[3]-ene[2])*np.sum(jdos))
 
 
-def do_epsilon ( data_controller, ene, ispin, ipol, jpol ):
+def do_epsilon ( data_controller, ene, ispin, d_tensor ):
   from .constants import EPS0, EVTORY, RYTOEV
+  from .kramers_kronig import kramers_kronig_imaginary
 
-  # Compute the dielectric tensor
+  # Compute the dielectric tensor components listed in d_tensor, (ncomp,esize) arrays.
+  # The joint density of states does not depend on the component.
 
   arrays,attributes = data_controller.data_dicts()
 
@@ -66,25 +70,34 @@ def do_epsilon ( data_controller, ene, ispin, ipol, jpol ):
   if ene[0] == 0.:
     ene[0] = .00001
 
+  # On the irreducible wedge every component is summed, then symmetrized with the point group
+  d_loop = d_tensor
+  if attributes['ibz']:
+    d_loop = np.array([[i,j] for i in range(3) for j in range(3)], dtype=int)
+
   #=======================
   # EPS
   #=======================
-  epsi_aux,epsr_aux,jdos_aux,count_aux = eps_loop(data_controller, ene, ispin, ipol, jpol)
+  epsi_aux,epsr_aux,jdos_aux,count_aux = eps_loop(data_controller, ene, ispin, d_loop)
 
   ### TNeeds revision. Each processor is allocating zeros here, when only rank 0 needs it. 
   ### Can be condensed
-  epsi = np.zeros(esize, dtype=float)
+  epsi = np.zeros((d_loop.shape[0],esize), dtype=float)
   comm.Allreduce(epsi_aux, epsi, op=MPI.SUM)
   epsi_aux = None
 
-  epsr = np.zeros(esize, dtype=float)
+  epsr = np.zeros((d_loop.shape[0],esize), dtype=float)
   comm.Allreduce(epsr_aux, epsr, op=MPI.SUM)
   epsr_aux = None
 
-  epsr_aux = epsr_kramerskronig(data_controller, ene, epsi)
-  epsr0 = np.zeros(esize, dtype=float)
-  comm.Allreduce(epsr_aux, epsr0, op=MPI.SUM)
-  epsr_aux = None
+  if attributes['ibz']:
+    from .do_ibz import symmetrize_tensor
+    ipol,jpol = d_tensor[:,0],d_tensor[:,1]
+    epsi = symmetrize_tensor(data_controller, np.reshape(epsi,(3,3,esize)), (0,1))[ipol,jpol]
+    epsr = symmetrize_tensor(data_controller, np.reshape(epsr,(3,3,esize)), (0,1))[ipol,jpol]
+
+  # epsi is complete on every rank, each computes the transform of all components
+  epsr0 = epsr_kramerskronig(data_controller, ene, epsi)
 
   jdos = np.zeros(esize, dtype=float)
   comm.Allreduce(jdos_aux, jdos, op=MPI.SUM)
@@ -94,32 +107,26 @@ def do_epsilon ( data_controller, ene, ispin, ipol, jpol ):
   comm.Allreduce(count_aux, count, op=MPI.SUM)
   count_aux = None
 
-  ieps = np.zeros(esize, dtype=float)
-
   kq_wght = 1./attributes['nkpnts']
   epsi *= 64.0*np.pi*kq_wght/(attributes['omega'])
   # includes correction for apparent rigid shift of epsr - solved by getting the right e -> 0 limit from KK.
   if not attributes['metal']:
-    epsr =  1. + epsr*64.0*np.pi/(attributes['omega']*attributes['nkpnts']) - (epsr[4]-epsr0[4])*64.0*np.pi/(attributes['omega']*attributes['nkpnts'])
+    epsr =  1. + epsr*64.0*np.pi/(attributes['omega']*attributes['nkpnts']) - (epsr[:,4:5]-epsr0[:,4:5])*64.0*np.pi/(attributes['omega']*attributes['nkpnts'])
   else:
     epsr =  1. + epsr*64.0*np.pi/(attributes['omega']*attributes['nkpnts']) 
   eels = epsi/(epsi**2+epsr**2)
-  for i in range(esize):
-    for j in range(1,esize):
-        ieps[i] += ene[j]*epsi[j]/(ene[i]**2+ene[j]**2)
-  ieps = 1.0 + (2./np.pi)*ieps*(ene[3]-ene[2])
+  # epsilon on the imaginary axis, leaving out the e -> 0 point
+  ieps = 1.0 + kramers_kronig_imaginary(ene[1:], epsi[:,1:], ene)
   jdos /= (4.*count[0])
 
   return(epsi, epsr, eels, jdos, ieps)
 
 
-def eps_loop ( data_controller, ene, ispin, ipol, jpol):
+def eps_loop ( data_controller, ene, ispin, d_tensor ):
   from .constants import EPS0, EVTORY, RYTOEV, BOHR_RADIUS_ANGS
   from .smearing import intgaussian,gaussian,intmetpax,metpax
-
-### What is this?
-  orig_over_err = np.geterr()['over']
-  np.seterr(over='raise')
+  from .do_ibz import k_multiplicity
+  from scipy.special import expit
 
   arrays,attributes = data_controller.data_dicts()
 
@@ -133,96 +140,98 @@ def eps_loop ( data_controller, ene, ispin, ipol, jpol):
   Ef = 0.
   eps=1.e-8
   kq_wght = 1./attributes['nkpnts']
+  kmult = k_multiplicity(data_controller)
+
+  ncomp = d_tensor.shape[0]
+  ipol,jpol = d_tensor[:,0],d_tensor[:,1]
 
   jdos = np.zeros(esize, dtype=float)
-  epsi = np.zeros(esize, dtype=float)
-  epsr = np.zeros(esize, dtype=float)
+  epsi = np.zeros((ncomp,esize), dtype=float)
+  epsr = np.zeros((ncomp,esize), dtype=float)
+
+  E_k = arrays['E_k'][:,:bnd,ispin]
 
   fn = None
   if smearing == None:
-    fn = 2.*1./(1.+np.exp(arrays['E_k'][:,:bnd,ispin]/temp))
+    # 2/(1+exp(E/T)), without overflow for the empty bands
+    fn = 2.*expit(-E_k/temp)
   elif smearing == 'gauss':
-    fn = 2.*intgaussian(arrays['E_k'][:,:bnd,ispin], Ef, arrays['deltakp'][:,:bnd,ispin])
+    fn = 2.*intgaussian(E_k, Ef, arrays['deltakp'][:,:bnd,ispin])
   elif smearing == 'm-p':
-    fn = 2.*intmetpax(arrays['E_k'][:,:bnd,ispin], Ef, arrays['deltakp'][:,:bnd,ispin])
+    fn = 2.*intmetpax(E_k, Ef, arrays['deltakp'][:,:bnd,ispin])
 
   # apparently there are numerical instabilities if energy levels are not completely occupied or completely empty - needs to be tested for metals
   if not attributes['metal']:
     fn = np.round(fn,0)
   count = np.zeros(1,dtype=float)
 
-  bndmax = bnd
-
-  for ik in range(fn.shape[0]):
-    for iband2 in range(bndmax):
-       for iband1 in range(bndmax):
-          if iband1 != iband2:
-             E_diff_nm = arrays['E_k'][ik,iband2,ispin] - arrays['E_k'][ik,iband1,ispin]
-             f_nm =  fn[ik,iband2]-fn[ik,iband1]
-             if np.abs(f_nm) > 2.e-3 and fn[ik,iband1] > 1.e-4 and fn[ik,iband2] < 2.0:
-                pksp2 = np.real(arrays['pksp'][ik,ipol,iband1,iband2,ispin]*arrays['pksp'][ik,jpol,iband2,iband1,ispin])
-                pksp2 *= attributes['alat']*BOHR_RADIUS_ANGS/(EPS0*RYTOEV)
-                epsi[:] +=  pksp2*delta*ene[:]*fn[ik,iband1]/(((E_diff_nm**2-ene[:]**2)**2+delta**2*ene[:]**2)*(E_diff_nm))
-                epsr[:] +=  pksp2*(E_diff_nm**2-ene[:]**2)*fn[ik,iband1]/(((E_diff_nm**2-ene[:]**2)**2+delta**2*ene[:]**2)*(E_diff_nm))
-                jdos[:] +=  delta*(fn[ik,iband1]-fn[ik,iband2])/(np.pi*((E_diff_nm-ene[:])**2+delta**2))
-                count[0] += (fn[ik,iband1]-fn[ik,iband2])
+  pfac = attributes['alat']*BOHR_RADIUS_ANGS/(EPS0*RYTOEV)
+  ene2 = ene**2
+
+  for ks in data_controller.k_chunks(snktot):
+    # Transitions iband1 -> iband2 with a change of occupation, as (ik,iband2,iband1) triples
+    f_k = fn[ks]
+    f_nm = f_k[:,:,None] - f_k[:,None,:]
+    ik,ib2,ib1 = np.nonzero((np.abs(f_nm)>2.e-3) & (f_k[:,None,:]>1.e-4) & (f_k[:,:,None]<2.0))
+    if ik.size == 0:
+      continue
+
+    E_diff_nm = E_k[ks][ik,ib2] - E_k[ks][ik,ib1]
+    km = kmult[ks][ik]
+    f1,df = km*f_k[ik,ib1],km*(f_k[ik,ib1]-f_k[ik,ib2])
+    # Momenta of each transition are gathered once for all the components, (ncomp,npair)
+    pk = arrays['pksp'][ks]
+    p12,p21 = pk[ik,:,ib1,ib2,ispin],pk[ik,:,ib2,ib1,ispin]
+    pksp2 = pfac*np.real(p12[:,ipol]*p21[:,jpol]).T
+    p12 = p21 = None
+    count[0] += np.sum(df)
+
+    # Weights of each transition, contracted with its energy profile one energy chunk at a time.
+    # Each (transition,energy) block holds at most 'e_chunk_bytes'
+    echunk = max(1, attributes['e_chunk_bytes']//(8*ik.size))
+    w = pksp2*f1/E_diff_nm
+    Ed2 = E_diff_nm[:,None]**2
+    for i0 in range(0, esize, echunk):
+      es = slice(i0, min(i0+echunk,esize))
+      dE2 = Ed2 - ene2[es]
+      lor = 1./(dE2**2+delta**2*ene2[es])
+      epsi[:,es] += delta*ene[es]*(w@lor)
+      epsr[:,es] += w@(dE2*lor)
+      jdos[es] += delta*(df@(1./((E_diff_nm[:,None]-ene[es])**2+delta**2)))/np.pi
 
   if attributes['metal']:
     if rank == 0: print('NOT TESTED - needs different delta for intraband transitions and degauss from QE + check on units!!!')
     degauss=0.05
     fnF = None
     if smearing is None:
-      fnF = np.empty((snktot,bnd), dtype=float)
-      for n in range(bnd):
-        for i in range(snktot):
-          try:
-            fnF[i,n] = .5/(1.+np.cosh(arrays['E_k'][i,n,ispin]/temp))
-          except:
-            fnF[i,n] = 1e8
+      with np.errstate(over='ignore'):
+        fnF = .5/(1.+np.cosh(E_k/temp))
       fnF /= temp
     elif smearing == 'gauss':
  ## Why .03* here?
-      fnF = gaussian(arrays['E_k'][:,:bnd,ispin], Ef, .03*arrays['deltakp'][:,:bnd,ispin])
+      fnF = gaussian(E_k, Ef, .03*arrays['deltakp'][:,:bnd,ispin])
     elif smearing == 'm-p':
-      fnF = metpax(arrays['E_k'][:,:bnd,ispin], Ef, arrays['deltakp'][:,:bnd,ispin])
+      fnF = metpax(E_k, Ef, arrays['deltakp'][:,:bnd,ispin])
 
-    for ik in range(fn.shape[0]):
-      for iband1 in range(bndmax):
-        pksp2 = np.real(arrays['pksp'][ik,ipol,iband1,iband1,ispin]*arrays['pksp'][ik,jpol,iband1,iband1,ispin])
-        pksp2 *= attributes['alat']*BOHR_RADIUS_ANGS/(EPS0*RYTOEV**3)
-        epsi[:] +=  pksp2*delta*ene[:]*fnF[ik,iband1]/((ene[:]**4+delta**2*ene[:]**2)*degauss)
-        epsr[:] -=  pksp2*fnF[ik,iband1]*ene[:]**2/((ene[:]**4+delta**2*ene[:]**2)*degauss)
+    # Intraband terms only enter through their sum over k and bands
+    pksp2 = np.zeros((ncomp,1), dtype=float)
+    for ks in data_controller.k_chunks(snktot):
+      pd = np.diagonal(arrays['pksp'][ks,:,:bnd,:bnd,ispin], axis1=2, axis2=3)
+      pksp2[:,0] += np.sum(np.real(pd[:,ipol]*pd[:,jpol])*(kmult[ks,None]*fnF[ks])[:,None], axis=(0,2))
+    pksp2 *= attributes['alat']*BOHR_RADIUS_ANGS/(EPS0*RYTOEV**3)
+    epsi +=  pksp2*delta*ene/((ene**4+delta**2*ene**2)*degauss)
+    epsr -=  pksp2*ene**2/((ene**4+delta**2*ene**2)*degauss)
 
-  np.seterr(over=orig_over_err)
   return(epsi, epsr, jdos, count)
 
 
 def epsr_kramerskronig ( data_controller, ene, epsi ):
   from .smearing import intmetpax
-  from scipy.integrate import simps
-  from .communication import load_balancing
+  from .kramers_kronig import kramers_kronig
 
   arrays,attributes = data_controller.data_dicts()
 
-  esize = ene.size
-  de = ene[1] - ene[0]
-
-  epsr = np.zeros(esize, dtype=float)
-
-  ini_ie,end_ie = load_balancing(comm.Get_size(), rank, esize)
-
-  # Range checks for Simpson Integrals
-  if end_ie == ini_ie:
-    return
-  if ini_ie < 3:
-    ini_ie = 3
-  if end_ie == esize:
-    end_ie = esize-1
-
+  # Real part of epsilon (less 1) from epsi, (...,esize), cut off smoothly above 'shift'
   f_ene = intmetpax(ene, attributes['shift'], 1.)
-  for ie in range(ini_ie, end_ie):
-    I1 = simps(ene[1:(ie-1)]*de*epsi[1:(ie-1)]*f_ene[1:(ie-1)]/(ene[1:(ie-1)]**2-ene[ie]**2))
-    I2 = simps(ene[(ie+1):esize]*de*epsi[(ie+1):esize]*f_ene[(ie+1):esize]/(ene[(ie+1):esize]**2-ene[ie]**2))
-    epsr[ie] = 2.*(I1+I2)/np.pi
 
-  return epsr
+  return kramers_kronig(ene, epsi*f_ene)
@@ -41,27 +41,14 @@ size = comm.Get_size()
 
 #np.set_printoptions(precision=8, threshold=100, edgeitems=50, linewidth=350, suppress=True)
 
-def band_loop_H ( ini_ik, end_ik, HRaux, kq, R ):
-  nawf,_,_,nspin = HRaux.shape
-  kdot = np.zeros((1,R.shape[0]), dtype=complex, order='C')
-  kdot = np.tensordot(R, 2.0j*np.pi*kq[:,ini_ik:end_ik], axes=([1],[0]))
-  np.exp(kdot, kdot)
+def gen_eigs ( HRc, kq, R ):
+  from .sparse_HRs import sparse_Hk
 
-  auxh = np.zeros((nawf,nawf,1,nspin), dtype=complex, order='C')
-  for ispin in range(nspin):
-    auxh[:,:,ini_ik:end_ik,ispin] = np.tensordot(HRaux[:,:,:,ispin], kdot, axes=([2],[0]))
-  return auxh
-
-def gen_eigs ( HRaux, kq, R ):
-  # Load balancing
-
-  nawf,_,_,nspin = HRaux.shape
+  # HRc and R (crystal coordinates) are the compact blocks of sparse_HRs
+  nawf,nspin = HRc.shape[1],HRc.shape[-1]
   E_kp = np.zeros((1,nawf,nspin), dtype=np.float64)
 
-  kq=kq[:,None]
-
-#  Hks_int  = np.zeros((nawf,nawf,1,nspin),dtype=complex,order='C') # final data arrays
-  Hks_int = band_loop_H(0,1,HRaux,kq,R)
+  Hks_int = sparse_Hk(R, HRc, kq[:,None])
 
   for ispin in range(nspin):
     E_kp[:,:,ispin] =  LAN.eigvalsh(Hks_int[:,:,0,ispin],UPLO='U')
@@ -74,31 +61,6 @@ def get_gap ( HR, kq, R, nelec ):
   return E_kp[0,nelec,0] - E_kp[0,nelec-1,0]
 
 
-def get_R_grid_fft ( nr1, nr2, nr3 ):
-
-  R = np.zeros((nr1*nr2*nr3,3))
-
-  for i in range(nr1):
-    for j in range(nr2):
-      for k in range(nr3):
-        n = k + j*nr3 + i*nr2*nr3
-        Rx = float(i)/float(nr1)
-        Ry = float(j)/float(nr2)
-        Rz = float(k)/float(nr3)
-        if Rx >= 0.5: Rx=Rx-1.0
-        if Ry >= 0.5: Ry=Ry-1.0
-        if Rz >= 0.5: Rz=Rz-1.0
-        Rx -= int(Rx)
-        Ry -= int(Ry)
-        Rz -= int(Rz)
-
-        R[n,0] = Rx*nr1 
-        R[n,1] = Ry*nr2 
-        R[n,2] = Rz*nr3
-
-  return R  
-
-
 def get_search_grid ( nk1, nk2, nk3, snk1_range=[-0.5,0.5], snk2_range=[-0.5,0.5], snk3_range=[-0.5,0.5], endpoint=False ):
 
   nk1_arr = np.linspace(snk1_range[0], snk1_range[1], num=nk1, endpoint=endpoint)
@@ -110,6 +72,7 @@ def get_search_grid ( nk1, nk2, nk3, snk1_range=[-0.5,0.5], snk2_range=[-0.5,0.5
 
 def find_weyl ( data_controller, test_rad, search_grid ):
   import os
+  from .sparse_HRs import sparse_HRs
 
   arry,attr = data_controller.data_dicts()
 
@@ -117,10 +80,8 @@ def find_weyl ( data_controller, test_rad, search_grid ):
   nelec,verbose = attr['nelec'],attr['verbose']
   HRs,symops,b_vectors,TR_flag = arry['HRs'],arry['sym_rot'],arry['b_vectors'],arry['sym_TR']
 
-  nawf,_,nk1,nk2,nk3,nspin = HRs.shape
-  R = get_R_grid_fft(nk1, nk2, nk3)
-
-  HRs = np.reshape(HRs, (nawf,nawf,nk1*nk2*nk3,nspin))
+  # Compact H(R), R in crystal coordinates
+  R,HRs = sparse_HRs(data_controller, HRs, crystal=True)
 
   mag_soc = np.logical_and(attr["dftMAG"], attr["dftSO"])
 
@@ -19,7 +19,7 @@
 
 def do_gradient ( data_controller ):
   import numpy as np
-  from scipy import fftpack as FFT
+  from .fft_backend import fftn,ifftn
   from .get_R_grid_fft import get_R_grid_fft
 
   arry,attr = data_controller.data_dicts()
@@ -36,16 +36,12 @@ def do_gradient ( data_controller ):
 
   arry['dHksp'] = np.empty((snawf,nk1,nk2,nk3,3,nspin), dtype=complex, order='C')
   for ispin in range(nspin):
-    for n in range(snawf):
-      ########################################
-      ### real space grid replaces k space ###
-      ########################################
-      if attr['use_cuda']:
-        arry['Hksp'][n,:,:,:,ispin] = cuda_ifftn(arry['Hksp'][n,:,:,:,ispin])*1.0j*attr['alat']
-      else:
-        arry['Hksp'][n,:,:,:,ispin] = FFT.ifftn(arry['Hksp'][n,:,:,:,ispin])*1.0j*attr['alat']
-
-      # Compute R*H(R)
-      for l in range(3):
-        arry['dHksp'][n,:,:,:,l,ispin] = FFT.fftn(arry['Rfft'][:,:,:,l]*arry['Hksp'][n,:,:,:,ispin])
+    ########################################
+    ### real space grid replaces k space ###
+    ########################################
+    arry['Hksp'][...,ispin] = ifftn(arry['Hksp'][...,ispin], axes=(1,2,3))*1.0j*attr['alat']
+
+    # Compute R*H(R), one batched transform over all orbital pairs per direction
+    for l in range(3):
+      arry['dHksp'][...,l,ispin] = fftn(arry['Rfft'][:,:,:,l]*arry['Hksp'][...,ispin], axes=(1,2,3))
 
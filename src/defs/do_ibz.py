@@ -0,0 +1,190 @@
+#
+# PAOFLOW
+#
+# Copyright 2016-2024 - Marco BUONGIORNO NARDELLI (mbn@unt.edu)
+#
+# Reference:
+#
+# F.T. Cerasoli, A.R. Supka, A. Jayaraj, I. Siloi, M. Costa, J. Slawinska, S. Curtarolo, M. Fornari, D. Ceresoli, and M. Buongiorno Nardelli,
+# Advanced modeling of materials with PAOFLOW 2.0: New features and software design, Comp. Mat. Sci. 200, 110828 (2021).
+#
+# M. Buongiorno Nardelli, F. T. Cerasoli, M. Costa, S Curtarolo,R. De Gennaro, M. Fornari, L. Liyanage, A. Supka and H. Wang,
+# PAOFLOW: A utility to construct and operate on ab initio Hamiltonians from the Projections of electronic wavefunctions on
+# Atomic Orbital bases, including characterization of topological materials, Comp. Mat. Sci. vol. 143, 462 (2018).
+#
+# This file is distributed under the terms of the
+# GNU General Public License. See the file `License'
+# in the root directory of the present distribution,
+# or http://www.gnu.org/copyleft/gpl.txt .
+
+import numpy as np
+from mpi4py import MPI
+
+comm = MPI.COMM_WORLD
+rank = comm.Get_rank()
+
+
+def ibz_symmetry_ops ( data_controller, nk ):
+  '''
+  Point group operations acting on k, in crystal coordinates, that map the Gamma centered
+  nk1 x nk2 x nk3 grid onto itself. Time reversal (k -> -k) is added unless the calculation
+  is magnetic with spin-orbit coupling. Without 'sym_rot' only the identity and time reversal are used.
+
+  Arguments:
+      data_controller (DataController): Data controller with 'a_vectors' and optionally 'sym_rot' and 'sym_TR'
+      nk (ndarray): Grid dimensions (nk1,nk2,nk3)
+
+  Returns:
+      (kop, rot): k-space operations (nop,3,3) and the corresponding Cartesian rotations (nop,3,3)
+  '''
+  arry,attr = data_controller.data_dicts()
+
+  if 'sym_rot' in arry:
+    symop = np.array(arry['sym_rot'], dtype=float)
+    sym_TR = np.asarray(arry['sym_TR'], dtype=bool) if 'sym_TR' in arry else np.zeros(symop.shape[0], dtype=bool)
+  else:
+    symop = np.eye(3)[None]
+    sym_TR = np.zeros(1, dtype=bool)
+
+  # Operations combined with time reversal send k to -Sk, as in pao_sym
+  kop = np.where(sym_TR[:,None,None], -symop, symop)
+  if not (attr['dftSO'] and attr.get('dftMAG',False)):
+    kop = np.concatenate((kop,-kop))
+  kop = np.unique(np.round(kop,6).reshape(-1,9), axis=0).reshape(-1,3,3)
+
+  # Cartesian rotation of k (and of band velocities) for each operation
+  a_vectors = arry['a_vectors']
+  rot = np.linalg.inv(a_vectors) @ kop @ a_vectors
+
+  # Keep the operations that are orthogonal and compatible with the grid
+  M = nk[:,None]*kop/nk[None,:]
+  keep = np.all(np.isclose(M, np.rint(M), atol=1.e-6), axis=(1,2))
+  keep &= np.all(np.isclose(rot@np.swapaxes(rot,1,2), np.eye(3), atol=1.e-6), axis=(1,2))
+
+  return kop[keep], rot[keep]
+
+
+def ibz_setup ( data_controller ):
+  '''
+  Find the irreducible k-points of the current grid and their multiplicities
+  Populates DataController with 'ibz_own', 'ibz_order', 'ibz_mult' and 'ibz_rot'
+
+  Arguments:
+      data_controller (DataController): Data controller with the k-distributed 'Hksp'
+
+  Returns:
+      None
+  '''
+  from .pao_sym import grid_flat_index
+  from .communication import scatter_full
+
+  arry,attr = data_controller.data_dicts()
+
+  nk = np.array([attr['nk1'],attr['nk2'],attr['nk3']])
+  nktot = int(np.prod(nk))
+  kop,rot = ibz_symmetry_ops(data_controller, nk)
+
+  # Each k-point is represented by the smallest grid index in its star
+  kgrid = np.indices(nk).reshape(3,nktot).T/nk
+  rep = np.arange(nktot)
+  for op in kop:
+    rep = np.minimum(rep, grid_flat_index(kgrid@op.T, nk, np.zeros(3)))
+  kgrid = None
+
+  ibz = np.flatnonzero(rep == np.arange(nktot))
+  mult = np.bincount(rep, minlength=nktot)[ibz].astype(float)
+
+  # Irreducible points held on this rank, and the order in which rank 0 receives them
+  gk = scatter_full(np.arange(nktot), attr['npool'])
+  own = np.flatnonzero(rep[gk] == gk)
+  gk_own = comm.gather(gk[own], root=0)
+
+  arry['ibz_own'] = own
+  arry['ibz_order'] = np.argsort(np.concatenate(gk_own)) if rank==0 else None
+  arry['ibz_mult'] = scatter_full(mult, attr['npool'])
+  arry['ibz_rot'] = rot
+  attr['nkibz'] = ibz.size
+  attr['ibz'] = True
+
+  if rank == 0 and attr['verbose']:
+    print('Irreducible wedge: %d of %d k-points, %d symmetry operations'%(ibz.size,nktot,kop.shape[0]))
+
+
+def ibz_reduce ( data_controller, arr ):
+  '''
+  Redistribute the irreducible k-points of a k-distributed full grid array
+
+  Arguments:
+      data_controller (DataController): Data controller after ibz_setup
+      arr (ndarray): Array with the local full grid k-points on the first axis
+
+  Returns:
+      Array with the local irreducible k-points on the first axis, distributed as scatter_full
+  '''
+  from .communication import scatter_full
+
+  arry,attr = data_controller.data_dicts()
+
+  parts = comm.gather(np.ascontiguousarray(arr[arry['ibz_own']]), root=0)
+  arr_ibz = np.concatenate(parts)[arry['ibz_order']] if rank==0 else None
+  parts = None
+
+  return scatter_full(arr_ibz, attr['npool'])
+
+
+def symmetrize_tensor ( data_controller, T, axes ):
+  '''
+  Average a Cartesian tensor over the point group used for the irreducible wedge.
+  Sums over the wedge weighted by 'ibz_mult' become the full grid sums.
+
+  Arguments:
+      data_controller (DataController): Data controller after ibz_setup
+      T (ndarray): Tensor to symmetrize
+      axes (tuple): Axes of T holding Cartesian indices (e.g. (0,1) for a rank-2 tensor)
+
+  Returns:
+      The symmetrized tensor
+  '''
+  rot = data_controller.data_arrays['ibz_rot']
+
+  Ts = np.zeros_like(T)
+  for R in rot:
+    TR = T
+    for ax in axes:
+      TR = np.moveaxis(np.tensordot(R, TR, axes=([1],[ax])), 0, ax)
+    Ts += TR
+
+  return Ts/rot.shape[0]
+
+
+def k_multiplicity ( data_controller ):
+  '''
+  Weight of each local k-point relative to a full grid point: the star size in the
+  irreducible wedge, and one otherwise
+
+  Arguments:
+      data_controller (DataController): Data controller with 'E_k'
+
+  Returns:
+      Array (snktot,) of multiplicities
+  '''
+  arry,attr = data_controller.data_dicts()
+
+  if attr['ibz']:
+    return arry['ibz_mult']
+  return np.ones(arry['E_k'].shape[0], dtype=float)
+
+
+def require_full_grid ( data_controller, mname ):
+  '''
+  Raise a ValueError if 'mname' is called on the irreducible wedge
+
+  Arguments:
+      data_controller (DataController): Data controller
+      mname (str): Name of the calling module
+
+  Returns:
+      None
+  '''
+  if data_controller.data_attributes['ibz']:
+    raise ValueError('%s requires the full k grid. Call pao_eigh with ibz=False.'%mname)
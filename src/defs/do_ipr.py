@@ -20,8 +20,10 @@
 import numpy as np
 
 def inverse_participation_ratio (data_controller):
+  from .do_ibz import require_full_grid
 
   arry,attr = data_controller.data_dicts()
+  require_full_grid(data_controller, 'Inverse Participation Ratio')
 
   nbands = attr['bnd']
 
@@ -19,18 +19,22 @@
 
 def do_momentum ( data_controller ):
   import numpy as np
-  from .perturb_split import perturb_split
+  from .perturb_split import perturb_split_stack
 
   arry,attr = data_controller.data_dicts()
 
   nktot,_,nawf,nawf,nspin = arry['dHksp'].shape
+  # Momenta between the bands held in 'v_k' (all nawf, or the lowest after a partial diagonalization)
+  nbnd = arry['v_k'].shape[2]
 
-  arry['pksp'] = np.zeros_like(arry['dHksp'])
+  data_controller.allocate_array('pksp', (nktot,3,nbnd,nbnd,nspin), dtype=complex)
 
-  for ispin in range(nspin):
-    for ik in range(nktot):
+  for ks in data_controller.k_chunks(nktot):
+    dHks = np.asarray(arry['dHksp'][ks])
+    pks = np.zeros((dHks.shape[0],3,nbnd,nbnd,nspin), dtype=complex)
+    for ispin in range(nspin):
       for l in range(3):
-         arry['pksp'][ik,l,:,:,ispin],_ = perturb_split(arry['dHksp'][ik,l,:,:,ispin], 
-                                                        arry['dHksp'][ik,l,:,:,ispin], 
-                                                        arry['v_k'][ik,:,:,ispin],
-                                                        arry['degen'][ispin][ik])
+        pks[:,l,:,:,ispin],_ = perturb_split_stack(dHks[:,l,:,:,ispin], None,
+                                                   arry['v_k'][ks,:,:,ispin],
+                                                   arry['degen'][ispin][ks])
+    arry['pksp'][ks] = pks
@@ -26,10 +26,12 @@ def do_rashba_edelstein (data_controller, ene, temperature, regularization, twoD
   import numpy as np
   from os.path import join
   from .smearing import gaussian
+  from .do_ibz import require_full_grid
   from .constants import ELECTRONVOLT_SI,BOHR_RADIUS_CM,HBAR,LL
 
   comm,rank = data_controller.comm,data_controller.rank
   arrays,attr = data_controller.data_dicts()
+  require_full_grid(data_controller, 'Rashba-Edelstein')
 
   snktot = arrays['v_k'].shape[0]
   ind_plot = arrays['ind_plot']
@@ -38,7 +40,9 @@ def do_rashba_edelstein (data_controller, ene, temperature, regularization, twoD
   tau_const = 1.
   esize = ene.size
 
-  pksp = np.take(np.diagonal(np.real(arrays['pksp'][:,:,:,:,0]),axis1=2,axis2=3), ind_plot, axis=2)
+  pksp = np.empty((snktot,3,nstates), dtype=float)
+  for ks in data_controller.k_chunks(snktot):
+    pksp[ks] = np.take(np.diagonal(np.real(arrays['pksp'][ks,:,:,:,0]),axis1=2,axis2=3), ind_plot, axis=2)
 
   deltakp = np.take(arrays['deltakp'], ind_plot, axis=1)[:,:,0]
   E_k = np.take(arrays['E_k'], ind_plot, axis=1)[:,:,0]
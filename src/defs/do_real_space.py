@@ -28,8 +28,10 @@ comm = MPI.COMM_WORLD
 rank = comm.Get_rank()
 
 def do_density ( data_controller, nr1, nr2, nr3 ):
+  from .do_ibz import require_full_grid
 
   arry,attr = data_controller.data_dicts()
+  require_full_grid(data_controller, 'Density')
 
   # Calculation of the electron density
 
@@ -22,22 +22,25 @@ def do_spin_texture ( data_controller ):
   import numpy as np
   from mpi4py import MPI
   from .communication import gather_full
+  from .do_ibz import require_full_grid
 
   comm = MPI.COMM_WORLD
   rank = comm.Get_rank()
 
   arrays = data_controller.data_arrays
   attributes = data_controller.data_attributes
+  require_full_grid(data_controller, 'Spin Texture')
 
   fermi_up,fermi_dw = attributes['fermi_up'],attributes['fermi_dw']
-  nawf,nk1,nk2,nk3 = attributes['nawf'],attributes['nk1'],attributes['nk2'],attributes['nk3']
+  nk1,nk2,nk3 = attributes['nk1'],attributes['nk2'],attributes['nk3']
   E_k_full = gather_full(arrays['E_k'], attributes['npool'])
+  nbnd = arrays['E_k'].shape[1]
  
   ind_plot = []
   icount = None
   if rank == 0:
     icount = 0
-    for ib in range(nawf):
+    for ib in range(nbnd):
       E_k_min = np.amin(E_k_full[:,ib,0])
       E_k_max = np.amax(E_k_full[:,ib,0])
       btwUp = (E_k_min < fermi_up and E_k_max > fermi_up)
@@ -52,7 +55,7 @@ def do_spin_texture ( data_controller ):
 
   Sj = arrays['Sj']
   snktot = arrays['v_k'].shape[0]
-  sktxtaux = np.zeros((snktot,3,nawf,nawf), dtype=complex)
+  sktxtaux = np.zeros((snktot,3,nbnd,nbnd), dtype=complex)
 
   # Compute matrix elements of the spin operator
   for ik in range(snktot):
@@ -0,0 +1,358 @@
+#
+# PAOFLOW
+#
+# Copyright 2016-2024 - Marco BUONGIORNO NARDELLI (mbn@unt.edu)
+#
+# Reference:
+#
+# F.T. Cerasoli, A.R. Supka, A. Jayaraj, I. Siloi, M. Costa, J. Slawinska, S. Curtarolo, M. Fornari, D. Ceresoli, and M. Buongiorno Nardelli,
+# Advanced modeling of materials with PAOFLOW 2.0: New features and software design, Comp. Mat. Sci. 200, 110828 (2021).
+#
+# M. Buongiorno Nardelli, F. T. Cerasoli, M. Costa, S Curtarolo,R. De Gennaro, M. Fornari, L. Liyanage, A. Supka and H. Wang,
+# PAOFLOW: A utility to construct and operate on ab initio Hamiltonians from the Projections of electronic wavefunctions on
+# Atomic Orbital bases, including characterization of topological materials, Comp. Mat. Sci. vol. 143, 462 (2018).
+#
+# This file is distributed under the terms of the
+# GNU General Public License. See the file `License'
+# in the root directory of the present distribution,
+# or http://www.gnu.org/copyleft/gpl.txt .
+
+import numpy as np
+from mpi4py import MPI
+
+comm = MPI.COMM_WORLD
+rank = comm.Get_rank()
+
+# Linear tetrahedron method (P. E. Blochl, O. Jepsen and O. K. Andersen, Phys. Rev. B 49, 16223 (1994))
+# Each cell of the nk1*nk2*nk3 grid is split into 6 tetrahedra sharing its shortest main diagonal.
+# Every k-point is a corner of 24 tetrahedra. The rank owning a k-point computes the weight of
+# that corner in each of them, so integrals become sums over the local k-points, as with smearing.
+
+
+def tetra_offsets ( nk1, nk2, nk3, b_vectors=None ):
+  '''
+  Corners of the 6 tetrahedra of a grid cell, as integer offsets from the cell origin
+
+  Arguments:
+      nk1,nk2,nk3 (int): Dimensions of the k grid
+      b_vectors (ndarray): (optional) Reciprocal lattice vectors, used to select the shortest main diagonal
+
+  Returns:
+      offsets (ndarray): (6,4,3) offsets of the corners of each tetrahedron
+  '''
+  from itertools import permutations
+
+  # Tetrahedra along the diagonal (0,0,0)-(1,1,1)
+  tet = np.zeros((6,4,3), dtype=int)
+  for t,p in enumerate(permutations(range(3))):
+    tet[t,1,p[0]] = 1
+    tet[t,2,[p[0],p[1]]] = 1
+    tet[t,3] = 1
+
+  # Reflect the cell to use the shortest of its 4 main diagonals
+  flip = np.zeros(3, dtype=int)
+  if b_vectors is not None:
+    flips = np.array([[0,0,0],[1,0,0],[0,1,0],[0,0,1]])
+    dk = b_vectors/np.array([nk1,nk2,nk3])[:,None]
+    diag = (1-2*flips).dot(dk)
+    flip = flips[np.argmin(np.linalg.norm(diag,axis=1))]
+
+  return np.abs(tet-flip)
+
+
+def tetra_corners ( data_controller, distributed=True ):
+  '''
+  Global indices of the corners of the 24 tetrahedra containing each local k-point
+
+  Arguments:
+      data_controller (DataController): Data controller holding the k grid dimensions
+      distributed (bool): If False the corners are returned for every k-point of the grid
+
+  Returns:
+      corners (ndarray): (snktot,24,4) k-point indices, the local k-point is always the first corner
+  '''
+  from .communication import scatter_full
+
+  arry,attr = data_controller.data_dicts()
+
+  nk1,nk2,nk3 = attr['nk1'],attr['nk2'],attr['nk3']
+  nktot = nk1*nk2*nk3
+
+  ik = np.arange(nktot)
+  if distributed:
+    ik = scatter_full((ik if rank==0 else None), attr['npool'])
+  ik = np.unravel_index(ik, (nk1,nk2,nk3))
+
+  offs = tetra_offsets(nk1, nk2, nk3, arry.get('b_vectors'))
+
+  # For each tetrahedron and each of its corners c, offsets relative to c with c placed first
+  rel = np.empty((6,4,4,3), dtype=int)
+  for c in range(4):
+    order = [c] + [i for i in range(4) if i != c]
+    rel[:,c] = offs[:,order] - offs[:,c][:,None,:]
+  rel = rel.reshape((24,4,3))
+
+  nk = (nk1,nk2,nk3)
+  kc = [(ik[i][:,None,None]+rel[None,:,:,i])%nk[i] for i in range(3)]
+  return np.ravel_multi_index(kc, nk)
+
+
+def all_eigenvalues ( data_controller, E_k ):
+  '''
+  Gather k-distributed band energies on every rank
+
+  Arguments:
+      data_controller (DataController): Data controller
+      E_k (ndarray): (snktot,...) Local band energies
+
+  Returns:
+      E_full (ndarray): (nktot,...) Band energies on the full grid
+  '''
+  from .communication import gather_full
+
+  attr = data_controller.data_attributes
+
+  E_full = gather_full(np.ascontiguousarray(E_k), attr['npool'])
+  if rank != 0:
+    E_full = np.empty((attr['nk1']*attr['nk2']*attr['nk3'],)+E_k.shape[1:], dtype=E_k.dtype)
+  comm.Bcast(E_full)
+  return E_full
+
+
+def _sort_corners ( etet ):
+  # Sorted corner energies and the sorted position of the first (owned) corner
+  order = np.argsort(etet, axis=1)
+  return np.take_along_axis(etet, order, axis=1), np.argmax(order==0, axis=1)
+
+
+def _occupation_weights ( e, E, bloechl ):
+  # Integration weights of the 4 sorted corners of unit volume tetrahedra at energy E
+  w = np.zeros_like(e)
+  e1,e2,e3,e4 = e.T
+  w[E>=e4] = .25
+  D = np.zeros_like(E)
+
+  m = (e1<E) & (E<=e2)
+  if np.any(m):
+    e1,e2,e3,e4,x = e1[m],e2[m],e3[m],e4[m],E[m]-e1[m]
+    e21,e31,e41 = e2-e1,e3-e1,e4-e1
+    C = x**3/(4*e21*e31*e41)
+    w[m] = np.column_stack((C*(4-x*(1/e21+1/e31+1/e41)), C*x/e21, C*x/e31, C*x/e41))
+    D[m] = 3*x**2/(e21*e31*e41)
+
+  e1,e2,e3,e4 = e.T
+  m = (e2<E) & (E<=e3)
+  if np.any(m):
+    e1,e2,e3,e4,Em = e1[m],e2[m],e3[m],e4[m],E[m]
+    e21,e31,e41,e32,e42 = e2-e1,e3-e1,e4-e1,e3-e2,e4-e2
+    a,b,c,d = Em-e1,Em-e2,e3-Em,e4-Em
+    C1 = a**2/(4*e41*e31)
+    C2 = a*b*c/(4*e41*e32*e31)
+    C3 = b**2*d/(4*e42*e32*e41)
+    C12,C23,C123 = C1+C2,C2+C3,C1+C2+C3
+    w[m] = np.column_stack((C1+C12*c/e31+C123*d/e41, C123+C23*c/e32+C3*d/e42,
+                            C12*a/e31+C23*b/e32, C123*a/e41+C3*b/e42))
+    D[m] = (3*e21+6*b-3*(e31+e42)*b**2/(e32*e42))/(e31*e41)
+
+  e1,e2,e3,e4 = e.T
+  m = (e3<E) & (E<e4)
+  if np.any(m):
+    e1,e2,e3,e4,y = e1[m],e2[m],e3[m],e4[m],e4[m]-E[m]
+    e41,e42,e43 = e4-e1,e4-e2,e4-e3
+    C = y**3/(4*e41*e42*e43)
+    w[m] = .25 - np.column_stack((C*y/e41, C*y/e42, C*y/e43, C*(4-y*(1/e41+1/e42+1/e43))))
+    D[m] = 3*y**2/(e41*e42*e43)
+
+  if bloechl:
+    w += D[:,None]*(np.sum(e,axis=1)[:,None]-4*e)/40
+  return w
+
+
+def _dos_weights ( e, E, bloechl ):
+  # Energy derivative of _occupation_weights, zero outside (e1,e4)
+  w = np.zeros_like(e)
+  dD = np.zeros_like(E)
+
+  e1,e2,e3,e4 = e.T
+  m = (e1<E) & (E<=e2)
+  if np.any(m):
+    e1,e2,e3,e4,x = e1[m],e2[m],e3[m],e4[m],E[m]-e1[m]
+    e21,e31,e41 = e2-e1,e3-e1,e4-e1
+    C = x**3/(4*e21*e31*e41)
+    w[m] = np.column_stack((12*C/x-4*C*(1/e21+1/e31+1/e41), 4*C/e21, 4*C/e31, 4*C/e41))
+    dD[m] = 6*x/(e21*e31*e41)
+
+  e1,e2,e3,e4 = e.T
+  m = (e2<E) & (E<=e3)
+  if np.any(m):
+    e1,e2,e3,e4,Em = e1[m],e2[m],e3[m],e4[m],E[m]
+    e31,e41,e32,e42 = e3-e1,e4-e1,e3-e2,e4-e2
+    a,b,c,d = Em-e1,Em-e2,e3-Em,e4-Em
+    C1 = a**2/(4*e41*e31)
+    C2 = a*b*c/(4*e41*e32*e31)
+    C3 = b**2*d/(4*e42*e32*e41)
+    dC1 = a/(2*e41*e31)
+    dC2 = (b*c+a*c-a*b)/(4*e41*e32*e31)
+    dC3 = (2*b*d-b**2)/(4*e42*e32*e41)
+    C12,C23,C123 = C1+C2,C2+C3,C1+C2+C3
+    dC12,dC23,dC123 = dC1+dC2,dC2+dC3,dC1+dC2+dC3
+    w[m] = np.column_stack((dC1+dC12*c/e31-C12/e31+dC123*d/e41-C123/e41,
+                            dC123+dC23*c/e32-C23/e32+dC3*d/e42-C3/e42,
+                            dC12*a/e31+C12/e31+dC23*b/e32+C23/e32,
+                            dC123*a/e41+C123/e41+dC3*b/e42+C3/e42))
+    dD[m] = (6-6*(e31+e42)*b/(e32*e42))/(e31*e41)
+
+  e1,e2,e3,e4 = e.T
+  m = (e3<E) & (E<e4)
+  if np.any(m):
+    e1,e2,e3,e4,y = e1[m],e2[m],e3[m],e4[m],e4[m]-E[m]
+    e41,e42,e43 = e4-e1,e4-e2,e4-e3
+    C = y**3/(4*e41*e42*e43)
+    w[m] = np.column_stack((4*C/e41, 4*C/e42, 4*C/e43, 12*C/y-4*C*(1/e41+1/e42+1/e43)))
+    dD[m] = -6*y/(e41*e42*e43)
+
+  if bloechl:
+    w += dD[:,None]*(np.sum(e,axis=1)[:,None]-4*e)/40
+  return w
+
+
+def tetra_occupation ( etet, E, bloechl=False ):
+  '''
+  Integration weight of the first corner of each tetrahedron for states below E
+
+  Arguments:
+      etet (ndarray): (N,4) band energies at the tetrahedron corners
+      E (float): Energy
+      bloechl (bool): If True the Blochl correction is included
+
+  Returns:
+      w (ndarray): (N,) weights, 1/4 for tetrahedra fully below E
+  '''
+  e,pos = _sort_corners(etet)
+  w = _occupation_weights(e, np.full(e.shape[0],E), bloechl)
+  return w[np.arange(e.shape[0]),pos]
+
+
+def tetra_delta ( etet, ene, bloechl=False ):
+  '''
+  Nonzero DoS weights of the first corner of each tetrahedron on an energy grid
+
+  Arguments:
+      etet (ndarray): (N,4) band energies at the tetrahedron corners
+      ene (ndarray): Sorted energy grid
+      bloechl (bool): If True the Blochl correction is included
+
+  Returns:
+      ind (ndarray): Index of the tetrahedron of each weight
+      ie (ndarray): Index of the energy of each weight
+      w (ndarray): Weights
+  '''
+  e,pos = _sort_corners(etet)
+
+  # Only energies strictly inside (e1,e4) contribute
+  lo = np.searchsorted(ene, e[:,0], side='right')
+  cnt = np.maximum(np.searchsorted(ene, e[:,3], side='left')-lo, 0)
+  ind = np.repeat(np.arange(e.shape[0]), cnt)
+  ie = np.arange(ind.size) - np.repeat(np.cumsum(cnt)-cnt, cnt) + lo[ind]
+
+  w = _dos_weights(e[ind], ene[ie], bloechl)
+  return ind, ie, w[np.arange(ind.size),pos[ind]]
+
+
+def tetra_count ( data_controller, corners, E_full, E, bloechl=False ):
+  '''
+  Number of states below E per k-point, from the tetrahedra owned by this rank
+
+  Arguments:
+      data_controller (DataController): Data controller
+      corners (ndarray): (snktot,24,4) Tetrahedron corners from tetra_corners
+      E_full (ndarray): (nktot,...) Band energies on the full grid
+      E (float): Energy
+      bloechl (bool): If True the Blochl correction is included
+
+  Returns:
+      N (float): Local contribution to the number of states
+  '''
+  N = 0.
+  for ks in data_controller.k_chunks(corners.shape[0]):
+    etet = np.moveaxis(E_full[corners[ks]], 2, -1)
+    N += np.sum(tetra_occupation(etet.reshape((-1,4)), E, bloechl))
+  return N/(6*E_full.shape[0])
+
+
+def do_dos_tetrahedron ( data_controller, emin, emax, ne, bloechl=False, do_pdos=False ):
+  '''
+  Density of States and Projected Density of States with the linear tetrahedron method
+
+  Arguments:
+      data_controller (DataController): Data controller holding 'E_k' (and 'v_k' for the PDoS)
+      emin (float): The minimum energy in the range to be computed
+      emax (float): The maximum energy in the range to be computed
+      ne (int): The number of points to place in the range [emin,emax]
+      bloechl (bool): If True the Blochl corrections are applied (changes the PDoS, not the total DoS)
+      do_pdos (bool): If True the orbital projected DoS is also computed
+
+  Returns:
+      None
+  '''
+  from .do_ibz import require_full_grid
+
+  arry,attr = data_controller.data_dicts()
+  require_full_grid(data_controller, 'Tetrahedron DoS')
+
+  bnd = attr['bnd']
+  nawf = attr['nawf']
+  nktot = attr['nk1']*attr['nk2']*attr['nk3']
+  emax = np.amin(np.array([attr['shift'], emax]))
+  ene = np.linspace(emin, emax, ne)
+
+  if rank == 0 and attr['verbose']:
+    print('Writing Tetrahedron DoS Files')
+
+  corners = tetra_corners(data_controller)
+  snktot = corners.shape[0]
+
+  for ispin in range(attr['nspin']):
+
+    E_full = all_eigenvalues(data_controller, arry['E_k'][:,:bnd,ispin])
+
+    dosaux = np.zeros(ne, dtype=float)
+    pdosaux = np.zeros((nawf,ne), dtype=float) if do_pdos else None
+    if do_pdos:
+      v_kaux = np.real(np.abs(arry['v_k'][:,:,:bnd,ispin])**2)
+
+    for ks in data_controller.k_chunks(snktot):
+      # Corner energies of every (k-point, tetrahedron, band)
+      etet = np.moveaxis(E_full[corners[ks]], 2, 3)
+      nks = etet.shape[0]
+      ind,ie,w = tetra_delta(etet.reshape((nks*24*bnd,4)), ene, bloechl)
+      dosaux += np.bincount(ie, weights=w, minlength=ne)
+      if do_pdos:
+        ik,ib = ind//(24*bnd)+ks.start,ind%bnd
+        for m in range(nawf):
+          pdosaux[m] += np.bincount(ie, weights=w*v_kaux[ik,m,ib], minlength=ne)
+
+    dos = np.zeros(ne, dtype=float) if rank==0 else None
+    comm.Reduce(dosaux, dos, op=MPI.SUM)
+    dosaux = None
+
+    # Each of the 6*nktot tetrahedra has volume 1/(6*nktot)
+    if rank == 0:
+      dos /= 6*nktot
+      arry['dostet'] = dos
+    data_controller.write_file_row_col('dostet_%d.dat'%ispin, ene, dos)
+    data_controller.broadcast_single_array('dostet', dtype=float)
+
+    if do_pdos:
+      pdos = np.zeros((nawf,ne), dtype=float) if rank==0 else None
+      comm.Reduce(pdosaux, pdos, op=MPI.SUM)
+      pdosaux = None
+
+      pdos_sum = None
+      if rank == 0:
+        pdos /= 6*nktot
+        pdos_sum = np.sum(pdos, axis=0)
+
+      for m in range(nawf):
+        data_controller.write_file_row_col('%d_pdostet_%d.dat'%(m,ispin), ene, (pdos[m] if rank==0 else None))
+      data_controller.write_file_row_col('pdostet_sum_%d.dat'%ispin, ene, pdos_sum)
@@ -29,6 +29,7 @@ def do_topology ( data_controller ):
   from .get_R_grid_fft import get_R_grid_fft
   from .communication import scatter_full,gather_full
   from .kpnts_interpolation_mesh import kpnts_interpolation_mesh
+  from .sparse_HRs import sparse_HRs
 
   comm = MPI.COMM_WORLD
   rank = comm.Get_rank()
@@ -79,12 +80,17 @@ def do_topology ( data_controller ):
     ktrim[8:16] = -ktrim[:8]
 
     # Compute eigenfunctions at the TRIM points
-    SRs = None
+    SRc = None
     acbn0 = False
     if 'SRs' in arrays:
-      SRs = arrays['SRs']
+      # H and S share the list of lattice vectors
+      Rc,HSc = sparse_HRs(data_controller, np.concatenate((HRs,arrays['SRs'][...,None]), axis=-1))
+      HRc,SRc = HSc[...,:nspin],HSc[...,nspin]
       acbn0 = True
-    E_ktrim,v_ktrim = do_eigh_calc(HRs, SRs, ktrim, arrays['R'], acbn0)
+    else:
+      Rc,HRc = sparse_HRs(data_controller, HRs)
+    E_ktrim,v_ktrim = do_eigh_calc(HRc, SRc, ktrim, Rc, acbn0, cache_bytes=attributes['phase_cache_bytes'])
+    Rc = HRc = SRc = HSc = None
 
     # Define time reversal operator
     if 'adhoc_SO' in attributes and attributes['adhoc_SO'] == True:
@@ -135,15 +141,9 @@ def do_topology ( data_controller ):
   kq_aux = scatter_full(arrays['kq'].T, npool)
   kq_aux = kq_aux.T
 
-  # Compute R*H(R)
-  Rfft = np.reshape(arrays['Rfft'], (nk1*nk2*nk3,3), order='C')
-  HRs = np.reshape(HRs, (nawf,nawf,nk1*nk2*nk3,nspin), order='C')
-  HRs = np.moveaxis(HRs, 2, 0)
-
-  HRs_aux = scatter_full(HRs, npool)
-  Rfft_aux = scatter_full(Rfft, npool)
-
-  HRs = np.reshape(np.moveaxis(HRs,0,2), (nawf,nawf,nk1,nk2,nk3,nspin), order='C')
+  # Compact H(R), R in units of alat and in bohr (Ra)
+  R,HRc = sparse_HRs(data_controller, HRs)
+  Ra = alat*ANGSTROM_AU*R
 
   if spin_Hall:
     Sj = arrays['Sj']
@@ -151,22 +151,8 @@ def do_topology ( data_controller ):
 
   pks = np.zeros((kq_aux.shape[1],3,bnd,bnd,nspin), dtype=complex)
   for l in range(3):
-    dHRs  = np.zeros((HRs_aux.shape[0],nawf,nawf,nspin),dtype=complex)
-    for ispin in range(nspin):
-      for n in range(nawf):
-        for m in range(nawf):
-          dHRs[:,n,m,ispin] = 1.0j*alat*ANGSTROM_AU*Rfft_aux[:,l]*HRs_aux[:,n,m,ispin]
-
-    dHRs = gather_full(dHRs, npool)
-    if rank != 0:
-      dHRs = np.zeros((nk1*nk2*nk3,nawf,nawf,nspin), dtype=complex)
-    comm.Bcast(dHRs)
-    dHRs = np.moveaxis(dHRs,0,2)
-
     # Compute dH(k)/dk on the path
-    dHks_aux = band_loop_H(dHRs, Rfft, kq_aux, nawf, nspin)
-
-    dHRs = None
+    dHks_aux = band_loop_H(1.0j*Ra[:,l,None,None,None]*HRc, R, kq_aux, attributes['phase_cache_bytes'])
 
     # Compute momenta
     for ik in range(dHks_aux.shape[0]):
@@ -184,22 +170,8 @@ def do_topology ( data_controller ):
 
     for l in range(3):
       for lp in range(3):
-        d2HRs = np.zeros((HRs_aux.shape[0],nawf,nawf,nspin), dtype=complex)
-        for ispin in range(nspin):
-          for n in range(nawf):
-            for m in range(nawf):
-              d2HRs[:,n,m,ispin] = -1.0*alat**2*ANGSTROM_AU**2*Rfft_aux[:,l]*Rfft_aux[:,lp]*HRs_aux[:,n,m,ispin]
-
-        d2HRs = gather_full(d2HRs, npool)
-        if rank != 0:
-          d2HRs = np.zeros((nk1*nk2*nk3,nawf,nawf,nspin), dtype=complex)
-        comm.Bcast(d2HRs)
-        d2HRs = np.moveaxis(d2HRs, 0, 2)
-
         # Compute d2H(k)/dk*dkp on the path
-        d2Hks_aux = band_loop_H(d2HRs, Rfft, kq_aux, nawf, nspin)
-
-        d2HRs = None
+        d2Hks_aux = band_loop_H(-1.0*(Ra[:,l]*Ra[:,lp])[:,None,None,None]*HRc, R, kq_aux, attributes['phase_cache_bytes'])
 
         # Compute kinetic energy
         for ik in range(d2Hks_aux.shape[0]):
@@ -239,7 +211,7 @@ def do_topology ( data_controller ):
 
     mkm1 = None
 
-  HRs_aux = None
+  R = Ra = HRc = None
   HRs = None
 
   # Compute Berry curvature
@@ -288,17 +260,8 @@ def do_topology ( data_controller ):
   Omj_zk = fOmj_zk = None
 
 
-def band_loop_H ( HRaux, R, kq, nawf, nspin ):
-
-  kdot = np.zeros((kq.shape[1],R.shape[0]),dtype=complex,order="C")
-  kdot = np.tensordot(R,2.0j*np.pi*kq,axes=([1],[0]))
-  np.exp(kdot,kdot)
-
-  Haux = np.zeros((nawf,nawf,kq.shape[1],nspin),dtype=complex,order="C")
-
-  for ispin in range(nspin):
-    Haux[:,:,:,ispin] = np.tensordot(HRaux[:,:,:,ispin], kdot, axes=([2],[0]))
+def band_loop_H ( HRc, R, kq, cache_bytes ):
+  from .sparse_HRs import sparse_Hk
 
-  kdot  = None
-  Haux = np.transpose(Haux,(2,0,1,3))
-  return Haux
+  # (nk,nawf,nawf,nspin) operator on the path from its compact real space blocks
+  return np.moveaxis(sparse_Hk(R, HRc, kq, cache_bytes), 2, 0)
@@ -0,0 +1,204 @@
+#
+# PAOFLOW
+#
+# Copyright 2016-2024 - Marco BUONGIORNO NARDELLI (mbn@unt.edu)
+#
+# Reference:
+#
+# F.T. Cerasoli, A.R. Supka, A. Jayaraj, I. Siloi, M. Costa, J. Slawinska, S. Curtarolo, M. Fornari, D. Ceresoli, and M. Buongiorno Nardelli,
+# Advanced modeling of materials with PAOFLOW 2.0: New features and software design, Comp. Mat. Sci. 200, 110828 (2021).
+#
+# M. Buongiorno Nardelli, F. T. Cerasoli, M. Costa, S Curtarolo,R. De Gennaro, M. Fornari, L. Liyanage, A. Supka and H. Wang,
+# PAOFLOW: A utility to construct and operate on ab initio Hamiltonians from the Projections of electronic wavefunctions on
+# Atomic Orbital bases, including characterization of topological materials, Comp. Mat. Sci. vol. 143, 462 (2018).
+#
+# This file is distributed under the terms of the
+# GNU General Public License. See the file `License'
+# in the root directory of the present distribution,
+# or http://www.gnu.org/copyleft/gpl.txt .
+
+import numpy as np
+
+# Multi-dimensional FFTs used throughout PAOFLOW.
+# The backend is selected once per process with set_fft_backend,
+# modules call fftn and ifftn from here instead of a specific library.
+
+backends = ['scipy', 'numpy', 'pyfftw', 'cuda']
+
+fft_config = {'backend':'scipy', 'threads':1, 'planner':'FFTW_MEASURE'}
+
+# Largest total size of the pyFFTW work arrays kept between calls
+FFT_BUFFER_BYTES = 1<<28
+
+# Cached transforms, keyed by (direction, shape, dtype, axes)
+fft_plans = {}
+# Aligned in-place work arrays for pyFFTW, shared by the plans of the same shape
+fft_buffers = {}
+
+
+def default_threads ( comm ):
+  '''
+  Number of FFT threads for each rank, an even share of the cores available on its node.
+  Collective over 'comm'.
+
+  Arguments:
+      comm (Comm): MPI communicator of the run
+
+  Returns:
+      threads (int): The cores of the node divided by the number of ranks of 'comm' on the node,
+                     and no more than the cores in this process' CPU affinity, at least 1
+  '''
+  from os import cpu_count
+  from mpi4py import MPI
+
+  node = comm.Split_type(MPI.COMM_TYPE_SHARED)
+  nlocal = node.Get_size()
+  node.Free()
+
+  # Ranks bound to their own cores already see only their share in the affinity mask
+  nshare = (cpu_count() or 1)//nlocal
+  try:
+    from os import sched_getaffinity
+    nshare = min(nshare, len(sched_getaffinity(0)))
+  except ImportError:
+    pass
+
+  return max(1, nshare)
+
+
+def set_fft_backend ( backend='scipy', threads=1, planner='FFTW_MEASURE' ):
+  '''
+  Select the library performing FFTs in this process and clear the plan cache
+
+  Arguments:
+      backend (str): 'scipy' (scipy.fft), 'numpy' (numpy.fft), 'pyfftw' or 'cuda' (scikit-cuda)
+      threads (int): Number of threads used by each transform (ignored by 'numpy' and 'cuda')
+      planner (str): FFTW planner effort for the 'pyfftw' backend
+
+  Returns:
+      None
+  '''
+  backend = backend.lower()
+  if backend not in backends:
+    raise ValueError('FFT backend \'%s\' not supported. Choose from %s'%(backend,', '.join(backends)))
+
+  if backend == 'pyfftw':
+    import pyfftw
+  elif backend == 'cuda':
+    from . import cuda_fft
+
+  fft_config['backend'] = backend
+  fft_config['threads'] = max(1, int(threads))
+  fft_config['planner'] = planner
+  clear_fft_plans()
+
+
+def clear_fft_plans ( ):
+  '''
+  Release all cached transforms and their work arrays
+
+  Arguments:
+      None
+
+  Returns:
+      None
+  '''
+  fft_plans.clear()
+  fft_buffers.clear()
+
+
+def get_plan ( forward, shape, dtype, axes ):
+  '''
+  Return the cached transform for arrays of 'shape' and 'dtype', creating it on first use
+
+  Arguments:
+      forward (bool): True for the forward transform, False for the inverse
+      shape (tuple): Shape of the input array
+      dtype (dtype): Data type of the input array
+      axes (tuple): Axes to transform
+
+  Returns:
+      plan (callable): Function of the input array returning its transform
+  '''
+  key = (forward, shape, np.dtype(dtype).str, axes)
+  if key in fft_plans:
+    return fft_plans[key]
+
+  backend,threads = fft_config['backend'],fft_config['threads']
+
+  if backend == 'scipy':
+    from scipy import fft as FFT
+    func = FFT.fftn if forward else FFT.ifftn
+    plan = lambda a : func(a, axes=axes, workers=threads)
+
+  elif backend == 'numpy':
+    func = np.fft.fftn if forward else np.fft.ifftn
+    plan = lambda a : func(a, axes=axes)
+
+  elif backend == 'pyfftw':
+    import pyfftw
+    direction = 'FFTW_FORWARD' if forward else 'FFTW_BACKWARD'
+    nbytes = int(np.prod(shape))*np.dtype(complex).itemsize
+    if nbytes > FFT_BUFFER_BYTES:
+      # Arrays as large as the k grid blocks are transformed once with a temporary buffer, nothing is kept
+      def plan ( a ):
+        buf = pyfftw.empty_aligned(shape, dtype=complex)
+        fftw = pyfftw.FFTW(buf, buf, axes=axes, direction=direction, threads=threads, flags=('FFTW_ESTIMATE',))
+        buf[...] = a
+        fftw()
+        return buf
+      return plan
+
+    if shape not in fft_buffers:
+      if nbytes+sum(b.nbytes for b in fft_buffers.values()) > FFT_BUFFER_BYTES:
+        clear_fft_plans()
+      fft_buffers[shape] = pyfftw.empty_aligned(shape, dtype=complex)
+    buf = fft_buffers[shape]
+    # Planning may overwrite 'buf', the input is copied in on every call
+    fftw = pyfftw.FFTW(buf, buf, axes=axes, direction=direction, threads=threads, flags=(fft_config['planner'],))
+    def plan ( a ):
+      buf[...] = a
+      fftw()
+      return buf.copy()
+
+  elif backend == 'cuda':
+    from .cuda_fft import cuda_fftn,cuda_ifftn
+    func = cuda_fftn if forward else cuda_ifftn
+    # cuda_fft transforms leading axes only
+    nax = len(axes)
+    def plan ( a ):
+      a = np.moveaxis(a, axes, range(nax))
+      return np.moveaxis(func(a, axes=list(range(nax))), range(nax), axes)
+
+  fft_plans[key] = plan
+  return plan
+
+
+def fftn ( a, axes=None ):
+  '''
+  Forward multi-dimensional FFT with the selected backend
+
+  Arguments:
+      a (ndarray): Input array
+      axes (tuple): Axes to transform (default is all axes)
+
+  Returns:
+      The transformed array
+  '''
+  axes = tuple(range(a.ndim)) if axes is None else tuple(int(i) for i in np.arange(a.ndim)[list(axes)])
+  return get_plan(True, a.shape, a.dtype, axes)(a)
+
+
+def ifftn ( a, axes=None ):
+  '''
+  Inverse multi-dimensional FFT with the selected backend
+
+  Arguments:
+      a (ndarray): Input array
+      axes (tuple): Axes to transform (default is all axes)
+
+  Returns:
+      The transformed array
+  '''
+  axes = tuple(range(a.ndim)) if axes is None else tuple(int(i) for i in np.arange(a.ndim)[list(axes)])
+  return get_plan(False, a.shape, a.dtype, axes)(a)
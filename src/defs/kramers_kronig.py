@@ -0,0 +1,98 @@
+#
+# PAOFLOW
+#
+# Copyright 2016-2024 - Marco BUONGIORNO NARDELLI (mbn@unt.edu)
+#
+# Reference:
+#
+# F.T. Cerasoli, A.R. Supka, A. Jayaraj, I. Siloi, M. Costa, J. Slawinska, S. Curtarolo, M. Fornari, D. Ceresoli, and M. Buongiorno Nardelli,
+# Advanced modeling of materials with PAOFLOW 2.0: New features and software design, Comp. Mat. Sci. 200, 110828 (2021).
+#
+# M. Buongiorno Nardelli, F. T. Cerasoli, M. Costa, S Curtarolo,R. De Gennaro, M. Fornari, L. Liyanage, A. Supka and H. Wang,
+# PAOFLOW: A utility to construct and operate on ab initio Hamiltonians from the Projections of electronic wavefunctions on
+# Atomic Orbital bases, including characterization of topological materials, Comp. Mat. Sci. vol. 143, 462 (2018).
+#
+# This file is distributed under the terms of the
+# GNU General Public License. See the file `License'
+# in the root directory of the present distribution,
+# or http://www.gnu.org/copyleft/gpl.txt .
+
+# Kramers-Kronig transforms of response functions sampled on uniform energy grids.
+# The spectra may be stacked, the transform acts on their last axis.
+
+import numpy as np
+
+# Largest number of kernel elements held at once by kramers_kronig_imaginary
+KK_CHUNK = 1<<22
+
+
+def kramers_kronig ( ene, spec ):
+  '''
+  Principal value integral (2/pi) P int w' spec(w') / (w'^2 - w^2) dw' over the energies of the grid,
+  i.e. the real part of a causal response (less its high energy limit) from its imaginary part.
+  With w'/(w'^2-w^2) = (1/(w'-w) + 1/(w'+w))/2 both terms are discrete convolutions on the uniform
+  grid, evaluated with zero padded FFTs in O(n log n). The singular sums use Maclaurin's rule
+  (every other grid point, with twice the weight), and spec is taken to vanish outside the grid.
+
+  Arguments:
+      ene (ndarray): Uniform energy grid (n,), starting at or above zero
+      spec (ndarray): Imaginary part of the response on the grid, (...,n)
+
+  Returns:
+      The transform at every energy of the grid, (...,n)
+  '''
+  from scipy.fft import rfft, irfft, next_fast_len
+
+  spec = np.asarray(spec, dtype=float)
+  n = ene.size
+  de = (ene[-1]-ene[0])/(n-1)
+  nfft = next_fast_len(2*n-1, real=True)
+
+  # 1/(w'-w) for w'-w = m*de, m = -(n-1)..(n-1), wrapped onto the circular grid
+  m = np.arange(1, n, 2)
+  kern = np.zeros(nfft, dtype=float)
+  kern[m] = -2./m
+  kern[nfft-m] = 2./m
+  A = irfft(rfft(spec, nfft)*rfft(kern), nfft)[...,:n]
+
+  # 1/(w'+w) for w'+w = (2*w_0/de + t)*de, t = 0..2(n-1), correlated with the reversed spectrum.
+  # If the grid is aligned with w = 0 this term holds the mirror image of the singularity
+  t0 = 2.*ene[0]/de
+  s = t0 + np.arange(2*n-1)
+  if abs(t0-np.round(t0)) < 1.e-3:
+    odd = (np.round(s).astype(int)%2 == 1)
+    hank = np.zeros(2*n-1, dtype=float)
+    hank[odd] = 2./s[odd]
+  else:
+    hank = 1./s
+  B = irfft(rfft(spec[...,::-1], nfft)*rfft(hank, nfft), nfft)[...,n-1:2*n-1]
+
+  return (A+B)/np.pi
+
+
+def kramers_kronig_imaginary ( ene, spec, w ):
+  '''
+  Response on the imaginary frequency axis from its imaginary part on the real axis,
+  (2/pi) int w' spec(w') / (w'^2 + w^2) dw'. The kernel is smooth, so the integral is a
+  product with the (len(w),n) kernel matrix, formed KK_CHUNK elements at a time.
+
+  Arguments:
+      ene (ndarray): Uniform energy grid (n,)
+      spec (ndarray): Imaginary part of the response on the grid, (...,n)
+      w (ndarray): Imaginary frequencies
+
+  Returns:
+      The transform at every w, (...,len(w))
+  '''
+  spec = np.asarray(spec, dtype=float)
+  n = ene.size
+  de = (ene[-1]-ene[0])/(n-1)
+
+  wspec = ene*spec
+  out = np.empty(spec.shape[:-1]+(w.size,), dtype=float)
+  wchunk = max(1, KK_CHUNK//n)
+  for i0 in range(0, w.size, wchunk):
+    ws = w[i0:i0+wchunk]
+    out[...,i0:i0+ws.size] = wspec @ (1./(ene[:,None]**2+ws[None,:]**2))
+
+  return (2./np.pi)*de*out
@@ -0,0 +1,83 @@
+#
+# PAOFLOW
+#
+# Copyright 2016-2024 - Marco BUONGIORNO NARDELLI (mbn@unt.edu)
+#
+# Reference:
+#
+# F.T. Cerasoli, A.R. Supka, A. Jayaraj, I. Siloi, M. Costa, J. Slawinska, S. Curtarolo, M. Fornari, D. Ceresoli, and M. Buongiorno Nardelli,
+# Advanced modeling of materials with PAOFLOW 2.0: New features and software design, Comp. Mat. Sci. 200, 110828 (2021).
+#
+# M. Buongiorno Nardelli, F. T. Cerasoli, M. Costa, S Curtarolo,R. De Gennaro, M. Fornari, L. Liyanage, A. Supka and H. Wang,
+# PAOFLOW: A utility to construct and operate on ab initio Hamiltonians from the Projections of electronic wavefunctions on
+# Atomic Orbital bases, including characterization of topological materials, Comp. Mat. Sci. vol. 143, 462 (2018).
+#
+# This file is distributed under the terms of the
+# GNU General Public License. See the file `License'
+# in the root directory of the present distribution,
+# or http://www.gnu.org/copyleft/gpl.txt .
+
+# Persistent store of the real space PAO Hamiltonian.
+# The store uses the container of parse_cache, keyed by a format version, and holds
+# HRs (and SRs, when present) with the lattice, shell and run metadata required
+# to continue a calculation without reading the projections again.
+
+STORE_VERSION = 1
+STORE_KEY = ('PAOFLOW Hamiltonian', STORE_VERSION)
+
+# k-space arrays which are either consumed by pao_hamiltonian or rebuilt from HRs
+SKIP_ARRAYS = ('U', 'Sks', 'Hks')
+
+# Attributes describing the run rather than the Hamiltonian. These are set by the run reading the store
+RUN_ATTRIBUTES = ('mpisize', 'workpath', 'outputdir', 'opath', 'inputfile', 'savedir', 'fpath', 'npool',
+                  'smearing', 'temp', 'verbose', 'abort_on_exception', 'parse_cache', 'fft_backend',
+                  'fft_threads', 'use_cuda', 'out_of_core', 'ooc_path')
+
+
+def write_pao_store ( data_controller, fname ):
+  '''
+  Write the real space Hamiltonian and the data describing it to a store file.
+  Must be called on rank 0 after pao_hamiltonian.
+
+  Arguments:
+      data_controller (DataController): Data controller holding 'HRs'
+      fname (str): Path of the store file
+
+  Returns:
+      None
+  '''
+  from .parse_cache import write_parse_cache
+
+  arry,attr = data_controller.data_dicts()
+
+  arrays = {k:v for k,v in arry.items() if k not in SKIP_ARRAYS}
+  attributes = {k:v for k,v in attr.items() if k not in RUN_ATTRIBUTES}
+
+  write_parse_cache(fname, STORE_KEY, arrays, attributes)
+
+
+def read_pao_store ( data_controller, fname ):
+  '''
+  Populate the DataController from a store file written by write_pao_store.
+  Arrays are memory-mapped, so only the parts which are used are read from disk.
+
+  Arguments:
+      data_controller (DataController): Data controller to populate
+      fname (str): Path of the store file
+
+  Returns:
+      None
+  '''
+  from os.path import exists
+  from .parse_cache import load_parse_cache
+
+  if not exists(fname):
+    raise OSError('Hamiltonian store %s not found.'%fname)
+
+  stored = load_parse_cache(fname, STORE_KEY)
+  if stored is None:
+    raise ValueError('%s is not a PAOFLOW Hamiltonian store of version %d.'%(fname,STORE_VERSION))
+
+  arry,attr = data_controller.data_dicts()
+  arry.update(stored[0])
+  attr.update(stored[1])
@@ -27,6 +27,7 @@ from .communication import scatter_full, gather_full, gather_scatter
 from scipy.spatial.distance import cdist
 from mpi4py import MPI
 from .zero_pad import zero_pad
+from .fft_backend import fftn,ifftn
 import time
 
 comm = MPI.COMM_WORLD
@@ -593,43 +594,55 @@ def mat2eul(R):
 ############################################################################################
 ############################################################################################
 
-def find_equiv_k(kp, symop, full_grid, sym_TR, check=True, include_self=False):
-  # find indices and symops that generate full grid H from wedge H
-  orig_k_ind = []
-  new_k_ind = []
-  si_per_k = []
-  counter = 0
-  kp_track = []
-  kp = correct_roundoff(kp)
+def grid_index_table(full_grid):
+  # integer lattice hash of a regular k grid: the flat index of round((k-k0)*nk) mod nk
+  # points to the row of k in full_grid (-1 where the grid has no point)
+  nk = np.array([np.unique(np.round(full_grid[:, i] % 1.0, decimals=6) % 1.0).shape[0] for i in range(3)])
+  k0 = full_grid[0]
 
-  full_grid_mask = np.copy(full_grid)
+  table = -np.ones(np.prod(nk), dtype=int)
+  table[grid_flat_index(full_grid, nk, k0)] = np.arange(full_grid.shape[0])
 
-  for isym in range(symop.shape[0]):
-    # transform k -> k' with the sym op
-    if sym_TR[isym]:
-      newk = ((((-symop[isym] @ (kp.T % 1.0)) % 1.0) + 0.5) % 1.0) - 0.5
-    else:
-      newk = ((((symop[isym] @ (kp.T % 1.0)) % 1.0) + 0.5) % 1.0) - 0.5
-    newk = correct_roundoff(newk)
-    newk[np.where(np.isclose(newk, 0.5))] = -0.5
-    newk[np.where(np.isclose(newk, -1.0))] = 0.0
-    newk[np.where(np.isclose(newk, 1.0))] = 0.0
+  return nk, k0, table
 
-    # find index in the full grid where this k -> k' with this sym op
-    nw = np.where(np.isclose(cdist(newk.T, full_grid_mask), 0.0, atol=1.e-6, rtol=1.e-6, ))
 
-    if not include_self:
-      full_grid_mask[nw[1]] = np.ma.masked
+def grid_flat_index(k, nk, k0):
+  # flat index of the grid point nearest to each k in the lattice spanned by nk and k0
+  ki = np.rint((k - k0) * nk).astype(int) % nk
+  return np.ravel_multi_index(ki.T, nk)
 
-    new_k_ind.extend(nw[1].tolist())
-    si_per_k.extend([isym] * nw[1].shape[0])
-    orig_k_ind.extend(nw[0].tolist())
 
-  new_k_ind = np.array(new_k_ind)
-  orig_k_ind = np.array(orig_k_ind)
-  si_per_k = np.array(si_per_k)
+def find_equiv_k(kp, symop, full_grid, sym_TR, check=True, include_self=False, grid_index=None):
+  # find indices and symops that generate full grid H from wedge H
+  # grid_index is the table from grid_index_table(full_grid); pass it when calling repeatedly on the same grid
+  counter = 0
+  kp = correct_roundoff(kp)
+
+  if grid_index is None:
+    grid_index = grid_index_table(full_grid)
+  nk, k0, table = grid_index
+
+  # transform k -> k' with every sym op at once, (nsym,nkp,3)
+  sign = np.where(np.asarray(sym_TR, dtype=bool), -1.0, 1.0)[:, None, None]
+  newk = ((((sign * symop) @ (kp.T % 1.0)) % 1.0) + 0.5) % 1.0 - 0.5
+  newk = correct_roundoff(newk)
+  newk[np.where(np.isclose(newk, 0.5))] = -0.5
+  newk[np.where(np.isclose(newk, -1.0))] = 0.0
+  newk[np.where(np.isclose(newk, 1.0))] = 0.0
+  newk = np.transpose(newk, (0, 2, 1))
+
+  # find index in the full grid where k -> k' by hashing k' onto the integer lattice
+  nw = table[grid_flat_index(newk.reshape(-1, 3), nk, k0)]
+  match = nw >= 0
+  match[match] = np.linalg.norm(full_grid[nw[match]] - newk.reshape(-1, 3)[match], axis=1) <= 1.e-6
+
+  # matches are ordered by symop first and wedge k second
+  new_k_ind = nw[match]
+  si_per_k = np.repeat(np.arange(symop.shape[0]), kp.shape[0])[match]
+  orig_k_ind = np.tile(np.arange(kp.shape[0]), symop.shape[0])[match]
 
   if not include_self:
+    # keep the first symop that reaches each k'
     inds = np.unique(new_k_ind, return_index=True)
 
     new_k_ind = new_k_ind[inds[1]]
@@ -695,11 +708,53 @@ def get_phase_shifts(atom_pos, symop, equiv_atom):
 ############################################################################################
 
 def get_U_k(k, shift, a_index, U):
-  # add phase shift to U
-  U_k = U * np.exp(2.0j * np.pi * (shift[a_index] @ k))
+  # add phase shift to U, for a single k (3,) or a stack of k (nk,3)
+  U_k = U * np.exp(2.0j * np.pi * (k @ shift[a_index].T))[..., None, :]
   return U_k
 
 
+############################################################################################
+############################################################################################
+############################################################################################
+
+def apply_symops(H, k, si, U, a_index, phase_shifts, inv_flag, U_inv, sym_TR, spin_orb, reverse=False):
+  # transform each H(k) in the stack H (n,nawf,nawf) with the symop si[j]
+  # entries sharing a symop are transformed together with one batched product
+  THP = np.empty_like(H)
+
+  for isym in np.unique(si):
+    sel = np.flatnonzero(si == isym)
+
+    # if symop is identity
+    if isym == 0:
+      THP[sel] = H[sel]
+      continue
+
+    # k dependent U for every k sharing this symop
+    U_k = get_U_k(k[sel], phase_shifts[isym], a_index, U[isym])
+    U_kH = np.conj(np.swapaxes(U_k, 1, 2))
+
+    # transformated H(k)
+    if not reverse:
+      T = U_k @ H[sel] @ U_kH
+    else:
+      T = U_kH @ H[sel] @ U_k
+
+    # apply inversion operator if needed
+    if inv_flag[isym]:
+      T *= U_inv
+
+    # time inversion is anti-unitary
+    if sym_TR[isym]:
+      if spin_orb:
+        T *= U_inv
+      T = np.conj(T)
+
+    THP[sel] = T
+
+  return THP
+
+
 ############################################################################################
 ############################################################################################
 ############################################################################################
@@ -872,42 +927,12 @@ def wedge_to_grid(Hksp, U, a_index, phase_shifts, kp, new_k_ind, orig_k_ind, si_
   orig_k_ind = scatter_full(orig_k_ind, npool)
   si_per_k = scatter_full(si_per_k, npool)
 
-  Hksp_s = np.zeros((new_k_ind.shape[0], nawf, nawf), dtype=complex)
-
-  for j in range(new_k_ind.shape[0]):
-    isym = si_per_k[j]
-    oki = orig_k_ind[j]
-    nki = np.where(new_k_ind[j] == fgm)[0]
+  # position of each target k in the local block of the full grid
+  nki = np.searchsorted(fgm, new_k_ind)
 
-    # if symop is identity
-    if isym == 0:
-      Hksp_s[nki] = Hksp[oki]
-      continue
-
-    # other cases
-    H = Hksp[oki]
-
-    # get k dependent U
-    U_k = get_U_k(kp[oki], phase_shifts[isym], a_index, U[isym])
-
-    # transformated H(k)
-    THP = U_k @ H @ np.conj(U_k.T)
-
-    # apply inversion operator if needed
-    if inv_flag[isym]:
-      THP *= U_inv
-
-    # time inversion is anti-unitary
-    # old version
-    # if sym_TR[isym]:
-    #    THP *= U_inv
-    #    THP = np.conj(THP)
-    if sym_TR[isym]:
-      if spin_orb:
-        THP *= U_inv
-      THP = np.conj(THP)
-
-    Hksp_s[nki] = THP
+  Hksp_s = np.zeros((new_k_ind.shape[0], nawf, nawf), dtype=complex)
+  Hksp_s[nki] = apply_symops(Hksp[orig_k_ind], kp[orig_k_ind], si_per_k, U, a_index, phase_shifts,
+                             inv_flag, U_inv, sym_TR, spin_orb)
 
   # make sure of hermiticity of each H(k)
   Hksp_s = enforce_hermaticity(Hksp_s)
@@ -965,7 +990,8 @@ def open_grid(Hksp, full_grid, kp, symop, symop_cart, atom_pos, shells, a_index,
 
   # get index of k in wedge, index in full grid,
   # and index of symop that transforms k to k'
-  new_k_ind, orig_k_ind, si_per_k = find_equiv_k(kp, symop, full_grid, sym_TR, check=True)
+  grid_index = grid_index_table(full_grid)
+  new_k_ind, orig_k_ind, si_per_k = find_equiv_k(kp, symop, full_grid, sym_TR, check=True, grid_index=grid_index)
 
   # transform H(k) -> H(k')
   Hksp = wedge_to_grid(Hksp, U, a_index, phase_shifts, kp,
@@ -990,7 +1016,8 @@ def open_grid(Hksp, full_grid, kp, symop, symop_cart, atom_pos, shells, a_index,
     nkl = []
     partial_grid = scatter_full(full_grid, npool)
     for i in range(partial_grid.shape[0]):
-      nkl.append(find_equiv_k(partial_grid[i][None], symop_inv, full_grid, sym_TR, check=False, include_self=True))
+      nkl.append(find_equiv_k(partial_grid[i][None], symop_inv, full_grid, sym_TR, check=False, include_self=True,
+                              grid_index=grid_index))
     nkl_no_interp = np.array(nkl)
     Hksp, tmax = symmetrize_grid(Hksp, U, a_index, phase_shifts, inv_flag, U_inv, sym_TR,
                                  full_grid, jchia, spin_orb, mag_calc, nk1, nk2, nk3,
@@ -1004,11 +1031,13 @@ def open_grid(Hksp, full_grid, kp, symop, symop_cart, atom_pos, shells, a_index,
     nfft3 = nk3 + upscale3
 
     full_grid_interp = get_full_grid(nfft1, nfft2, nfft3, o1, o2, o3)
+    grid_index_interp = grid_index_table(full_grid_interp)
     nkl = []
     partial_grid_interp = scatter_full(full_grid_interp, npool)
     for i in range(partial_grid_interp.shape[0]):
       nkl.append(
-        find_equiv_k(partial_grid_interp[i][None], symop_inv, full_grid_interp, sym_TR, check=False, include_self=True))
+        find_equiv_k(partial_grid_interp[i][None], symop_inv, full_grid_interp, sym_TR, check=False, include_self=True,
+                     grid_index=grid_index_interp))
     nkl_interp = np.array(nkl)
     # max difference bewtween H(k) and H(k*)
     tmax = 999999
@@ -1030,7 +1059,7 @@ def open_grid(Hksp, full_grid, kp, symop, symop_cart, atom_pos, shells, a_index,
       Hksp = scatter_full(Hksp, npool)
 
       Hksp = np.reshape(Hksp, (Hksp.shape[0], nk1, nk2, nk3))
-      HRs = np.fft.ifftn(Hksp, axes=(1, 2, 3))
+      HRs = ifftn(Hksp, axes=(1, 2, 3))
 
       switch = True
       if switch == True:
@@ -1039,7 +1068,7 @@ def open_grid(Hksp, full_grid, kp, symop, symop_cart, atom_pos, shells, a_index,
         Hksp = np.zeros((HRs.shape[0], nfft1, nfft2, nfft3), dtype=complex)
 
         for m in range(Hksp.shape[0]):
-          Hksp[m, :, :, :] = np.fft.fftn(zero_pad(HRs[m, :, :, :], nk1, nk2, nk3, add1, add2, add3))
+          Hksp[m, :, :, :] = fftn(zero_pad(HRs[m, :, :, :], nk1, nk2, nk3, add1, add2, add3))
         #                     if not i%2:
         #                         Hksp[m,:,:,:]=np.fft.fftn(zero_pad(HRs[m,:,:,:],nk1,nk2,nk3,add1,add2,add3))
         #                     else:
@@ -1079,7 +1108,7 @@ def open_grid(Hksp, full_grid, kp, symop, symop_cart, atom_pos, shells, a_index,
         for m in range(Hksp.shape[0]):
           HRs[m, :, :, :] = zero_pad(Hksp[m, :, :, :], nk1, nk2, nk3, add1, add2, add3)
         Hksp = None
-        Hksp = np.fft.fftn(HRs, axes=(1, 2, 3))
+        Hksp = fftn(HRs, axes=(1, 2, 3))
         HRs = None
         Hksp = np.reshape(Hksp, (Hksp.shape[0], nfft1 * nfft2 * nfft3))
         Hksp = gather_scatter(Hksp, 1, npool)
@@ -1160,7 +1189,8 @@ def open_grid_nspin2(Hksp, full_grid, kp, symop, symop_cart, atom_pos, shells, a
 
   # get index of k in wedge, index in full grid,
   # and index of symop that transforms k to k'
-  new_k_ind, orig_k_ind, si_per_k = find_equiv_k(kp, symop, full_grid, sym_TR, check=True)
+  grid_index = grid_index_table(full_grid)
+  new_k_ind, orig_k_ind, si_per_k = find_equiv_k(kp, symop, full_grid, sym_TR, check=True, grid_index=grid_index)
 
 
   # transform H(k) -> H(k')
@@ -1205,7 +1235,8 @@ def open_grid_nspin2(Hksp, full_grid, kp, symop, symop_cart, atom_pos, shells, a
     nkl = []
     partial_grid = scatter_full(full_grid, npool)
     for i in range(partial_grid.shape[0]):
-      nkl.append(find_equiv_k(partial_grid[i][None], symop_inv, full_grid, sym_TR, check=False, include_self=True))
+      nkl.append(find_equiv_k(partial_grid[i][None], symop_inv, full_grid, sym_TR, check=False, include_self=True,
+                              grid_index=grid_index))
     nkl_no_interp = np.array(nkl)
 
     Hksp, tmax = symmetrize_grid_nspin2(Hksp, U, a_index, phase_shifts, inv_flag, U_inv, sym_TR,
@@ -1220,11 +1251,13 @@ def open_grid_nspin2(Hksp, full_grid, kp, symop, symop_cart, atom_pos, shells, a
     nfft3 = nk3 + upscale3
 
     full_grid_interp = get_full_grid(nfft1, nfft2, nfft3, o1, o2, o3)
+    grid_index_interp = grid_index_table(full_grid_interp)
     nkl = []
     partial_grid_interp = scatter_full(full_grid_interp, npool)
     for i in range(partial_grid_interp.shape[0]):
       nkl.append(
-        find_equiv_k(partial_grid_interp[i][None], symop_inv, full_grid_interp, sym_TR, check=False, include_self=True))
+        find_equiv_k(partial_grid_interp[i][None], symop_inv, full_grid_interp, sym_TR, check=False, include_self=True,
+                     grid_index=grid_index_interp))
     nkl_interp = np.array(nkl)
     # max difference bewtween H(k) and H(k*)
     tmax = [999999,999999]
@@ -1246,14 +1279,14 @@ def open_grid_nspin2(Hksp, full_grid, kp, symop, symop_cart, atom_pos, shells, a
       Hksp = scatter_full(Hksp, npool)
 
       Hksp = np.reshape(Hksp, (Hksp.shape[0], nk1, nk2, nk3, 2))
-      HRs = np.fft.ifftn(Hksp, axes=(1, 2, 3))
+      HRs = ifftn(Hksp, axes=(1, 2, 3))
 
       Hksp = None
       Hksp = np.zeros((HRs.shape[0], nfft1, nfft2, nfft3, 2), dtype=complex)
 
       for m in range(Hksp.shape[0]):
-        Hksp[m, :, :, :, 0] = np.fft.fftn(zero_pad(HRs[m, :, :, :, 0], nk1, nk2, nk3, add1, add2, add3))
-        Hksp[m, :, :, :, 1] = np.fft.fftn(zero_pad(HRs[m, :, :, :, 1], nk1, nk2, nk3, add1, add2, add3))
+        Hksp[m, :, :, :, 0] = fftn(zero_pad(HRs[m, :, :, :, 0], nk1, nk2, nk3, add1, add2, add3))
+        Hksp[m, :, :, :, 1] = fftn(zero_pad(HRs[m, :, :, :, 1], nk1, nk2, nk3, add1, add2, add3))
 
       HRs = None
       Hksp = np.reshape(Hksp, (Hksp.shape[0], nfft1 * nfft2 * nfft3, 2))
@@ -1439,69 +1472,43 @@ def open_grid_wrapper(data_controller):
 
 def symmetrize(Hksp, U, a_index, phase_shifts, new_k_ind, orig_k_ind, si_per_k, inv_flag, U_inv, sym_TR, spin_orb,
                full_grid, reverse=False):
-  # generates full grid from k points in IBZ
+  # H(k') for every k' in new_k_ind transformed with the symop in si_per_k
+  # new_k_ind and si_per_k may hold several k points, e.g. (npts,nsym)
   nawf = Hksp.shape[1]
-  Hksp_s = np.zeros((new_k_ind.shape[0], nawf, nawf), dtype=complex)
+  nki = np.ravel(new_k_ind)
 
-  for j in range(new_k_ind.shape[0]):
-    isym = si_per_k[j]
-    oki = orig_k_ind[j]
-    nki = new_k_ind[j]
+  Hksp_s = apply_symops(Hksp[nki], full_grid[nki], np.ravel(si_per_k), U, a_index, phase_shifts,
+                        inv_flag, U_inv, sym_TR, spin_orb, reverse)
 
-    # if symop is identity
-    if isym == 0:
-      Hksp_s[j] = Hksp[nki]
-      continue
-
-    # other cases
-    H = Hksp[nki]
-
-    # get k dependent U
-    U_k = get_U_k(full_grid[nki], phase_shifts[isym], a_index, U[isym])
-
-    # transformated H(k)
-    if not reverse:
-      THP = U_k @ H @ np.conj(U_k.T)
-    else:
-      THP = np.conj(U_k.T) @ H @ U_k
-
-    # apply inversion operator if needed
-    if inv_flag[isym]:
-      THP *= U_inv
-
-    # time inversion is anti-unitary
-    # old version
-    # if sym_TR[isym]:
-    #    THP *= U_inv
-    #    THP = np.conj(THP)
-    if sym_TR[isym]:
-      if spin_orb:
-        THP *= U_inv
-      THP = np.conj(THP)
-
-    Hksp_s[j] = THP
-
-  return Hksp_s
+  return Hksp_s.reshape(np.shape(new_k_ind) + (nawf, nawf))
 
 
 ############################################################################################
 ############################################################################################
 ############################################################################################
 
+def symm_chunk(nkl, nmat=4096):
+  # number of k points symmetrized together, so that about nmat matrices are transformed at once
+  return max(1, nmat // max(1, nkl.shape[-1]))
+
+
 def symmetrize_grid(Hksp, U, a_index, phase_shifts, inv_flag, U_inv, sym_TR, full_grid, jchia, spin_orb,
                     mag_calc, nk1, nk2, nk3, nkl, partial_grid, npool):
   max_iter = 1
   tmax = []
   Hksp_d = np.zeros((partial_grid.shape[0], Hksp.shape[1], Hksp.shape[2]), dtype=complex)
 
-  for i in range(partial_grid.shape[0]):
-    new_k_ind, orig_k_ind, si_per_k = nkl[i]
+  # all symops of a chunk of k points are applied together
+  pchunk = symm_chunk(nkl)
+  for i in range(0, partial_grid.shape[0], pchunk):
+    ps = slice(i, i + pchunk)
+    new_k_ind, orig_k_ind, si_per_k = nkl[ps, 0], nkl[ps, 1], nkl[ps, 2]
 
     temp = symmetrize(Hksp, U, a_index, phase_shifts, new_k_ind,
                       orig_k_ind, si_per_k, inv_flag, U_inv, sym_TR, spin_orb, full_grid)
 
-    tmax.append(np.amax(np.abs(temp[0][None] - temp)))
-    Hksp_d[i] = np.sum(temp, axis=0) / (temp.shape[0])
+    tmax.append(np.amax(np.abs(temp[:, :1] - temp)))
+    Hksp_d[ps] = np.sum(temp, axis=1) / (temp.shape[1])
 
   # make sure of hermiticity of each H(k)
   Hksp_d = enforce_hermaticity(Hksp_d)
@@ -1530,8 +1537,12 @@ def symmetrize_grid_nspin2(Hksp, U, a_index, phase_shifts, inv_flag, U_inv, sym_
   H1 = Hksp[..., 1]
   Hksp_d_up = np.zeros((partial_grid.shape[0], nawf, nawf), dtype=complex)
   Hksp_d_down = np.zeros((partial_grid.shape[0], nawf, nawf), dtype=complex)
-  for i in range(partial_grid.shape[0]):
-    new_k_ind, orig_k_ind, si_per_k = nkl[i]
+
+  # all symops of a chunk of k points are applied together
+  pchunk = symm_chunk(nkl)
+  for i in range(0, partial_grid.shape[0], pchunk):
+    ps = slice(i, i + pchunk)
+    new_k_ind, orig_k_ind, si_per_k = nkl[ps, 0], nkl[ps, 1], nkl[ps, 2]
     temp0 = symmetrize(H0, U, a_index, phase_shifts, new_k_ind,
                       orig_k_ind, si_per_k, inv_flag, U_inv, sym_TR, False, full_grid)
     temp1 = symmetrize(H1, U, a_index, phase_shifts, new_k_ind,
@@ -1539,18 +1550,18 @@ def symmetrize_grid_nspin2(Hksp, U, a_index, phase_shifts, inv_flag, U_inv, sym_
     if np.any(sym_TR) and (not np.all(sym_TR)):
       temp_up = np.zeros_like(temp0)
       temp_down = np.zeros_like(temp1)
-      temp_up[~sym_TR] = temp0[~sym_TR]
-      temp_up[sym_TR] = temp1[sym_TR]
-      temp_down[~sym_TR] = temp1[~sym_TR]
-      temp_down[sym_TR] = temp0[sym_TR]
+      temp_up[:, ~sym_TR] = temp0[:, ~sym_TR]
+      temp_up[:, sym_TR] = temp1[:, sym_TR]
+      temp_down[:, ~sym_TR] = temp1[:, ~sym_TR]
+      temp_down[:, sym_TR] = temp0[:, sym_TR]
     else:
       temp_up = temp0
       temp_down = temp1
 
-    tmax_up.append(np.amax(np.abs(temp_up[0][None] - temp_up)))
-    tmax_down.append(np.amax(np.abs(temp_down[0][None] - temp_down)))
-    Hksp_d_up[i] = np.sum(temp_up, axis=0) / (temp_up.shape[0])
-    Hksp_d_down[i] = np.sum(temp_down, axis=0) / (temp_down.shape[0])
+    tmax_up.append(np.amax(np.abs(temp_up[:, :1] - temp_up)))
+    tmax_down.append(np.amax(np.abs(temp_down[:, :1] - temp_down)))
+    Hksp_d_up[ps] = np.sum(temp_up, axis=1) / (temp_up.shape[1])
+    Hksp_d_down[ps] = np.sum(temp_down, axis=1) / (temp_down.shape[1])
 
   # make sure of hermiticity of each H(k)
   Hksp_d_up = enforce_hermaticity(Hksp_d_up)
@@ -0,0 +1,197 @@
+#
+# PAOFLOW
+#
+# Copyright 2016-2024 - Marco BUONGIORNO NARDELLI (mbn@unt.edu)
+#
+# Reference:
+#
+# F.T. Cerasoli, A.R. Supka, A. Jayaraj, I. Siloi, M. Costa, J. Slawinska, S. Curtarolo, M. Fornari, D. Ceresoli, and M. Buongiorno Nardelli,
+# Advanced modeling of materials with PAOFLOW 2.0: New features and software design, Comp. Mat. Sci. 200, 110828 (2021).
+#
+# M. Buongiorno Nardelli, F. T. Cerasoli, M. Costa, S Curtarolo,R. De Gennaro, M. Fornari, L. Liyanage, A. Supka and H. Wang,
+# PAOFLOW: A utility to construct and operate on ab initio Hamiltonians from the Projections of electronic wavefunctions on
+# Atomic Orbital bases, including characterization of topological materials, Comp. Mat. Sci. vol. 143, 462 (2018).
+#
+# This file is distributed under the terms of the
+# GNU General Public License. See the file `License'
+# in the root directory of the present distribution,
+# or http://www.gnu.org/copyleft/gpl.txt .
+
+# Binary cache of the data parsed from DFT output.
+# A cache file holds a pickled header (key, attributes, non-array data and the
+# array index) followed by the raw array data, aligned so that every array can
+# be memory-mapped when the cache is loaded.
+
+import numpy as np
+
+CACHE_VERSION = 1
+MAGIC = b'PAOCACHE'
+ALIGN = 64
+
+
+def file_fingerprint ( fnames ):
+  '''
+  Identify the contents of a list of files
+
+  Arguments:
+      fnames (list): Paths of the files
+
+  Returns:
+      List of (basename, size, mtime_ns, sha1) tuples
+  '''
+  import hashlib
+  from os import stat
+  from os.path import basename
+
+  fprint = []
+  for fn in fnames:
+    st = stat(fn)
+    sha = hashlib.sha1()
+    with open(fn, 'rb') as f:
+      for block in iter(lambda: f.read(1<<24), b''):
+        sha.update(block)
+    fprint.append((basename(fn),st.st_size,st.st_mtime_ns,sha.hexdigest()))
+
+  return fprint
+
+
+def write_parse_cache ( fname, key, arrays, attributes ):
+  '''
+  Write arrays and attributes to a cache file. The file is written under a temporary
+  name and renamed, so concurrent readers never see a partial cache.
+
+  Arguments:
+      fname (str): Path of the cache file
+      key (object): Picklable key identifying the parsed input
+      arrays (dict): Arrays to store. Entries which are not numeric ndarrays are pickled
+      attributes (dict): Attributes to store
+
+  Returns:
+      None
+  '''
+  import pickle
+  from os import replace
+
+  index,objects,blobs = {},{},[]
+  offset = 0
+  for k,v in arrays.items():
+    if isinstance(v, np.ndarray) and not v.dtype.hasobject:
+      v = np.ascontiguousarray(v)
+      index[k] = (v.dtype.str,v.shape,offset)
+      blobs.append(v)
+      offset += -(-v.nbytes//ALIGN)*ALIGN
+    else:
+      objects[k] = v
+
+  header = pickle.dumps({'version':CACHE_VERSION, 'key':key, 'attributes':attributes, 'objects':objects, 'index':index})
+  data_start = -(-(len(MAGIC)+8+len(header))//ALIGN)*ALIGN
+
+  tmp = fname + '.tmp'
+  with open(tmp, 'wb') as f:
+    f.write(MAGIC)
+    f.write(np.uint64(len(header)).tobytes())
+    f.write(header)
+    for (_,_,off),v in zip(index.values(), blobs):
+      f.seek(data_start+off)
+      # Write in slabs to bound the temporary memory used for large arrays
+      flat = v.reshape(-1)
+      step = max(1, (1<<26)//max(1,v.itemsize))
+      for i in range(0, flat.size, step):
+        f.write(flat[i:i+step].view(np.uint8).data)
+    f.truncate(data_start+offset)
+  replace(tmp, fname)
+
+
+def load_parse_cache ( fname, key ):
+  '''
+  Load a cache file written with write_parse_cache. Arrays are memory-mapped copy-on-write,
+  so they are read from disk when first accessed and may be modified in memory.
+
+  Arguments:
+      fname (str): Path of the cache file
+      key (object): Key which must match the key stored with the cache
+
+  Returns:
+      (arrays, attributes) dictionaries, or None if the cache is missing, stale or unreadable
+  '''
+  import pickle
+  from os.path import exists
+
+  if not exists(fname):
+    return None
+
+  try:
+    with open(fname, 'rb') as f:
+      if f.read(len(MAGIC)) != MAGIC:
+        return None
+      hlen = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+      header = pickle.loads(f.read(hlen))
+  except Exception:
+    return None
+
+  if header['version'] != CACHE_VERSION or header['key'] != key:
+    return None
+
+  data_start = -(-(len(MAGIC)+8+hlen)//ALIGN)*ALIGN
+  arrays = dict(header['objects'])
+  for k,(dt,shape,off) in header['index'].items():
+    if int(np.prod(shape)) == 0:
+      arrays[k] = np.empty(shape, dtype=dt)
+    else:
+      arrays[k] = np.memmap(fname, dtype=dt, mode='c', offset=data_start+off, shape=shape)
+
+  return arrays, header['attributes']
+
+
+def cached_parse ( data_controller, cname, fnames, parse, extra=(), comm=None ):
+  '''
+  Run a parser, or restore its results from the cache when the 'parse_cache' attribute is set.
+  Whatever 'parse' adds to (or replaces in) the DataController's dictionaries is cached.
+  Only rank 0 writes the cache, and only the first rank of 'comm' reads the input files for the key.
+
+  Arguments:
+      data_controller (DataController): Data controller to populate
+      cname (str): Path of the cache file
+      fnames (list): Input files read by 'parse'. Their fingerprints key the cache
+      parse (function): Parser taking no arguments and populating data_controller
+      extra (tuple): Additional parameters which change the parsed result
+      comm (MPI.Comm): Ranks calling cached_parse together, or None if only this rank calls it
+
+  Returns:
+      None
+  '''
+  from mpi4py import MPI
+
+  arry,attr = data_controller.data_dicts()
+
+  if not attr.get('parse_cache', False):
+    parse()
+    return
+
+  rank = MPI.COMM_WORLD.Get_rank()
+
+  # Fingerprinting reads every input file, so it is done once and shared
+  if comm is None:
+    comm = MPI.COMM_SELF
+  key = (file_fingerprint(fnames), extra) if comm.Get_rank() == 0 else None
+  key = comm.bcast(key, root=0)
+
+  cached = load_parse_cache(cname, key)
+  if cached is not None:
+    arry.update(cached[0])
+    attr.update(cached[1])
+    if rank == 0 and attr['verbose']:
+      print('Parsed data loaded from %s'%cname)
+    return
+
+  arry_old,attr_old = dict(arry),dict(attr)
+  parse()
+
+  if rank == 0:
+    changed = lambda new,old: {k:v for k,v in new.items() if k not in old or old[k] is not v}
+    try:
+      write_parse_cache(cname, key, changed(arry,arry_old), changed(attr,attr_old))
+      if attr['verbose']:
+        print('Parsed data cached in %s'%cname)
+    except Exception as e:
+      print('WARNING: Could not write the parse cache %s (%s)'%(cname,e))
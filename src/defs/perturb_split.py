@@ -51,3 +51,68 @@ def perturb_split(rot_op1,rot_op2,v_k,degen,return_v_k=False):
       return(op1, op2, v_k_temp)
     else:
       return(op1, op2)
+
+
+def perturb_split_stack ( op1, op2, v_k, degen, return_v_k=False ):
+    '''
+    Batched perturb_split for a stack of k-points
+
+    Arguments:
+        op1 (ndarray): (nk,nawf,nawf) Operator whose degenerate blocks define the rotation
+        op2 (ndarray): (nk,nawf,nawf) Second operator, or None if it is the same as op1
+        v_k (ndarray): (nk,nawf,nawf) Eigenvectors of H(k)
+        degen (list): For each k-point, the arrays of degenerate band indices
+        return_v_k (bool): If True the rotated eigenvectors are also returned
+
+    Returns:
+        op1,op2 (ndarray): (nk,nawf,nawf) Operators in the rotated eigenbasis (op2 is op1 if None was given)
+        v_k (ndarray): (nk,nawf,nawf) Rotated eigenvectors, only if return_v_k is True
+    '''
+    import numpy as np
+
+    # v^dagger O v for all k-points at once
+    vH = np.conj(np.swapaxes(v_k,1,2))
+    op1 = vH @ op1 @ v_k
+    if op2 is not None:
+        op2 = vH @ op2 @ v_k
+    vH = None
+
+    if return_v_k:
+        v_k = np.copy(v_k)
+
+    rotate_degenerate(op1, ([] if op2 is None else [op2]), degen, (v_k if return_v_k else None))
+
+    op2 = op1 if op2 is None else op2
+    if return_v_k:
+        return op1, op2, v_k
+    return op1, op2
+
+
+def rotate_degenerate ( op1, ops, degen, v_k=None ):
+    '''
+    Rotate operators already projected on the eigenvectors (v^dagger O v) to the basis
+    which diagonalizes op1 in each degenerate subspace. The arrays are modified in place.
+
+    Arguments:
+        op1 (ndarray): (nk,nbnd,nbnd) Projected operator whose degenerate blocks define the rotation
+        ops (list): Further (nk,nbnd,nbnd) projected operators rotated with op1
+        degen (list): For each k-point, the arrays of degenerate band indices
+        v_k (ndarray): (nk,nawf,nbnd) Eigenvectors rotated along with the operators, or None
+
+    Returns:
+        None
+    '''
+    import numpy as np
+    from scipy import linalg as LAN
+
+    # Only the degenerate subspaces are rediagonalized. With v' = v U, where U is block diagonal,
+    # v'^dagger O v' = U^dagger (v^dagger O v) U, so all operators share one rotation
+    for ik in range(len(degen)):
+        for d in degen[ik]:
+            ll,ul = d[0],d[-1]+1
+            _,weight = LAN.eigh(op1[ik,ll:ul,ll:ul])
+            for op in [op1]+list(ops):
+                op[ik,:,ll:ul] = op[ik,:,ll:ul] @ weight
+                op[ik,ll:ul,:] = np.conj(weight.T) @ op[ik,ll:ul,:]
+            if v_k is not None:
+                v_k[ik,:,ll:ul] = v_k[ik,:,ll:ul] @ weight
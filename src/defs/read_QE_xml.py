@@ -342,6 +342,8 @@ def parse_qe_atomic_proj ( data_controller, fname ):
   '''
   Parse the atomic_proj.xml file produced by Quantum Espresso.
   Populated the DataController object with all necessay information.
+  The file is streamed with iterparse, each projection block is decoded in bulk
+  into preallocated arrays and freed once read.
 
   Arugments:
     data_controller (DataController): Data controller to populate
@@ -355,88 +357,88 @@ def parse_qe_atomic_proj ( data_controller, fname ):
   verbose = attr['verbose']
   acbn0 = attr['acbn0']
 
-  tree = ET.parse(fname)
-  root = tree.getroot()
   qe_version = attr['qe_version']
 
   Ry2eV = 13.60569193
   Efermi = attr['Efermi']
 
-  elem = root.find('HEADER')
-  if qe_version > 6.5:
-    header = elem.attrib
-    nkpnts = int(header['NUMBER_OF_K-POINTS'])
-    nspin = int(header['NUMBER_OF_SPIN_COMPONENTS'])
-    nbnds = int(header['NUMBER_OF_BANDS'])
-    nawf = int(header['NUMBER_OF_ATOMIC_WFC'])
-  else:
-    nbnds = int(elem.find('NUMBER_OF_BANDS').text)
-    nkpnts = int(elem.find('NUMBER_OF_K-POINTS').text)
-    nspin = int(elem.find('NUMBER_OF_SPIN_COMPONENTS').text)
-    nawf = int(elem.find('NUMBER_OF_ATOMIC_WFC').text)
-
-  if nspin == 4:
-    nspin = 1
-
-  wavefunctions = np.empty((nbnds,nawf,nkpnts,nspin), dtype=complex)
-  overlaps = np.empty((nawf,nbnds,nkpnts), dtype=complex) if acbn0 else None
-
-  if qe_version > 6.5:
-
-    elem = root.find('EIGENSTATES')
-    ewfc = elem.findall('PROJS')
-    for ispin in range(nspin):
-      for i in range(nkpnts):
-        ik = ispin*nkpnts + i
-        for j,proj in enumerate(ewfc[ik].findall('ATOMIC_WFC')):
-          ind = int(proj.attrib['index'])-1
-          spin = int(proj.attrib['spin'])-1
-          text = [float(v) for v in proj.text.split()]
-          for k in range(len(text)//2):
-            k2 = 2*k
-            wavefunctions[k,ind,i,ispin] = complex(text[k2],text[k2+1])
-
-    if acbn0:
-      elem = root.find('OVERLAPS')
-      for i,ovp in enumerate(elem.findall('OVPS')):
-        dim = int(ovp.attrib['dim'])
-        ispin = int(ovp.attrib['spin'])-1
-        text = ovp.text.split()
-        for j in range(len(text)//2):
-          j2 = 2*j
-          i1 = j//dim
-          i2 = j%dim
-          v1,v2 = float(text[j2]),float(text[j2+1])
-          overlaps[i1,i2,i] = complex(v1,v2)
-
-  else:
-
-    def read_wf ( kpnt, i, ispin ):
-      for j,wf in enumerate(kpnt):
-        text = wf.text.replace(',', ' ').split()
-        wft = np.array(text, dtype=float).reshape((nbnds,2))
-        wavefunctions[:,j,i,ispin] = wft[:,0] + 1j*wft[:,1]
-
-    elem = root.find('PROJECTIONS')
-    for i,kpnt in enumerate(elem):
-      if nspin == 1:
-        read_wf(kpnt, i , 0)
+  # Complex values from a block of 're im' (or legacy 're,im') pairs
+  def read_complex ( text ):
+    v = np.fromstring(text.replace(',', ' '), sep=' ')
+    return v[0::2] + 1j*v[1::2]
+
+  wavefunctions = overlaps = None
+  nbnds = nkpnts = nspin = nawf = None
+
+  # ik counts k-points (and spins, for QE > 6.5) in the projections, iovp in the overlaps
+  ik = iovp = jwf = 0
+  stack = []
+  for event,elem in ET.iterparse(fname, events=('start','end')):
+    if event == 'start':
+      stack.append(elem)
+      if len(stack) > 2 and stack[1].tag == 'PROJECTIONS' and elem.tag.startswith(('K-POINT','SPIN')):
+        jwf = 0
+      continue
+
+    stack.pop()
+    depth = len(stack)
+    tag = elem.tag
+    section = stack[1].tag if depth > 1 else None
+
+    if tag == 'HEADER':
+      if qe_version > 6.5:
+        header = elem.attrib
+        nkpnts = int(header['NUMBER_OF_K-POINTS'])
+        nspin = int(header['NUMBER_OF_SPIN_COMPONENTS'])
+        nbnds = int(header['NUMBER_OF_BANDS'])
+        nawf = int(header['NUMBER_OF_ATOMIC_WFC'])
       else:
-        for ispin in range(nspin):
-          nele = kpnt.find('SPIN.%d'%(ispin+1))
-          read_wf(nele, i, ispin)
-
-    if acbn0:
-      elem = root.find('OVERLAPS')
-      for i,kpnt in enumerate(elem):
-        for j,ovp in enumerate(kpnt):
-          ispin = int(ovp.tag.split('.')[1]) - 1
-          text = ovp.text.replace(',', ' ').split()
-          for k in range(len(text)//2):
-            k0,k1 = k//nbnds,k%nbnds
-            k2 = 2*k
-            v1,v2 = float(text[k2]),float(text[k2+1])
-            overlaps[k0,k1,i] = complex(v1,v2)
+        nbnds = int(elem.find('NUMBER_OF_BANDS').text)
+        nkpnts = int(elem.find('NUMBER_OF_K-POINTS').text)
+        nspin = int(elem.find('NUMBER_OF_SPIN_COMPONENTS').text)
+        nawf = int(elem.find('NUMBER_OF_ATOMIC_WFC').text)
+
+      if nspin == 4:
+        nspin = 1
+
+      wavefunctions = np.empty((nbnds,nawf,nkpnts,nspin), dtype=complex)
+      overlaps = np.empty((nawf,nbnds,nkpnts), dtype=complex) if acbn0 else None
+
+    elif qe_version > 6.5:
+      if tag == 'ATOMIC_WFC':
+        ind = int(elem.attrib['index'])-1
+        wfc = read_complex(elem.text)
+        wavefunctions[:wfc.size,ind,ik%nkpnts,ik//nkpnts] = wfc
+      elif tag == 'PROJS':
+        ik += 1
+      elif tag == 'OVPS':
+        if acbn0:
+          dim = int(elem.attrib['dim'])
+          ovp = read_complex(elem.text).reshape((-1,dim))
+          overlaps[:ovp.shape[0],:dim,iovp] = ovp
+        iovp += 1
+
+    elif section == 'PROJECTIONS':
+      if depth == 2:
+        # end of K-POINT.n
+        ik += 1
+      elif not tag.startswith('SPIN'):
+        ispin = int(stack[-1].tag.split('.')[1])-1 if stack[-1].tag.startswith('SPIN') else 0
+        wavefunctions[:,jwf,ik,ispin] = read_complex(elem.text)
+        jwf += 1
+
+    elif section == 'OVERLAPS':
+      if depth == 2:
+        iovp += 1
+      elif acbn0:
+        ovp = read_complex(elem.text).reshape((-1,nbnds))
+        overlaps[:ovp.shape[0],:,iovp] = ovp
+
+    # Free every block below the top level sections once it has been read
+    if depth > 1 and section != 'HEADER':
+      elem.text = None
+      if depth == 2:
+        stack[-1].remove(elem)
 
   arrys = [('U',wavefunctions)]
   if acbn0:
@@ -0,0 +1,178 @@
+#
+# PAOFLOW
+#
+# Copyright 2016-2024 - Marco BUONGIORNO NARDELLI (mbn@unt.edu)
+#
+# Reference:
+#
+# F.T. Cerasoli, A.R. Supka, A. Jayaraj, I. Siloi, M. Costa, J. Slawinska, S. Curtarolo, M. Fornari, D. Ceresoli, and M. Buongiorno Nardelli,
+# Advanced modeling of materials with PAOFLOW 2.0: New features and software design, Comp. Mat. Sci. 200, 110828 (2021).
+#
+# M. Buongiorno Nardelli, F. T. Cerasoli, M. Costa, S Curtarolo,R. De Gennaro, M. Fornari, L. Liyanage, A. Supka and H. Wang,
+# PAOFLOW: A utility to construct and operate on ab initio Hamiltonians from the Projections of electronic wavefunctions on
+# Atomic Orbital bases, including characterization of topological materials, Comp. Mat. Sci. vol. 143, 462 (2018).
+#
+# This file is distributed under the terms of the
+# GNU General Public License. See the file `License'
+# in the root directory of the present distribution,
+# or http://www.gnu.org/copyleft/gpl.txt .
+
+import numpy as np
+from collections import OrderedDict
+
+# Phase factor matrices of the most recently used (R, k-points) pairs,
+# bounded by the 'phase_cache_bytes' attribute of the caller and emptied with clear_phase_cache
+PHASE_CACHE_SIZE = 16
+_phase_cache = OrderedDict()
+
+
+def sparse_HRs ( data_controller, HR, crystal=False ):
+  '''
+  Compact list of the lattice vectors carrying the non negligible blocks of a real space
+  operator on the FFT grid (HRs, SRs or R derivatives of them). Blocks whose largest
+  element does not exceed the 'hr_thresh' attribute are dropped. With the 'hr_wigner_seitz'
+  attribute every remaining block is assigned to its shortest supercell images, each
+  weighted by one over their number.
+
+  Arguments:
+      data_controller (DataController): Data controller with 'a_vectors'
+      HR (ndarray): Operator on the R grid, (nawf,nawf,nk1,nk2,nk3,...)
+      crystal (bool): If True R is returned in crystal coordinates, otherwise in Cartesian coordinates (units of alat)
+
+  Returns:
+      (R, HRc): Lattice vectors (nRc,3) and blocks (nRc,nawf,nawf,...) including the degeneracy weights
+  '''
+  arry,attr = data_controller.data_dicts()
+
+  nawf = HR.shape[0]
+  nk = np.array(HR.shape[2:5])
+  rest = HR.shape[5:]
+  nR = int(np.prod(nk))
+
+  # Integer lattice vectors of the grid, folded as in get_R_grid_fft
+  n = np.indices(nk).reshape(3,nR).T
+  n = (n+nk//2)%nk - nk//2
+
+  HRc = np.moveaxis(np.reshape(HR, (nawf,nawf,nR)+rest), 2, 0)
+  bmax = np.max(np.abs(HRc).reshape(nR,-1), axis=1)
+  keep = np.flatnonzero(bmax > attr['hr_thresh'])
+  n,HRc = n[keep],HRc[keep]
+
+  if attr['hr_wigner_seitz']:
+    # Supercell images of each vector, and the shortest ones
+    m = np.indices((5,5,5)).reshape(3,125).T - 2
+    img = n[:,None,:] + m[None,:,:]*nk
+    dist = np.linalg.norm(img@arry['a_vectors'], axis=2)
+    ws = dist <= dist.min(axis=1)[:,None]*(1.+1.e-6)+1.e-8
+    deg = np.sum(ws, axis=1)
+    ir,im = np.nonzero(ws)
+    n = img[ir,im]
+    HRc = HRc[ir]/deg[ir].reshape((-1,)+(1,)*(HRc.ndim-1))
+
+  R = n.astype(float) if crystal else n@arry['a_vectors']
+
+  return R, np.ascontiguousarray(HRc)
+
+
+def phase_factors ( R, kq, cache_bytes=0 ):
+  '''
+  Phase factors exp(2 pi i R.k). With a positive cache_bytes the PHASE_CACHE_SIZE most recent
+  matrices are cached, up to cache_bytes in total, so that operators evaluated repeatedly on the
+  same k-points (paths, TRIM points, Berry loops, derivatives of H) compute them once.
+
+  Arguments:
+      R (ndarray): Lattice vectors (nRc,3)
+      kq (ndarray): k-points (3,nk), in the coordinates conjugate to R
+      cache_bytes (int): Size in bytes of the cache, 0 disables it
+
+  Returns:
+      Read only phase factors (nRc,nk)
+  '''
+  from hashlib import sha1
+
+  R,kq = np.ascontiguousarray(R),np.ascontiguousarray(kq)
+  key = (R.shape, kq.shape, sha1(R).digest(), sha1(kq).digest())
+
+  if key in _phase_cache:
+    _phase_cache.move_to_end(key)
+    return _phase_cache[key]
+
+  phase = np.exp(2.j*np.pi*(R@kq))
+  phase.setflags(write=False)
+
+  if phase.nbytes <= cache_bytes:
+    _phase_cache[key] = phase
+    while len(_phase_cache) > PHASE_CACHE_SIZE or sum(v.nbytes for v in _phase_cache.values()) > cache_bytes:
+      _phase_cache.popitem(last=False)
+
+  return phase
+
+
+def clear_phase_cache ( ):
+  '''
+  Release the cached phase factors
+
+  Arguments:
+      None
+
+  Returns:
+      None
+  '''
+  _phase_cache.clear()
+
+
+def phase_sum ( phase, HRc ):
+  '''
+  Fourier sum of compact real space blocks with precomputed phase factors
+
+  Arguments:
+      phase (ndarray): Phase factors (nRc,nk) from phase_factors
+      HRc (ndarray): Blocks (nRc,nawf,nawf,...) from sparse_HRs
+
+  Returns:
+      The operator at each k-point, (nawf,nawf,nk,...)
+  '''
+  nRc = HRc.shape[0]
+  Hk = phase.T @ np.reshape(HRc, (nRc,-1))
+  Hk = np.reshape(Hk, (phase.shape[1],)+HRc.shape[1:])
+
+  return np.ascontiguousarray(np.moveaxis(Hk, 0, 2))
+
+
+def sparse_Hk ( R, HRc, kq, cache_bytes=0 ):
+  '''
+  Fourier sum of a compact real space operator at arbitrary k-points,
+  evaluated for all orbitals and spins with a single matrix product
+
+  Arguments:
+      R (ndarray): Lattice vectors (nRc,3) from sparse_HRs
+      HRc (ndarray): Blocks (nRc,nawf,nawf,...) from sparse_HRs
+      kq (ndarray): k-points (3,nk), in the coordinates conjugate to R (2pi/alat for Cartesian R)
+      cache_bytes (int): Size in bytes of the phase factor cache, 0 disables it
+
+  Returns:
+      The operator at each k-point, (nawf,nawf,nk,...)
+  '''
+  return phase_sum(phase_factors(R, kq, cache_bytes), HRc)
+
+
+def sparse_HSk ( R, HRc, SRc, kq, cache_bytes=0 ):
+  '''
+  Hamiltonian and overlap at arbitrary k-points, for the generalized eigenproblem of
+  non orthogonal (acbn0) bases. H and S share the lattice vectors and phase factors.
+
+  Arguments:
+      R (ndarray): Lattice vectors (nRc,3) from sparse_HRs
+      HRc (ndarray): Hamiltonian blocks (nRc,nawf,nawf,nspin)
+      SRc (ndarray): Overlap blocks (nRc,nawf,nawf), or None for orthogonal bases
+      kq (ndarray): k-points (3,nk), in the coordinates conjugate to R
+      cache_bytes (int): Size in bytes of the phase factor cache, 0 disables it
+
+  Returns:
+      (Hk, Sk): (nawf,nawf,nk,nspin) and (nawf,nawf,nk), Sk is None if SRc is None
+  '''
+  phase = phase_factors(R, kq, cache_bytes)
+  Hk = phase_sum(phase, HRc)
+  Sk = None if SRc is None else phase_sum(phase, SRc)
+
+  return Hk, Sk
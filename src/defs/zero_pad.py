@@ -81,6 +81,52 @@ def zero_pad(aux,nk1,nk2,nk3,nfft1,nfft2,nfft3):
     return(auxp3)
 
 
+def zero_pad_stack(aux,nfft1,nfft2,nfft3):
+    '''
+    Zero pad the last three (frequency domain) axes of a stack of arrays.
+        Equivalent to calling zero_pad on every aux[n], using
+        block slicing instead of per-axis temporary copies.
+
+    Arguments:
+        aux (ndarray): unpadded frequency domain data, shape (...,nk1,nk2,nk3)
+        nfft1 (int): number of zeroes to pad axis -3 by
+        nfft2 (int): number of zeroes to pad axis -2 by
+        nfft3 (int): number of zeroes to pad axis -1 by
+
+    Returns:
+        auxp (ndarray): padded frequency domain data, shape (...,nk1+nfft1,nk2+nfft2,nk3+nfft3)
+    '''
+    def blocks(nk,nfft):
+        # (source, destination) slices of the low and high frequency halves
+        sk = int((nk+1)/2)
+        p = ((nk & 1)^1) if nfft != 0 else 0
+        return [(slice(0,sk+p),slice(0,sk+p)), (slice(sk,nk),slice(nfft+sk,nfft+nk))],sk,p
+
+    nk1,nk2,nk3 = aux.shape[-3:]
+    b1,sk1,p1 = blocks(nk1,nfft1)
+    b2,sk2,p2 = blocks(nk2,nfft2)
+    b3,sk3,p3 = blocks(nk3,nfft3)
+
+    auxp = np.zeros(aux.shape[:-3]+(nk1+nfft1,nk2+nfft2,nk3+nfft3),dtype=complex)
+    for s1,d1 in b1:
+        for s2,d2 in b2:
+            for s3,d3 in b3:
+                auxp[...,d1,d2,d3] = aux[...,s1,s2,s3]
+
+    # halve Nyquist axes
+    if p1:
+        auxp[..., sk1,:,:] /= 2
+        auxp[...,-sk1,:,:] /= 2
+    if p2:
+        auxp[...,:, sk2,:] /= 2
+        auxp[...,:,-sk2,:] /= 2
+    if p3:
+        auxp[...,:,:, sk3] /= 2
+        auxp[...,:,:,-sk3] /= 2
+
+    return(auxp)
+
+
 def zero_pad_float(aux,nk1,nk2,nk3,nfft1,nfft2,nfft3):
     """ Deprecated. Use zero_pad instead.
 